@@ -0,0 +1,218 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import (Case, Count, DecimalField, F, IntegerField, Q,
+                              Sum, Value, When)
+from django.db.models.functions import Coalesce
+
+from . import models
+
+REBUILD_BATCH_SIZE = 1000
+TOP_MENU_ITEMS = 10
+
+
+def _increment(model, key_fields, increment_fields, rows):
+    '''
+    Inserts rows of (key values..., increment values...) or, where a row
+    with the same key exists, adds the increments to it: one
+    INSERT ... ON CONFLICT DO UPDATE statement.
+    '''
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    fields = [model._meta.get_field(name) for name in key_fields
+              ] + [model._meta.get_field(name) for name in increment_fields]
+    columns = [quote(field.column) for field in fields]
+    keys = columns[:len(key_fields)]
+    placeholders = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    updates = ', '.join(f'{column} = {table}.{column} + excluded.{column}'
+                        for column in columns[len(key_fields):])
+    sql = (f'INSERT INTO {table} ({", ".join(columns)}) '
+           f'VALUES {", ".join([placeholders] * len(rows))} '
+           f'ON CONFLICT ({", ".join(keys)}) DO UPDATE SET {updates}')
+    params = [
+        field.get_db_prep_save(value, connection) for row in rows
+        for field, value in zip(fields, row)
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def record_order(order, orderitems):
+    '''
+    Adds a freshly placed order to the daily rollups. Runs in the
+    record_order_sales job after checkout (see tasks.py) with a constant
+    number of queries, incrementing the counters in the database so
+    concurrent jobs can't lose updates: one upsert per rollup table where
+    the database supports ON CONFLICT (SQLite, PostgreSQL), otherwise an
+    insert of the missing rows followed by an F() update.
+    '''
+    quantities = defaultdict(int)
+    revenues = defaultdict(Decimal)
+    for item in orderitems:
+        quantities[item.menuitem_id] += item.quantity
+        revenues[item.menuitem_id] += item.price
+    day = order.date
+    if connection.features.supports_update_conflicts_with_target:
+        _increment(models.DailySales, ['date'],
+                   ['order_count', 'item_count', 'revenue'],
+                   [(day, 1, sum(quantities.values()), order.total)])
+        _increment(models.DailyMenuItemSales, ['date', 'menuitem'],
+                   ['quantity', 'revenue'],
+                   [(day, menuitem_id, quantity, revenues[menuitem_id])
+                    for menuitem_id, quantity in quantities.items()])
+        return
+    models.DailySales.objects.bulk_create([models.DailySales(date=day)],
+                                          ignore_conflicts=True)
+    models.DailySales.objects.filter(date=day).update(
+        order_count=F('order_count') + 1,
+        item_count=F('item_count') + sum(quantities.values()),
+        revenue=F('revenue') + order.total)
+    models.DailyMenuItemSales.objects.bulk_create(
+        [
+            models.DailyMenuItemSales(date=day, menuitem_id=menuitem_id)
+            for menuitem_id in quantities
+        ],
+        ignore_conflicts=True)
+    models.DailyMenuItemSales.objects.filter(
+        date=day, menuitem_id__in=quantities).update(
+            quantity=F('quantity') + Case(
+                *[
+                    When(menuitem_id=menuitem_id, then=Value(quantity))
+                    for menuitem_id, quantity in quantities.items()
+                ],
+                output_field=IntegerField()),
+            revenue=F('revenue') + Case(
+                *[
+                    When(menuitem_id=menuitem_id, then=Value(revenue))
+                    for menuitem_id, revenue in revenues.items()
+                ],
+                output_field=DecimalField(max_digits=12, decimal_places=2)))
+
+
+def _in_range(queryset, field, from_date, to_date):
+    if from_date:
+        queryset = queryset.filter(**{f'{field}__gte': from_date})
+    if to_date:
+        queryset = queryset.filter(**{f'{field}__lte': to_date})
+    return queryset
+
+
+# order tables and their archive (see archive.py), read as one by rebuild()
+ORDER_SOURCES = ((models.Order, models.OrderItem),
+                 (models.ArchivedOrder, models.ArchivedOrderItem))
+
+
+def _grouped(querysets, keys, sums):
+    '''
+    Groups the UNION ALL of the querysets' values() rows by the `keys`
+    aliases and yields batches of (keys..., row count, sums...) rows, so
+    that days split between the order tables and the archive add up.
+    '''
+    quote = connection.ops.quote_name
+    parts = []
+    params = []
+    for queryset in querysets:
+        sql, part_params = queryset.order_by().query.sql_with_params()
+        parts.append(sql)
+        params.extend(part_params)
+    keys = ', '.join(quote(key) for key in keys)
+    sums = ''.join(f', SUM({quote(name)})' for name in sums)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT {keys}, COUNT(*){sums} '
+            f'FROM ({" UNION ALL ".join(parts)}) sources GROUP BY {keys}',
+            params)
+        while rows := cursor.fetchmany(REBUILD_BATCH_SIZE):
+            yield rows
+
+
+def rebuild(from_date=None, to_date=None):
+    '''
+    Recomputes the rollups for the given date range (everything by default)
+    from the order tables and their archive with GROUP BY queries,
+    streaming the result into the rollup tables in batches. Returns the
+    number of days rebuilt.
+    '''
+    orders = [
+        _in_range(order_model.objects.all(), 'date', from_date,
+                  to_date).values(day=F('date'), amount=F('total'))
+        for order_model, _ in ORDER_SOURCES
+    ]
+    orderitems = [
+        _in_range(item_model.objects.all(), 'order__date', from_date,
+                  to_date).values(day=F('order__date'),
+                                  item=F('menuitem_id'),
+                                  units=F('quantity'),
+                                  amount=F('price'))
+        for _, item_model in ORDER_SOURCES
+    ]
+    item_counts = {
+        day: units
+        for rows in _grouped(orderitems, ['day'], ['units'])
+        for day, _, units in rows
+    }
+    days = 0
+    with transaction.atomic():
+        _in_range(models.DailySales.objects.all(), 'date', from_date,
+                  to_date).delete()
+        _in_range(models.DailyMenuItemSales.objects.all(), 'date', from_date,
+                  to_date).delete()
+        for rows in _grouped(orders, ['day'], ['amount']):
+            models.DailySales.objects.bulk_create([
+                models.DailySales(date=day,
+                                  order_count=count,
+                                  item_count=item_counts.get(day, 0),
+                                  revenue=revenue)
+                for day, count, revenue in rows
+            ])
+            days += len(rows)
+        for rows in _grouped(orderitems, ['day', 'item'],
+                             ['units', 'amount']):
+            models.DailyMenuItemSales.objects.bulk_create([
+                models.DailyMenuItemSales(date=day,
+                                          menuitem_id=menuitem_id,
+                                          quantity=quantity,
+                                          revenue=revenue)
+                for day, menuitem_id, _, quantity, revenue in rows
+            ])
+    return days
+
+
+def sales_summary(from_date=None, to_date=None):
+    '''
+    Dashboard figures for a date range. Revenue, basket size and top menu
+    items come from the rollup tables; crew workload is a single grouped
+    count over Order.
+    '''
+    daily = _in_range(models.DailySales.objects.all(), 'date', from_date,
+                      to_date).order_by('date')
+    totals = daily.aggregate(orders=Coalesce(Sum('order_count'), 0),
+                             items=Coalesce(Sum('item_count'), 0),
+                             revenue=Coalesce(Sum('revenue'),
+                                              Value(Decimal(0))))
+    orders = totals['orders'] or 1
+    top_menu_items = _in_range(
+        models.DailyMenuItemSales.objects.all(), 'date', from_date,
+        to_date).values('menuitem_id', title=F('menuitem__title')).annotate(
+            quantity=Sum('quantity'),
+            revenue=Sum('revenue')).order_by('-quantity',
+                                             'menuitem_id')[:TOP_MENU_ITEMS]
+    workload = _in_range(
+        models.Order.objects.filter(delivery_crew__isnull=False), 'date',
+        from_date, to_date).values(
+            'delivery_crew_id',
+            username=F('delivery_crew__username')).annotate(
+                open_orders=Count('id', filter=Q(status=False)),
+                delivered_orders=Count('id', filter=Q(
+                    status=True))).order_by('-open_orders',
+                                            'delivery_crew_id')
+    return {
+        'revenue_per_day': list(daily),
+        'average_basket': {
+            'items': Decimal(totals['items']) / orders,
+            'revenue': totals['revenue'] / orders,
+        },
+        'top_menu_items': list(top_menu_items),
+        'delivery_crew_workload': list(workload),
+    }
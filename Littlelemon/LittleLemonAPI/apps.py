@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class LittlelemonapiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "LittleLemonAPI"
+
+    def ready(self):
+        from . import db, signals, tasks  # noqa: F401
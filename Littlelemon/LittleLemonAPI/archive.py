@@ -0,0 +1,45 @@
+from django.db import connection, transaction
+
+from . import models
+
+ARCHIVE_BATCH_SIZE = 1000
+
+
+def _copy(source, target, key, ids):
+    '''
+    Copies the `source` rows whose `key` column is in `ids` into `target`,
+    which has the same columns, with one INSERT ... SELECT.
+    '''
+    quote = connection.ops.quote_name
+    columns = ', '.join(
+        quote(field.column) for field in target._meta.concrete_fields)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(target._meta.db_table)} ({columns}) '
+            f'SELECT {columns} FROM {quote(source._meta.db_table)} '
+            f'WHERE {quote(key)} IN ({placeholders})', ids)
+
+
+def archive_orders(before, batch_size=ARCHIVE_BATCH_SIZE):
+    '''
+    Moves the delivered orders dated before `before`, with their items,
+    into ArchivedOrder/ArchivedOrderItem, `batch_size` orders per
+    transaction so the order tables are never locked for long. The sales
+    rollups are left as they are. Returns the number of orders moved.
+    '''
+    moved = 0
+    orders = models.Order.objects.filter(status=True, date__lt=before)
+    while True:
+        with transaction.atomic():
+            # locked, so a concurrent update can't be lost in the move
+            ids = list(
+                orders.select_for_update().order_by('id').values_list(
+                    'id', flat=True)[:batch_size])
+            if not ids:
+                return moved
+            _copy(models.Order, models.ArchivedOrder, 'id', ids)
+            _copy(models.OrderItem, models.ArchivedOrderItem, 'order_id', ids)
+            models.OrderItem.objects.filter(order_id__in=ids).delete()
+            models.Order.objects.filter(pk__in=ids).delete()
+        moved += len(ids)
@@ -0,0 +1,282 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import (APIException, AuthenticationFailed,
+                                       NotAuthenticated, NotFound,
+                                       PermissionDenied, Throttled)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import (authentication, events, menu_snapshot, models, roles, search,
+               serializers)
+from .filters import MenuItemFilter, OrderFilter
+from .throttling import ScopedRateThrottle
+from .views import order_queryset
+
+
+class AsyncReadView(View):
+    '''
+    Base for the native async (ASGI) read endpoints. Mirrors what the DRF
+    views do before a GET: token/session authentication, the permission
+    check and the default throttles, all without blocking a worker thread
+    on the database. Responses are rendered with DRF's JSONRenderer and
+    paginated in the LimitOffsetPagination format, so clients can switch
+    between /api/... and /api/async/... freely.
+    '''
+    http_method_names = ['get']
+    authentication_required = True
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            request.user = await self.authenticate(request)
+            if (self.authentication_required
+                    and not request.user.is_authenticated):
+                raise NotAuthenticated
+            await self.check_throttles(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            return self.render({'detail': exc.detail}, exc.status_code)
+
+    async def authenticate(self, request):
+        auth = request.headers.get('Authorization', '').split()
+        if not auth or auth[0].lower() != 'token':
+            return await request.auser()
+        if len(auth) != 2:
+            raise AuthenticationFailed('Invalid token header.')
+        entry = authentication.get_cached_entry(auth[1])
+        if entry is not None:
+            user = authentication.user_from_entry(entry)
+        else:
+            try:
+                token = await Token.objects.select_related('user').aget(
+                    key=auth[1])
+            except Token.DoesNotExist:
+                raise AuthenticationFailed('Invalid token.')
+            user = token.user
+            if user.is_active:
+                await sync_to_async(authentication.cache_entry)(auth[1], user)
+        if not user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+        return user
+
+    async def check_throttles(self, request):
+        for throttle_class in self.throttle_classes:
+            throttle = throttle_class()
+            if not await sync_to_async(throttle.allow_request)(request, self):
+                raise Throttled(throttle.wait())
+
+    def render(self, data, status_code=status.HTTP_200_OK):
+        return HttpResponse(JSONRenderer().render(data),
+                            status=status_code,
+                            content_type='application/json')
+
+    async def paginate(self, request, queryset, serializer_class):
+        limit = self.get_query_int(request, 'limit', api_settings.PAGE_SIZE)
+        offset = self.get_query_int(request, 'offset', 0)
+        count = await queryset.acount()
+        rows = [
+            row async for row in queryset[offset:offset +
+                                          limit].aiterator(chunk_size=limit)
+        ]
+        url = request.build_absolute_uri()
+        next_url = previous_url = None
+        if offset + limit < count:
+            next_url = replace_query_param(
+                replace_query_param(url, 'limit', limit), 'offset',
+                offset + limit)
+        if offset > 0:
+            previous_url = replace_query_param(url, 'limit', limit)
+            if offset - limit <= 0:
+                previous_url = remove_query_param(previous_url, 'offset')
+            else:
+                previous_url = replace_query_param(previous_url, 'offset',
+                                                   offset - limit)
+        return self.render({
+            'count': count,
+            'next': next_url,
+            'previous': previous_url,
+            'results': serializer_class(rows, many=True).data
+        })
+
+    @staticmethod
+    def get_query_int(request, name, default):
+        try:
+            value = int(request.GET[name])
+        except (KeyError, ValueError):
+            return default
+        if value < 0 or (value == 0 and name == 'limit'):
+            return default
+        return value
+
+
+class MenuItemsListView(AsyncReadView):
+    '''
+    endpoint: /api/async/menu-items
+    GET for all users. Async variant of views.MenuItemsListView.
+    '''
+    authentication_required = False
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'menu'
+
+    async def get(self, request):
+        items = models.MenuItem.objects.select_related('category')
+        if request.GET.get('search'):
+            # loads the typo-correction vocabulary outside the event loop
+            await sync_to_async(search.get_vocabulary)(items.db)
+        items = MenuItemFilter(Request(request)).apply(items)
+        return await self.paginate(request, items,
+                                   serializers.MenuItemSerializer)
+
+
+class MenuItemsDetailView(AsyncReadView):
+    '''
+    endpoint: /api/async/menu-items/{menuItem}
+    GET for all users. Async variant of views.MenuItemsDetailView.
+    '''
+    authentication_required = False
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'menu'
+
+    async def get(self, request, pk):
+        snapshot = await sync_to_async(menu_snapshot.get_snapshot)()
+        item = snapshot.menuitems.get(pk) if snapshot is not None else None
+        if item is None:
+            try:
+                item = await models.MenuItem.objects.select_related(
+                    'category').aget(pk=pk)
+            except models.MenuItem.DoesNotExist:
+                raise NotFound
+        return self.render(serializers.MenuItemSerializer(item).data)
+
+
+class CartListView(AsyncReadView):
+    '''
+    endpoint: /api/async/cart/menu-items
+    GET for authenticated users. Async variant of views.CartManageView.
+    '''
+
+    async def get(self, request):
+        items = models.Cart.objects.filter(user_id=request.user.id).order_by(
+            'id')
+        return await self.paginate(request, items,
+                                   serializers.CartSerializer)
+
+
+class OrderListView(AsyncReadView):
+    '''
+    endpoint: /api/async/orders
+    GET for authenticated users. Async variant of
+    views.OrderListCreateView; same visibility rules per role.
+    '''
+
+    async def get(self, request):
+        user = request.user
+        items = order_queryset()
+        if await roles.ais_manager(user):
+            pass
+        elif await roles.ais_delivery_crew(user):
+            items = items.filter(delivery_crew=user.id)
+        else:
+            items = items.filter(user=user)
+        items = OrderFilter(Request(request)).apply(items)
+        return await self.paginate(request, items,
+                                   serializers.OrderSerializer)
+
+
+class OrderDetailView(AsyncReadView):
+    '''
+    endpoint: /api/async/orders/{orderId}
+    GET for authenticated users. Async variant of views.OrderDetailView.
+    '''
+
+    async def get(self, request, pk):
+        try:
+            order = await order_queryset().aget(pk=pk)
+        except models.Order.DoesNotExist:
+            raise NotFound
+        user = request.user
+        if not (await roles.ais_manager(user) or order.user_id == user.id
+                or order.delivery_crew_id == user.id):
+            raise PermissionDenied
+        return self.render(serializers.OrderSerializer(order).data)
+
+
+class OrderEventsView(AsyncReadView):
+    '''
+    endpoint: /api/async/orders/{orderId}/events
+    GET for the order's customer, its delivery crew and managers. A
+    Server-Sent Events stream of the order's status and delivery crew: the
+    current state first, then every change made through
+    views.OrderDetailView or the dispatch endpoint. Replaces polling
+    /api/orders/{orderId}; a comment line is sent every
+    LITTLELEMON_SSE_HEARTBEAT seconds to keep proxies from closing it.
+    '''
+
+    async def get(self, request, pk):
+        try:
+            order = await models.Order.objects.aget(pk=pk)
+        except models.Order.DoesNotExist:
+            raise NotFound
+        user = request.user
+        if not (await roles.ais_manager(user) or order.user_id == user.id
+                or order.delivery_crew_id == user.id):
+            raise PermissionDenied
+        response = StreamingHttpResponse(OrderEventStream(order.id),
+                                         content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class OrderEventStream:
+    '''
+    The body of an order's event stream. Subscribes on the first read and
+    only then reads the order for the initial event, so no change can slip
+    in between. close() unsubscribes; Django calls it when the response is
+    closed, whether or not the body was ever read.
+    '''
+
+    def __init__(self, order_id):
+        self.order_id = order_id
+        self.subscription = None
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed:
+            raise StopAsyncIteration
+        if self.subscription is None:
+            self.subscription = events.get_broker().subscribe(
+                events.order_channel(self.order_id))
+            order = await models.Order.objects.filter(
+                pk=self.order_id).afirst()
+            if order is None:
+                self.close()
+                raise StopAsyncIteration
+            return self.format_event(events.order_event(order))
+        heartbeat = getattr(settings, 'LITTLELEMON_SSE_HEARTBEAT', 15)
+        try:
+            event = await self.subscription.get(heartbeat)
+        except asyncio.TimeoutError:
+            return ': keep-alive\n\n'
+        return self.format_event(event)
+
+    def close(self):
+        self.closed = True
+        if self.subscription is not None:
+            self.subscription.close()
+
+    @staticmethod
+    def format_event(event):
+        return f'event: order\ndata: {json.dumps(event)}\n\n'
@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from . import roles
+from .utils import LRUCache
+
+# the User fields kept per token; everything else is loaded on first access.
+# Model.from_db() expects them in the model's field order.
+USER_FIELDS = ('id', 'is_superuser', 'username', 'email', 'is_staff',
+               'is_active')
+
+
+def _config(name, default):
+    return getattr(settings, 'LITTLELEMON_TOKEN_CACHE', {}).get(name, default)
+
+
+local_tokens = LRUCache(maxsize=_config('MAXSIZE', 10000),
+                        ttl=_config('TIMEOUT', 30))
+
+
+def _shared_cache():
+    alias = _config('SHARED_ALIAS', None)
+    return caches[alias] if alias else None
+
+
+def _shared_key(key):
+    return f'littlelemon:token:{key}'
+
+
+def get_cached_entry(key):
+    '''
+    Returns the cached (user fields, group names) for a token key, looking
+    in the in-process LRU first and then in the shared cache, if any.
+    '''
+    entry = local_tokens.get(key)
+    if entry is None and (shared := _shared_cache()) is not None:
+        entry = shared.get(_shared_key(key))
+        if entry is not None:
+            local_tokens.set(key, entry)
+    return entry
+
+
+def cache_entry(key, user):
+    entry = (tuple(getattr(user, field) for field in USER_FIELDS),
+             roles.get_group_names(user))
+    local_tokens.set(key, entry)
+    if (shared := _shared_cache()) is not None:
+        shared.set(_shared_key(key), entry, _config('TIMEOUT', 30))
+    return entry
+
+
+def user_from_entry(entry):
+    values, group_names = entry
+    user = User.from_db(User.objects.db, USER_FIELDS, values)
+    roles.remember(user, group_names)
+    return user
+
+
+def invalidate_token(key):
+    local_tokens.delete(key)
+    if (shared := _shared_cache()) is not None:
+        shared.delete(_shared_key(key))
+
+
+def invalidate_user(user_id):
+    for key in Token.objects.filter(user_id=user_id).values_list('key',
+                                                                 flat=True):
+        invalidate_token(key)
+
+
+class CachingTokenAuthentication(TokenAuthentication):
+    '''
+    TokenAuthentication that remembers token -> (user, group names) for
+    LITTLELEMON_TOKEN_CACHE['TIMEOUT'] seconds, in an in-process LRU and
+    optionally in the shared cache named by SHARED_ALIAS. A cache hit
+    authenticates with no queries and also answers the role checks.
+
+    The user is rebuilt with only USER_FIELDS loaded; any other field is
+    fetched on first access, and save() only writes the loaded fields.
+    Entries are dropped when the token is deleted (djoser logout), when the
+    user is saved and when their group membership changes, see signals.py.
+    Other processes keep their LRU entry until it expires, so keep the
+    TIMEOUT short.
+    '''
+
+    def authenticate_credentials(self, key):
+        entry = get_cached_entry(key)
+        if entry is None:
+            user, token = super().authenticate_credentials(key)
+            cache_entry(key, user)
+            return user, token
+        user = user_from_entry(entry)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        token = Token.from_db(Token.objects.db, ('key', 'user_id'),
+                              (key, user.id))
+        token.user = user
+        return user, token
@@ -0,0 +1,411 @@
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+from itertools import cycle
+from unittest import mock
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+
+from . import analytics, models, roles
+from .async_views import AsyncReadView
+from .utils import batched
+
+# statements that only delimit transactions; SAVEPOINTs under TestCase
+# would otherwise make the counts differ from production
+TRANSACTION_STATEMENTS = ('BEGIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK',
+                          'COMMIT')
+
+
+def user_factory(prefix, count):
+    password = make_password(None)
+    for i in range(count):
+        yield User(username=f'{prefix}{i}',
+                   email=f'{prefix}{i}@example.com',
+                   password=password)
+
+
+# menu item titles are made of these, so the search index gets a
+# realistic vocabulary
+DISH_WORDS = ('grilled', 'roasted', 'spicy', 'lemon', 'garlic', 'crispy',
+              'smoked', 'chicken', 'salmon', 'pasta', 'salad', 'soup',
+              'burger', 'risotto', 'tart', 'falafel', 'halloumi', 'gyros')
+
+
+def menu_item_factory(categories, count, rng):
+    categories = cycle(categories)
+    for i in range(count):
+        words = ' '.join(rng.sample(DISH_WORDS, 2)).capitalize()
+        yield models.MenuItem(title=f'{words} {i}',
+                              price=Decimal(rng.randrange(100, 3000)) / 100,
+                              featured=i % 10 == 0,
+                              category=next(categories))
+
+
+def order_factory(customers, crew, count):
+    customers = cycle(customers)
+    crew = cycle(crew)
+    for i in range(count):
+        # a third delivered, a third out for delivery, a third unassigned
+        yield models.Order(user_id=next(customers),
+                           delivery_crew_id=next(crew) if i % 3 else None,
+                           status=i % 3 == 1,
+                           total=Decimal(0))
+
+
+def order_item_factory(orders, menuitems, per_order, rng):
+    for order in orders:
+        for menuitem in rng.sample(menuitems, per_order):
+            quantity = rng.randrange(1, 4)
+            price = menuitem.price * quantity
+            order.total += price
+            yield models.OrderItem(order=order,
+                                   menuitem=menuitem,
+                                   quantity=quantity,
+                                   unit_price=menuitem.price,
+                                   price=price)
+
+
+def seed(menu_items=500,
+         orders=100_000,
+         order_items=1_000_000,
+         customers=1000,
+         crew=20,
+         days=30,
+         batch_size=5000,
+         random_seed=0):
+    '''
+    Fills the database with generated data: users in every role, menu items
+    spread over a few categories, and orders with order_items / orders
+    items each, dated over the last `days` days. Rows are inserted with
+    bulk_create in batches and the sales rollups are rebuilt at the end.
+    Returns the objects the benchmarked requests need.
+    '''
+    rng = random.Random(random_seed)
+    manager_group, _ = Group.objects.get_or_create(name=roles.MANAGER)
+    crew_group, _ = Group.objects.get_or_create(name=roles.DELIVERY_CREW)
+    manager = User.objects.create_user('bench-manager')
+    manager.groups.add(manager_group)
+    admin = User.objects.create_user('bench-admin', is_staff=True)
+    customer_ids = [
+        user.id for batch in batched(
+            user_factory('bench-customer', customers), batch_size)
+        for user in User.objects.bulk_create(batch)
+    ]
+    crew_ids = [
+        user.id
+        for user in User.objects.bulk_create(user_factory('bench-crew', crew))
+    ]
+    crew_group.user_set.add(*crew_ids)
+    categories = models.Category.objects.bulk_create([
+        models.Category(slug=f'bench-{i}', title=f'Bench {i}')
+        for i in range(5)
+    ])
+    menuitems = [
+        item for batch in batched(
+            menu_item_factory(categories, menu_items, rng), batch_size)
+        for item in models.MenuItem.objects.bulk_create(batch)
+    ]
+    per_order = max(1, min(order_items // max(orders, 1), len(menuitems)))
+    today = timezone.now().date()
+    order_batch_size = max(1, batch_size // per_order)
+    for index, batch in enumerate(
+            batched(order_factory(customer_ids, crew_ids, orders),
+                    order_batch_size)):
+        batch = models.Order.objects.bulk_create(batch)
+        for items in batched(
+                order_item_factory(batch, menuitems, per_order, rng),
+                batch_size):
+            models.OrderItem.objects.bulk_create(items)
+        # Order.date is auto_now, so the dates are set afterwards
+        models.Order.objects.bulk_update(batch, ['total'])
+        models.Order.objects.filter(pk__in=[order.id for order in batch
+                                            ]).update(date=today - timedelta(
+                                                days=index % days))
+    analytics.rebuild()
+    return {
+        'admin': admin,
+        'manager': manager,
+        'customer': User.objects.get(pk=customer_ids[0]),
+        'crew': User.objects.get(pk=crew_ids[0]),
+        'category': categories[0],
+        'menuitems': menuitems,
+        'today': today,
+    }
+
+
+def load():
+    '''
+    Returns the same data as seed() for a database seeded earlier, or None.
+    '''
+    manager = User.objects.filter(username='bench-manager').first()
+    if manager is None:
+        return None
+    return {
+        'admin': User.objects.get(username='bench-admin'),
+        'manager': manager,
+        'customer': User.objects.get(username='bench-customer0'),
+        'crew': User.objects.get(username='bench-crew0'),
+        'category': models.Category.objects.get(slug='bench-0'),
+        'menuitems': list(models.MenuItem.objects.order_by('id')[:100]),
+        'today': timezone.now().date(),
+    }
+
+
+class Endpoint:
+    '''
+    One benchmarked request. `prepare(data)` runs before each request,
+    outside the measurement, and returns the path and request body; use it
+    for requests that consume state (checkout needs a filled cart).
+    `budget` is the most queries a warm request may run.
+    '''
+
+    def __init__(self, name, method, user, budget, path=None, body=None,
+                 prepare=None):
+        self.name = name
+        self.method = method
+        self.user = user
+        self.budget = budget
+        self.path = path
+        self.body = body
+        self.prepare = prepare
+
+    def request(self, data):
+        if self.prepare is not None:
+            return self.prepare(data)
+        return self.path.format(**data), self.body
+
+
+def fill_cart(data, size=5):
+    models.Cart.objects.bulk_create([
+        models.Cart(user=data['customer'],
+                    menuitem=menuitem,
+                    quantity=2,
+                    unit_price=menuitem.price,
+                    price=menuitem.price * 2)
+        for menuitem in data['menuitems'][:size]
+    ],
+                                    ignore_conflicts=True)
+    return '/api/orders', None
+
+
+def bulk_import(data):
+    return '/api/menu-items/bulk', [{
+        'title': f'Imported {i}',
+        'price': '4.50',
+        'category': data['category'].slug
+    } for i in range(20)]
+
+
+def new_group_member(data):
+    data['member_count'] = data.get('member_count', 0) + 1
+    return '/api/groups/delivery-crew/users', {
+        'username': f'bench-member{data["member_count"]}',
+        'email': 'member@example.com',
+        'password': 'bench-password'
+    }
+
+
+def removable_group_member(data):
+    data['removed_count'] = data.get('removed_count', 0) + 1
+    user = User.objects.create_user(f'bench-removed{data["removed_count"]}')
+    user.groups.add(Group.objects.get(name=roles.DELIVERY_CREW))
+    return f'/api/groups/delivery-crew/users/{user.pk}', None
+
+
+def unassigned_orders(data):
+    orders = models.Order.objects.bulk_create([
+        models.Order(user=data['customer'], total=Decimal('10.00'))
+        for _ in range(50)
+    ])
+    return '/api/orders/dispatch', {'orders': [order.id for order in orders]}
+
+
+def deletable_order(data):
+    order = models.Order.objects.filter(user=data['customer']).first()
+    return f'/api/orders/{order.id}', None
+
+
+def prepare_data(data):
+    data['menuitem_id'] = data['menuitems'][0].id
+    data['order_id'] = models.Order.objects.filter(
+        user=data['customer']).order_by('-id').values_list('id',
+                                                            flat=True)[0]
+    data['crew_order_id'] = models.Order.objects.filter(
+        delivery_crew=data['crew']).values_list('id', flat=True)[0]
+    return data
+
+
+ENDPOINTS = [
+    Endpoint('category', 'get', 'manager', 2, '/api/category'),
+    Endpoint('menu list', 'get', 'customer', 2, '/api/menu-items?limit=100'),
+    Endpoint('menu list (cursor)', 'get', 'customer', 2,
+             '/api/menu-items?pagination=cursor&ordering=price&limit=100'),
+    Endpoint('menu search', 'get', 'customer', 2,
+             '/api/menu-items?search=chicken%20lem&limit=100'),
+    Endpoint('menu search (typo)', 'get', 'customer', 2,
+             '/api/menu-items?search=chiken&limit=100'),
+    # the item and its category: with the default per-process cache the
+    # menu response cache and snapshot are off (see caching.py)
+    Endpoint('menu detail', 'get', 'customer', 2,
+             '/api/menu-items/{menuitem_id}'),
+    Endpoint('menu bulk import', 'post', 'manager', 3,
+             prepare=bulk_import),
+    Endpoint('group members', 'get', 'manager', 4,
+             '/api/groups/delivery-crew/users'),
+    Endpoint('add group member', 'post', 'manager', 8,
+             prepare=new_group_member),
+    # deletes the user, cascading to their live and archived orders
+    Endpoint('remove group member', 'delete', 'manager', 13,
+             prepare=removable_group_member),
+    Endpoint('cart', 'get', 'customer', 1, '/api/cart/menu-items'),
+    Endpoint('add to cart', 'post', 'customer', 2, '/api/cart/menu-items', {
+        'menuitem_id': '{menuitem_id}',
+        'quantity': 1
+    }),
+    Endpoint('cart summary', 'get', 'customer', 1, '/api/cart/summary'),
+    Endpoint('clear cart', 'delete', 'customer', 1, '/api/cart/menu-items'),
+    Endpoint('order list', 'get', 'manager', 4, '/api/orders?limit=10'),
+    Endpoint('order list (large page)', 'get', 'manager', 4,
+             '/api/orders?limit=500'),
+    Endpoint('order list (cursor)', 'get', 'manager', 2,
+             '/api/orders?pagination=cursor&limit=500'),
+    Endpoint('checkout', 'post', 'customer', 6, prepare=fill_cart),
+    # one query per export_chunk_size orders, plus their order items
+    Endpoint('order export', 'get', 'manager', 5,
+             '/api/orders/export?from_date={today}'),
+    Endpoint('dispatch', 'post', 'manager', 3, prepare=unassigned_orders),
+    Endpoint('crew queue', 'get', 'crew', 3, '/api/orders/queue'),
+    Endpoint('analytics', 'get', 'manager', 4, '/api/analytics'),
+    Endpoint('profiling stats', 'get', 'admin', 0, '/api/profiling'),
+    Endpoint('order detail', 'get', 'customer', 2, '/api/orders/{order_id}'),
+    Endpoint('order status update', 'patch', 'crew', 4,
+             '/api/orders/{crew_order_id}', {'status': 1}),
+    # the items are deleted before the order, then again by the cascade
+    Endpoint('order delete', 'delete', 'manager', 5, prepare=deletable_order),
+    Endpoint('async menu list', 'get', 'customer', 2,
+             '/api/async/menu-items?limit=100'),
+    Endpoint('async menu detail', 'get', 'customer', 1,
+             '/api/async/menu-items/{menuitem_id}'),
+    Endpoint('async cart', 'get', 'customer', 2,
+             '/api/async/cart/menu-items'),
+    Endpoint('async order list', 'get', 'manager', 3,
+             '/api/async/orders?limit=500'),
+    Endpoint('async order detail', 'get', 'customer', 2,
+             '/api/async/orders/{order_id}'),
+]
+
+
+def counted_queries(captured):
+    return sum(1 for query in captured.captured_queries
+               if not query['sql'].upper().startswith(TRANSACTION_STATEMENTS))
+
+
+def format_body(body, data):
+    if isinstance(body, dict):
+        return {
+            key: value.format(**data) if isinstance(value, str) else value
+            for key, value in body.items()
+        }
+    return body
+
+
+def send(client, endpoint, path, body):
+    response = getattr(client, endpoint.method)(path, body, format='json')
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def measure(endpoint, data, repeat):
+    '''
+    Sends one warm-up request, `repeat` measured ones and one more under
+    tracemalloc for the peak memory, as the endpoint's user with a real
+    token. Query counts leave out transaction control statements.
+    '''
+    client = APIClient()
+    token, _ = Token.objects.get_or_create(user=data[endpoint.user])
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    latencies, query_counts, statuses = [], [], set()
+    cold_queries = peak_memory = None
+    for i in range(repeat + 2):
+        path, body = endpoint.request(data)
+        body = format_body(body, data)
+        traced = i == repeat + 1
+        if traced:
+            tracemalloc.start()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = send(client, endpoint, path, body)
+            elapsed = time.perf_counter() - started
+        if traced:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        statuses.add(response.status_code)
+        if i == 0:
+            cold_queries = counted_queries(captured)
+        elif not traced:
+            latencies.append(elapsed)
+            query_counts.append(counted_queries(captured))
+    quantiles = statistics.quantiles(latencies, n=20, method='inclusive')
+    queries = max(query_counts)
+    return {
+        'name': endpoint.name,
+        'method': endpoint.method.upper(),
+        'path': path,
+        'status': sorted(statuses),
+        'queries': queries,
+        'cold_queries': cold_queries,
+        'budget': endpoint.budget,
+        'over_budget': queries > endpoint.budget,
+        'p50_ms': round(statistics.median(latencies) * 1000, 3),
+        'p95_ms': round(quantiles[18] * 1000, 3),
+        'peak_memory_kb': round(peak_memory / 1024, 1),
+    }
+
+
+def run(data, endpoints=ENDPOINTS, repeat=20):
+    '''
+    Benchmarks the endpoints against data returned by seed(), with
+    throttling disabled. Returns one report entry per endpoint.
+    '''
+    data = prepare_data(dict(data, today=data['today'].isoformat()))
+    with mock.patch.object(APIView, 'check_throttles'), \
+            mock.patch.object(AsyncReadView, 'check_throttles'):
+        return [measure(endpoint, data, repeat) for endpoint in endpoints]
+
+
+def serializer_throughput(queryset, serializer_class, fast_serializer_class,
+                          repeat=5):
+    '''
+    Rows per second serialized by the view serializer and by its fast path
+    (see fastpath.py) over the same queryset, the best of `repeat` runs,
+    queries included.
+    '''
+    rows = queryset.count()
+    timings = {'drf': [], 'fast': []}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        serializer_class(list(queryset), many=True).data
+        timings['drf'].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        fast = fast_serializer_class()
+        fast.data(fast.rows(queryset))
+        timings['fast'].append(time.perf_counter() - started)
+    return {
+        'rows': rows,
+        **{
+            f'{name}_rows_per_s': round(rows / min(elapsed))
+            for name, elapsed in timings.items()
+        },
+    }
@@ -0,0 +1,130 @@
+import hashlib
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import routers
+
+MENU_GENERATION_KEY = 'littlelemon:menu:generation'
+MENU_MODIFIED_KEY = 'littlelemon:menu:modified'
+
+# caches that each process keeps to itself: a menu change made by another
+# worker doesn't bump the generation this process reads
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_process_local():
+    return settings.CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHES
+
+
+def menu_cache_timeout():
+    '''
+    LITTLELEMON_MENU_CACHE_TIMEOUT, or when that is None: an hour if the
+    default cache is shared between processes, otherwise 0, which turns the
+    menu response cache off. A per-process cache would keep serving, and
+    answering 304 for, the menu as it was before another worker changed it.
+    '''
+    seconds = getattr(settings, 'LITTLELEMON_MENU_CACHE_TIMEOUT', None)
+    if seconds is None:
+        seconds = 0 if is_process_local() else 60 * 60
+    return seconds
+
+
+def get_menu_generation():
+    '''
+    Returns (generation, last_modified) for the menu data. The generation
+    is part of every cached menu response key, so bumping it invalidates
+    all of them at once without having to know which keys exist.
+    '''
+    if cache.add(MENU_GENERATION_KEY, 1, None):
+        cache.set(MENU_MODIFIED_KEY, int(time.time()), None)
+    generation = cache.get(MENU_GENERATION_KEY, 1)
+    modified = cache.get(MENU_MODIFIED_KEY) or int(time.time())
+    return generation, modified
+
+
+def bump_menu_generation():
+    '''
+    Called whenever a MenuItem or Category is created, updated or deleted.
+    '''
+    try:
+        cache.incr(MENU_GENERATION_KEY)
+    except ValueError:
+        cache.add(MENU_GENERATION_KEY, 1, None)
+    cache.set(MENU_MODIFIED_KEY, int(time.time()), None)
+
+
+class MenuResponseCacheMixin:
+    '''
+    Caches the serialized GET responses of the menu views. The key is built
+    from the request path and the normalized menu_cache_params, so the same
+    filters given in a different order share an entry. Responses carry
+    ETag/Last-Modified headers and conditional requests get a 304.
+    Throttling and permissions still run first, in APIView.initial().
+    Does nothing while menu_cache_timeout() is 0.
+    '''
+    menu_cache_params = ('category', 'from_price', 'to_price', 'search',
+                         'ordering', 'limit', 'offset', 'pagination',
+                         'cursor')
+
+    def get_menu_cache_key(self, request, generation):
+        params = []
+        for name in self.menu_cache_params:
+            value = request.query_params.get(name, '').strip()
+            if name == 'ordering':
+                value = ','.join(
+                    field.strip() for field in value.split(',')
+                    if field.strip())
+            if value:
+                # quoted, as memcached keys can't contain spaces
+                params.append(f'{name}={quote(value)}')
+        return f'littlelemon:menu:{generation}:{request.path}?{"&".join(params)}'
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args,
+                                    **kwargs)
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        timeout = menu_cache_timeout()
+        if not timeout:
+            return handler(request, *args, **kwargs)
+        generation, modified = get_menu_generation()
+        key = self.get_menu_cache_key(request, generation)
+        etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+        headers = {'ETag': etag, 'Last-Modified': http_date(modified)}
+        if self.is_not_modified(request, etag, modified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED,
+                            headers=headers)
+        data = cache.get(key)
+        if data is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            if routers.read_alias.get():
+                # the replica may still lag behind the write that bumped
+                # the generation, so don't keep its answer for long
+                timeout = min(timeout, routers.pin_seconds())
+            cache.set(key, data, timeout)
+        return Response(data, headers=headers)
+
+    def is_not_modified(self, request, etag, modified):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            return etag in [
+                tag.strip() for tag in if_none_match.split(',')
+            ] or if_none_match.strip() == '*'
+        if_modified_since = parse_http_date_safe(
+            request.headers.get('If-Modified-Since', ''))
+        return if_modified_since is not None and modified <= if_modified_since
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    '''
+    Applies LITTLELEMON_SQLITE_PRAGMAS to every new SQLite connection, e.g.
+    WAL journaling so readers don't block the writer, synchronous=NORMAL
+    (safe with WAL, one fsync per checkpoint instead of per commit), a busy
+    timeout and memory-mapped reads. Other databases are left alone.
+    '''
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'LITTLELEMON_SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
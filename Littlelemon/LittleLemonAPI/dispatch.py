@@ -0,0 +1,87 @@
+import heapq
+from itertools import cycle
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Case, Count, Q, Value, When
+
+from . import events, models, roles
+
+
+def crew_members():
+    return User.objects.filter(groups__name=roles.DELIVERY_CREW,
+                               is_active=True)
+
+
+def crew_loads(crew_ids=None):
+    '''
+    Returns {crew id: open order count} for every active delivery crew
+    member, or only the given ones, in a single grouped query.
+    '''
+    crew = crew_members()
+    if crew_ids is not None:
+        crew = crew.filter(pk__in=crew_ids)
+    return dict(
+        crew.annotate(open_orders=Count(
+            'delivery_crew', filter=Q(delivery_crew__status=False))).order_by(
+                ).values_list('id', 'open_orders'))
+
+
+def least_loaded(order_ids, loads):
+    # each order goes to whoever has the fewest open orders at that point
+    heap = [(load, crew_id) for crew_id, load in loads.items()]
+    heapq.heapify(heap)
+    assignments = {}
+    for order_id in order_ids:
+        load, crew_id = heap[0]
+        assignments[order_id] = crew_id
+        heapq.heapreplace(heap, (load + 1, crew_id))
+    return assignments
+
+
+def round_robin(order_ids, loads):
+    return dict(zip(order_ids, cycle(sorted(loads))))
+
+
+STRATEGIES = {
+    'least_loaded': least_loaded,
+    'round_robin': round_robin,
+}
+
+
+def assign_orders(order_ids=None, crew_ids=None, strategy='least_loaded'):
+    '''
+    Assigns open orders without delivery crew (the given ids, or all of
+    them, oldest first) to the active delivery crew in one transaction.
+    Balancing uses the crew's open-order counts from a single aggregate,
+    and the assignments are written with a single UPDATE ... CASE, so the
+    query count doesn't grow with the number of orders or crew members.
+    Returns {order id: crew id}; orders that are missing, delivered or
+    already assigned are left alone.
+    '''
+    with transaction.atomic():
+        orders = models.Order.objects.select_for_update().filter(
+            delivery_crew__isnull=True, status=False)
+        if order_ids is not None:
+            orders = orders.filter(pk__in=order_ids)
+        order_ids = list(
+            orders.order_by('date', 'id').values_list('id', flat=True))
+        if not order_ids:
+            return {}
+        loads = crew_loads(crew_ids)
+        if not loads:
+            raise ValueError('No delivery crew available.')
+        assignments = STRATEGIES[strategy](order_ids, loads)
+        per_crew = {}
+        for order_id, crew_id in assignments.items():
+            per_crew.setdefault(crew_id, []).append(order_id)
+        models.Order.objects.filter(pk__in=assignments).update(
+            delivery_crew_id=Case(*[
+                When(pk__in=crew_order_ids, then=Value(crew_id))
+                for crew_id, crew_order_ids in per_crew.items()
+            ]))
+        for order_id, crew_id in assignments.items():
+            events.publish_order(
+                models.Order(id=order_id, status=False,
+                             delivery_crew_id=crew_id))
+    return assignments
@@ -0,0 +1,124 @@
+import asyncio
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    '''
+    One listener on a channel. Events are queued on the listener's event
+    loop; when a slow client lets the queue fill up, the oldest event is
+    dropped, since every event carries the full current state.
+    '''
+
+    def __init__(self, broker, channel, max_queue):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(max_queue)
+
+    def put(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # the listener's loop is closed
+            self.close()
+
+    def _put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InMemoryBroker:
+    '''
+    In-process pub/sub. publish() may be called from any thread (sync views
+    run in a thread pool under ASGI), subscribe() from async code. Only
+    listeners in the same process see the events; a shared broker (e.g.
+    Redis pub/sub) can be plugged in through LITTLELEMON_EVENT_BROKER by
+    implementing the same publish/subscribe/unsubscribe methods.
+    '''
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self.subscriptions = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def publish(self, channel, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, self.max_queue)
+        with self.lock:
+            self.subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscriptions[subscription.channel]
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    config = getattr(settings, 'LITTLELEMON_EVENT_BROKER', {})
+    backend = import_string(
+        config.get('BACKEND', 'LittleLemonAPI.events.InMemoryBroker'))
+    return backend(**config.get('OPTIONS', {}))
+
+
+@receiver(setting_changed)
+def reset_broker(setting, **kwargs):
+    if setting == 'LITTLELEMON_EVENT_BROKER':
+        get_broker.cache_clear()
+
+
+# new orders, for the kitchen display and the delivery crew
+KITCHEN_CHANNEL = 'kitchen'
+DELIVERY_CREW_CHANNEL = 'delivery-crew'
+
+
+def order_channel(order_id):
+    return f'order:{order_id}'
+
+
+def order_event(order):
+    return {
+        'id': order.id,
+        'status': order.status,
+        'delivery_crew': order.delivery_crew_id,
+    }
+
+
+def publish(channel, event):
+    '''
+    Publishes the event on the channel once the current transaction
+    commits.
+    '''
+    transaction.on_commit(lambda: get_broker().publish(channel, event))
+
+
+def publish_order(order):
+    '''
+    Publishes the order's status and delivery crew to its listeners once
+    the current transaction commits.
+    '''
+    publish(order_channel(order.id), order_event(order))
@@ -0,0 +1,140 @@
+from decimal import Decimal, InvalidOperation
+
+from django.utils import dateparse
+from rest_framework.exceptions import ValidationError
+
+from . import search
+
+
+def parse_decimal(value):
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValueError(value)
+
+
+def parse_date(value):
+    date = dateparse.parse_date(value)
+    if date is None:
+        raise ValueError(value)
+    return date
+
+
+def parse_bool(value):
+    if value.lower() in ('1', 'true'):
+        return True
+    if value.lower() in ('0', 'false'):
+        return False
+    raise ValueError(value)
+
+
+class ListFilter:
+    '''
+    Declarative filtering and ordering for list views.
+
+    `filters` maps a query parameter to the lookup it applies and the
+    function that parses its value. `orderings` lists the column
+    combinations clients may order by, each mapped to the index that backs
+    it; a requested ordering must be a prefix of one of them, in a single
+    direction, so the database can walk the index instead of sorting.
+    `ordering_aliases` maps public names to model fields. The primary key is
+    always appended to make the ordering total.
+    '''
+    filters = {}
+    orderings = {}
+    ordering_aliases = {}
+    default_ordering = ('id', )
+    tie_breaker = 'id'
+
+    def __init__(self, request):
+        self.request = request
+
+    def apply(self, queryset):
+        return self.filter(queryset).order_by(*self.get_ordering())
+
+    def filter(self, queryset):
+        for param, (lookup, parse) in self.filters.items():
+            value = self.request.query_params.get(param)
+            if not value:
+                continue
+            try:
+                value = parse(value)
+            except ValueError:
+                raise ValidationError({param: f'Invalid value "{value}".'})
+            queryset = queryset.filter(**{lookup: value})
+        return queryset
+
+    def get_ordering(self):
+        ordering = self.request.query_params.get('ordering', '')
+        ordering = [
+            field.strip() for field in ordering.split(',') if field.strip()
+        ]
+        if not ordering:
+            # absent, or only commas and whitespace
+            ordering = list(self.default_ordering)
+        names = [field.lstrip('-') for field in ordering]
+        if self.tie_breaker in names:
+            # nothing after the unique column can change the order
+            ordering = ordering[:names.index(self.tie_breaker) + 1]
+            names = names[:len(ordering)]
+        descending = ordering[0].startswith('-')
+        if any(field.startswith('-') != descending for field in ordering):
+            raise ValidationError(
+                {'ordering': 'All ordering fields must use one direction.'})
+        columns = tuple(name for name in names if name != self.tie_breaker)
+        if len(set(names)) != len(names) or (columns and not any(
+                allowed[:len(columns)] == columns
+                for allowed in self.orderings)):
+            raise ValidationError({
+                'ordering':
+                'Allowed orderings are: ' + '; '.join(
+                    ','.join(allowed) for allowed in self.orderings) + '.'
+            })
+        prefix = '-' if descending else ''
+        return [
+            prefix + self.ordering_aliases.get(name, name)
+            for name in columns
+        ] + [prefix + self.tie_breaker]
+
+
+class MenuItemFilter(ListFilter):
+    filters = {
+        'category': ('category__title', str),
+        'from_price': ('price__gte', parse_decimal),
+        'to_price': ('price__lte', parse_decimal),
+    }
+    orderings = {
+        ('price', ): 'menuitem_price_id_idx',
+        ('title', ): 'MenuItem.title db_index',
+        ('category', 'price'): 'menuitem_category_price_idx',
+    }
+    ordering_aliases = {'category': 'category_id'}
+
+    def filter(self, queryset):
+        queryset = super().filter(queryset)
+        text = self.request.query_params.get('search')
+        if text:
+            queryset = search.search(queryset, text)
+        return queryset
+
+    def get_ordering(self):
+        if (self.request.query_params.get('search')
+                and not self.request.query_params.get('ordering')):
+            # best matches first
+            return ['search_rank', self.tie_breaker]
+        return super().get_ordering()
+
+
+class OrderFilter(ListFilter):
+    filters = {
+        'status': ('status', parse_bool),
+        'user': ('user_id', int),
+        'delivery_crew': ('delivery_crew_id', int),
+        'from_date': ('date__gte', parse_date),
+        'to_date': ('date__lte', parse_date),
+    }
+    orderings = {
+        ('date', ): 'order_date_id_idx',
+        ('status', ): 'Order.status db_index',
+    }
+    default_ordering = ('-date', )
@@ -0,0 +1,149 @@
+import hashlib
+import json
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .utils import LRUCache
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class LocalIdempotencyStore:
+    '''
+    Keeps the responses in this process, at most `max_entries` of them for
+    `timeout` seconds each; the least recently used go first. Retries that
+    reach another worker run again, use CacheIdempotencyStore there.
+    '''
+
+    def __init__(self, max_entries=10000, timeout=600):
+        self.entries = LRUCache(maxsize=max_entries, ttl=timeout)
+
+    def add(self, key, value):
+        return self.entries.add(key, value)
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.entries.set(key, value)
+
+    def delete(self, key):
+        self.entries.delete(key)
+
+
+class CacheIdempotencyStore:
+    '''
+    Keeps the responses in a Django cache, shared by every worker when
+    `alias` points at Redis or Memcached, which evict on their own.
+    '''
+
+    def __init__(self, alias='default', timeout=600):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def add(self, key, value):
+        return self.cache.add(key, value, self.timeout)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.timeout)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+
+@lru_cache(maxsize=None)
+def get_store():
+    config = getattr(settings, 'LITTLELEMON_IDEMPOTENCY_STORE', {})
+    backend = import_string(
+        config.get('BACKEND',
+                   'LittleLemonAPI.idempotency.LocalIdempotencyStore'))
+    return backend(**config.get('OPTIONS', {}))
+
+
+@receiver(setting_changed)
+def reset_store(setting, **kwargs):
+    if setting == 'LITTLELEMON_IDEMPOTENCY_STORE':
+        get_store.cache_clear()
+
+
+def fingerprint(data):
+    return hashlib.sha256(
+        json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder).encode()
+    ).hexdigest()
+
+
+class IdempotencyMixin:
+    '''
+    Makes POST safe to retry. The first request with an Idempotency-Key
+    header runs as usual and its response is stored per user, path and
+    key; retries get it back with an Idempotent-Replayed header, without
+    running the view again or counting against the throttles. A retry with
+    a different body gets 422, one arriving while the first request is
+    still running gets 409. Errors raised by the view and 5xx responses are
+    not stored, so those requests can be retried.
+    '''
+
+    def get_idempotency_key(self, request):
+        key = request.headers.get(HEADER)
+        if request.method != 'POST' or not key:
+            return None
+        if len(key) > MAX_KEY_LENGTH:
+            raise ValidationError(
+                {HEADER: f'At most {MAX_KEY_LENGTH} characters.'})
+        return (f'littlelemon:idempotency:{request.user.pk}:{request.path}:'
+                f'{key}')
+
+    def check_throttles(self, request):
+        key = self.get_idempotency_key(request)
+        if key is None or get_store().get(key) is None:
+            super().check_throttles(request)
+
+    def post(self, request, *args, **kwargs):
+        key = self.get_idempotency_key(request)
+        if key is None:
+            return super().post(request, *args, **kwargs)
+        store = get_store()
+        entry = {'fingerprint': fingerprint(request.data), 'status': None}
+        if not store.add(key, entry):
+            return self.replay(store.get(key), entry['fingerprint'])
+        try:
+            response = super().post(request, *args, **kwargs)
+        except Exception:
+            store.delete(key)
+            raise
+        if response.status_code >= 500:
+            store.delete(key)
+        else:
+            store.set(key,
+                      dict(entry, status=response.status_code,
+                           data=response.data))
+        return response
+
+    def replay(self, entry, body_fingerprint):
+        if entry is None or entry['status'] is None:
+            return Response(
+                {'detail': f'A request with this {HEADER} is in progress.'},
+                status=status.HTTP_409_CONFLICT)
+        if entry['fingerprint'] != body_fingerprint:
+            return Response(
+                {
+                    'detail':
+                    f'This {HEADER} was used with a different request body.'
+                },
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        return Response(entry['data'],
+                        status=entry['status'],
+                        headers={'Idempotent-Replayed': 'true'})
@@ -0,0 +1,143 @@
+import random
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import models
+
+DEFAULT_MAX_ATTEMPTS = 5
+# a failed job runs again after RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+# seconds, at most RETRY_MAX_SECONDS, less up to half of that at random so
+# jobs that failed together don't all retry together
+RETRY_BASE_SECONDS = 10
+RETRY_MAX_SECONDS = 60 * 60
+
+# task name -> (function, max attempts)
+TASKS = {}
+
+
+def task(func=None, *, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    '''
+    Registers a function as a task under its name. Its keyword arguments
+    are stored as JSON. A task may run more than once (a retry after a
+    failure, or a worker dying mid-run), so it must be safe to repeat;
+    database writes are, as they commit together with the job's removal.
+    '''
+
+    def register(func):
+        TASKS[func.__name__] = (func, max_attempts)
+        return func
+
+    return register if func is None else register(func)
+
+
+def enqueue(name, **args):
+    enqueue_many([(name, args)])
+
+
+def enqueue_many(calls):
+    '''
+    Queues (task name, arguments) pairs with one INSERT. Inside a
+    transaction the jobs are written with it: workers only see them once
+    it commits, and never if it rolls back.
+    '''
+    jobs = []
+    for name, args in calls:
+        if name not in TASKS:
+            raise LookupError(f'Unknown task: {name}')
+        jobs.append(
+            models.Job(task=name, args=args, max_attempts=TASKS[name][1]))
+    models.Job.objects.bulk_create(jobs)
+
+
+def retry_delay(attempts):
+    delay = min(RETRY_BASE_SECONDS * 2**(attempts - 1), RETRY_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def claim(limit):
+    '''
+    Marks up to `limit` due jobs as running and returns them, oldest first.
+    Concurrent workers skip each other's rows on PostgreSQL (SKIP LOCKED);
+    on SQLite the IMMEDIATE transaction serializes them.
+    '''
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            models.Job.objects.select_for_update(skip_locked=True).filter(
+                status=models.Job.QUEUED,
+                run_at__lte=now).order_by('run_at', 'id')[:limit])
+        if jobs:
+            models.Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                status=models.Job.RUNNING,
+                locked_at=now,
+                attempts=F('attempts') + 1)
+    for job in jobs:
+        job.status = models.Job.RUNNING
+        job.locked_at = now
+        job.attempts += 1
+    return jobs
+
+
+def run(job):
+    '''
+    Runs a claimed job. It is deleted in the task's transaction when the
+    task succeeds; otherwise it is queued again after retry_delay(), or
+    marked failed once it has used up its attempts. Returns whether it
+    succeeded.
+    '''
+    try:
+        func, _ = TASKS[job.task]
+        with transaction.atomic():
+            func(**job.args)
+            models.Job.objects.filter(pk=job.pk).delete()
+    except Exception as error:
+        fail(job, ''.join(traceback.format_exception(error)))
+        return False
+    return True
+
+
+def fail(job, error):
+    if job.attempts < job.max_attempts:
+        job.status = models.Job.QUEUED
+        job.run_at = timezone.now() + retry_delay(job.attempts)
+    else:
+        job.status = models.Job.FAILED
+    job.locked_at = None
+    job.last_error = error
+    models.Job.objects.filter(pk=job.pk).update(status=job.status,
+                                                 run_at=job.run_at,
+                                                 locked_at=None,
+                                                 last_error=error)
+
+
+def requeue_stale(seconds):
+    '''
+    Queues again the jobs marked running more than `seconds` ago, left by
+    a worker that died; those out of attempts are marked failed.
+    '''
+    stale = models.Job.objects.filter(
+        status=models.Job.RUNNING,
+        locked_at__lt=timezone.now() - timedelta(seconds=seconds))
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=models.Job.FAILED,
+        locked_at=None,
+        last_error='The worker running this job stopped.')
+    return failed + stale.filter(attempts__lt=F('max_attempts')).update(
+        status=models.Job.QUEUED, locked_at=None)
+
+
+def run_pending():
+    '''
+    Runs the due jobs in this thread until none are left, retries that are
+    not due yet excepted. Returns the number of jobs run and failed.
+    '''
+    ran = failed = 0
+    while jobs := claim(100):
+        for job in jobs:
+            ran += 1
+            failed += not run(job)
+    return ran, failed
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from LittleLemonAPI import archive
+from LittleLemonAPI.filters import parse_date
+
+
+class Command(BaseCommand):
+    help = ('Moves delivered orders dated before --before, with their order '
+            'items, into the archive tables in batches. Archived orders are '
+            'listed by /api/orders?include_archived=1.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', required=True, help='YYYY-MM-DD')
+        parser.add_argument('--batch-size',
+                            type=int,
+                            default=archive.ARCHIVE_BATCH_SIZE,
+                            help='orders moved per transaction')
+
+    def handle(self, *args, **options):
+        try:
+            before = parse_date(options['before'])
+        except ValueError:
+            raise CommandError(f'Invalid date: {options["before"]}')
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive.')
+        moved = archive.archive_orders(before, options['batch_size'])
+        self.stdout.write(f'Archived {moved} order(s).')
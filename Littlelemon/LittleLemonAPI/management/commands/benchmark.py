@@ -0,0 +1,83 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+
+from LittleLemonAPI import (benchmark, fastpath, models, serializers,
+                            views)
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway test database with generated data and sends '
+            'every API endpoint through the test client, recording the '
+            'query count, p50/p95 latency and peak memory of each. Writes '
+            'a JSON report and fails when an endpoint runs more queries '
+            'than its budget in LittleLemonAPI/benchmark.py. Also reports '
+            'the rows/s of the list serializers and their fast paths.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--menu-items', type=int, default=500)
+        parser.add_argument('--orders', type=int, default=100_000)
+        parser.add_argument('--order-items', type=int, default=1_000_000)
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--keepdb',
+                            action='store_true',
+                            help='reuse the seeded test database')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 2:
+            raise CommandError('--repeat must be at least 2')
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0,
+                                           autoclobber=True,
+                                           keepdb=options['keepdb'])
+        try:
+            data = options['keepdb'] and benchmark.load()
+            if not data:
+                self.stdout.write('Seeding the test database...')
+                data = benchmark.seed(menu_items=options['menu_items'],
+                                      orders=options['orders'],
+                                      order_items=options['order_items'],
+                                      customers=options['customers'])
+            # the test client always sends Host: testserver
+            with override_settings(
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                report = benchmark.run(data, repeat=options['repeat'])
+            throughput = self.serializer_throughput()
+        finally:
+            if not options['keepdb']:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+        for entry in report:
+            self.stdout.write(
+                f'{entry["name"]:26} {entry["queries"]:4}/{entry["budget"]:<4}'
+                f' queries  p50 {entry["p50_ms"]:8.2f} ms  '
+                f'p95 {entry["p95_ms"]:8.2f} ms  '
+                f'{entry["peak_memory_kb"]:9.1f} KiB  status {entry["status"]}')
+        for name, entry in throughput:
+            self.stdout.write(
+                f'{name:26} {entry["rows"]:5} rows  '
+                f'DRF {entry["drf_rows_per_s"]:9} rows/s  '
+                f'fast path {entry["fast_rows_per_s"]:9} rows/s')
+        over = [entry['name'] for entry in report if entry['over_budget']]
+        if over:
+            raise CommandError('Over query budget: ' + ', '.join(over))
+        self.stdout.write(f'Report written to {options["output"]}')
+
+    def serializer_throughput(self):
+        return [
+            ('menu item serializer',
+             benchmark.serializer_throughput(
+                 models.MenuItem.objects.select_related('category')[:1000],
+                 serializers.MenuItemSerializer,
+                 fastpath.MenuItemListSerializer)),
+            ('order serializer',
+             benchmark.serializer_throughput(
+                 views.order_queryset().order_by('-date', '-id')[:1000],
+                 serializers.OrderSerializer, fastpath.OrderListSerializer)),
+        ]
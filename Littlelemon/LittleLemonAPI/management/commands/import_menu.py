@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from LittleLemonAPI import menu_import
+
+
+class Command(BaseCommand):
+    help = ('Upserts menu items matched by title from a CSV or NDJSON file, '
+            'streaming it in batches. A .json file holding one list is '
+            'also accepted but is loaded into memory as a whole.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson', 'json'])
+        parser.add_argument('--batch-size',
+                            type=int,
+                            default=menu_import.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if file_format == 'jsonl':
+            file_format = 'ndjson'
+        if file_format not in ('csv', 'ndjson', 'json'):
+            raise CommandError('Unknown file format, use --format')
+        try:
+            with open(path, encoding='utf-8', newline='') as stream:
+                if file_format == 'csv':
+                    rows = menu_import.csv_rows(stream)
+                elif file_format == 'ndjson':
+                    rows = menu_import.ndjson_rows(stream)
+                else:
+                    rows = json.load(stream)
+                result = menu_import.import_menu(
+                    rows, batch_size=options['batch_size'])
+        except (OSError, ValueError) as exc:
+            raise CommandError(exc)
+        self.stdout.write(f'Created {result["created"]}, updated '
+                          f'{result["updated"]}, '
+                          f'{len(result["errors"])} row(s) with errors.')
+        for error in result['errors']:
+            self.stderr.write(f'row {error["row"]}: {error["errors"]}')
@@ -0,0 +1,83 @@
+import asyncio
+import statistics
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.views import APIView
+
+from LittleLemonAPI.async_views import AsyncReadView
+
+
+class Command(BaseCommand):
+    help = ('Compares the throughput of the sync DRF read endpoints with '
+            'their /api/async/ variants. Requests go through the ASGI '
+            'handler in-process against the configured database, with the '
+            'same number of concurrent clients for both. Throttling is '
+            'disabled for the run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths',
+                            nargs='*',
+                            default=['menu-items'],
+                            help='endpoint paths below /api/, e.g. '
+                            'menu-items orders cart/menu-items')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--username',
+                            help='authenticate as this user with a token')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 2:
+            raise CommandError('--requests must be at least 2')
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1')
+        headers = {}
+        if options['username']:
+            try:
+                user = User.objects.get(username=options['username'])
+            except User.DoesNotExist:
+                raise CommandError(f'No user named {options["username"]}')
+            token, _ = Token.objects.get_or_create(user=user)
+            headers['Authorization'] = f'Token {token.key}'
+        # the test client always sends Host: testserver
+        with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), \
+                mock.patch.object(APIView, 'check_throttles'), \
+                mock.patch.object(AsyncReadView, 'check_throttles'):
+            for path in options['paths']:
+                for url in (f'/api/{path}', f'/api/async/{path}'):
+                    self.report(
+                        url,
+                        *asyncio.run(
+                            self.run(url, headers, options['requests'],
+                                     options['concurrency'])))
+
+    async def run(self, url, headers, requests, concurrency):
+        client = AsyncClient(headers=headers)
+        latencies = []
+        statuses = set()
+        pending = iter(range(requests))
+
+        async def worker():
+            for _ in pending:
+                started = time.perf_counter()
+                response = await client.get(url)
+                latencies.append(time.perf_counter() - started)
+                statuses.add(response.status_code)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started, latencies, statuses
+
+    def report(self, url, elapsed, latencies, statuses):
+        quantiles = statistics.quantiles(latencies, n=20)
+        self.stdout.write(
+            f'{url:32} {len(latencies) / elapsed:8.1f} req/s  '
+            f'p50 {statistics.median(latencies) * 1000:7.2f} ms  '
+            f'p95 {quantiles[18] * 1000:7.2f} ms  '
+            f'status {sorted(statuses)}')
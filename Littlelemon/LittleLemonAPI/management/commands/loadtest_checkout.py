@@ -0,0 +1,144 @@
+import logging
+import statistics
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+
+from LittleLemonAPI import models
+
+# SQLite's own defaults, for comparison with LITTLELEMON_SQLITE_PRAGMAS
+BASELINE_PRAGMAS = {
+    'journal_mode': 'delete',
+    'synchronous': 'full',
+    'busy_timeout': 5000,
+    'mmap_size': 0,
+}
+
+
+class Command(BaseCommand):
+    help = ('Measures checkout throughput with concurrent clients on a '
+            'scratch SQLite database file: each thread fills a cart and '
+            'POSTs /api/orders in a loop. Runs once with SQLite defaults '
+            '(rollback journal, synchronous=FULL, deferred transactions) '
+            'and once with the configured database profile.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--checkouts',
+                            type=int,
+                            default=50,
+                            help='checkouts per thread')
+        parser.add_argument('--cart-size', type=int, default=3)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The checkout load test needs SQLite.')
+        with tempfile.TemporaryDirectory() as directory:
+            connection.settings_dict['TEST']['NAME'] = (
+                f'{directory}/loadtest.sqlite3')
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                menuitems = self.seed(options['cart_size'])
+                # failed checkouts are counted, not logged
+                logging.disable(logging.ERROR)
+                # the test client always sends Host: testserver
+                with override_settings(ALLOWED_HOSTS=[
+                        *settings.ALLOWED_HOSTS, 'testserver'
+                ]), mock.patch.object(APIView, 'check_throttles'):
+                    for label, pragmas, transaction_mode in (
+                        ('sqlite defaults', BASELINE_PRAGMAS, None),
+                        ('configured profile',
+                         settings.LITTLELEMON_SQLITE_PRAGMAS,
+                         connection.settings_dict['OPTIONS'].get(
+                             'transaction_mode')),
+                    ):
+                        self.report(
+                            label,
+                            *self.run(menuitems, pragmas, transaction_mode,
+                                      options['threads'],
+                                      options['checkouts']))
+            finally:
+                logging.disable(logging.NOTSET)
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, cart_size):
+        category = models.Category.objects.create(slug='loadtest',
+                                                  title='Load test')
+        return models.MenuItem.objects.bulk_create([
+            models.MenuItem(title=f'Load test {i}',
+                            price=Decimal('3.50'),
+                            featured=False,
+                            category=category) for i in range(cart_size)
+        ])
+
+    def run(self, menuitems, pragmas, transaction_mode, threads, checkouts):
+        users = [
+            User.objects.create_user(f'loadtest-{pragmas["journal_mode"]}-{i}')
+            for i in range(threads)
+        ]
+        results = []
+        barrier = threading.Barrier(threads + 1)
+
+        def worker(user):
+            try:
+                connection.ensure_connection()
+                connection.transaction_mode = transaction_mode
+                client = APIClient()
+                client.force_authenticate(user)
+            finally:
+                barrier.wait()
+            try:
+                for _ in range(checkouts):
+                    started = time.perf_counter()
+                    try:
+                        for menuitem in menuitems:
+                            client.post('/api/cart/menu-items', {
+                                'menuitem_id': menuitem.id,
+                                'quantity': 1
+                            })
+                        status = client.post('/api/orders').status_code
+                    except Exception:
+                        # e.g. "database is locked" once the busy timeout ran out
+                        status = 'error'
+                    results.append((status, time.perf_counter() - started))
+            finally:
+                connection.close()
+
+        with override_settings(LITTLELEMON_SQLITE_PRAGMAS=pragmas):
+            # reconnect so the journal mode is switched before the workers
+            # open their own connections
+            connection.close()
+            connection.ensure_connection()
+            workers = [
+                threading.Thread(target=worker, args=(user, ))
+                for user in users
+            ]
+            for thread in workers:
+                thread.start()
+            barrier.wait()
+            started = time.perf_counter()
+            for thread in workers:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        return elapsed, results
+
+    def report(self, label, elapsed, results):
+        created = [latency for status, latency in results if status == 201]
+        failed = len(results) - len(created)
+        p95 = (statistics.quantiles(created, n=20)[18]
+               if len(created) > 1 else 0)
+        self.stdout.write(
+            f'{label:20} {len(created) / elapsed:8.1f} checkouts/s  '
+            f'p50 {statistics.median(created or [0]) * 1000:8.2f} ms  '
+            f'p95 {p95 * 1000:8.2f} ms  failed {failed}')
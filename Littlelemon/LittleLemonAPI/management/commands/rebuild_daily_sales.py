@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from LittleLemonAPI import analytics
+from LittleLemonAPI.filters import parse_date
+
+
+class Command(BaseCommand):
+    help = ('Recomputes the DailySales/DailyMenuItemSales rollups from the '
+            'order tables, for all dates or the given range.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from-date', help='YYYY-MM-DD')
+        parser.add_argument('--to-date', help='YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        dates = {}
+        for name in ('from_date', 'to_date'):
+            if options[name]:
+                try:
+                    dates[name] = parse_date(options[name])
+                except ValueError:
+                    raise CommandError(f'Invalid date: {options[name]}')
+        days = analytics.rebuild(**dates)
+        self.stdout.write(f'Rebuilt sales rollups for {days} day(s).')
@@ -0,0 +1,76 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from LittleLemonAPI import jobs
+
+
+class Command(BaseCommand):
+    help = ('Runs the queued background jobs (receipts, kitchen tickets, '
+            'sales rollups, ...) on a thread pool, polling the job table '
+            'for new ones. Failed jobs are retried with exponential backoff.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--poll-interval',
+                            type=float,
+                            default=1.0,
+                            help='seconds between polls while idle')
+        parser.add_argument('--stale-after',
+                            type=int,
+                            default=600,
+                            help='seconds after which a running job is '
+                            'taken to be abandoned by a dead worker')
+        parser.add_argument('--once',
+                            action='store_true',
+                            help='exit once no job is due')
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        poll_interval = options['poll_interval']
+        stale_after = options['stale_after']
+        ran = failed = 0
+        running = set()
+        requeued_at = 0
+        with ThreadPoolExecutor(threads,
+                                thread_name_prefix='run_worker') as pool:
+            try:
+                while True:
+                    if time.monotonic() - requeued_at > stale_after / 2:
+                        jobs.requeue_stale(stale_after)
+                        requeued_at = time.monotonic()
+                    # only claim what the pool can start right away, the
+                    # rest is left to the other workers
+                    free = threads - len(running)
+                    claimed = jobs.claim(free) if free else []
+                    running |= {pool.submit(self.run, job) for job in claimed}
+                    if not running:
+                        if options['once']:
+                            break
+                        time.sleep(poll_interval)
+                        continue
+                    done, running = wait(running,
+                                         timeout=poll_interval,
+                                         return_when=FIRST_COMPLETED)
+                    for future in done:
+                        ran += 1
+                        failed += not future.result()
+            except KeyboardInterrupt:
+                # the pool finishes the jobs already started
+                pass
+        self.stdout.write(f'Ran {ran} job(s), {failed} failed.')
+
+    def run(self, job):
+        # each pool thread keeps its own connection, reused for
+        # CONN_MAX_AGE like a request's
+        close_old_connections()
+        try:
+            result = jobs.run(job)
+        finally:
+            close_old_connections()
+        if not result:
+            self.stderr.write(f'Job {job.pk} ({job.task}) failed, attempt '
+                              f'{job.attempts} of {job.max_attempts}.')
+        return result
@@ -0,0 +1,101 @@
+import csv
+import json
+
+from django.db import transaction
+from django.db.models import Q
+
+from . import caching, models, serializers
+from .utils import batched
+
+BATCH_SIZE = 500
+
+
+def csv_rows(stream):
+    '''
+    Reads menu rows from a text stream of CSV one line at a time. Empty
+    cells are dropped so optional columns can be left blank.
+    '''
+    for row in csv.DictReader(stream):
+        yield {
+            key: value
+            for key, value in row.items() if value not in ('', None)
+        }
+
+
+def ndjson_rows(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def import_menu(rows, batch_size=BATCH_SIZE):
+    '''
+    Upserts menu items matched by title. `rows` can be any iterable of
+    dicts and is consumed one batch at a time, so large files are never
+    held in memory. Each batch resolves its categories and existing items
+    with one query each and is written with bulk_create/bulk_update; the
+    whole import runs in one transaction. Invalid rows are skipped and
+    reported with their 1-based row number.
+    '''
+    result = {'created': 0, 'updated': 0, 'errors': []}
+    with transaction.atomic():
+        for batch in batched(enumerate(rows, start=1), batch_size):
+            _import_batch(batch, result)
+    if result['created'] or result['updated']:
+        # bulk writes don't send post_save, so invalidate by hand
+        caching.bump_menu_generation()
+    return result
+
+
+def _import_batch(batch, result):
+    valid = []
+    for number, row in batch:
+        serializer = serializers.MenuImportRowSerializer(data=row)
+        if serializer.is_valid():
+            valid.append((number, serializer.validated_data))
+        else:
+            result['errors'].append({
+                'row': number,
+                'errors': serializer.errors
+            })
+    slugs = {data['category'] for _, data in valid if 'category' in data}
+    ids = {data['category_id'] for _, data in valid if 'category_id' in data}
+    category_ids = set()
+    slug_ids = {}
+    for category_id, slug in models.Category.objects.filter(
+            Q(slug__in=slugs) | Q(id__in=ids)).values_list('id', 'slug'):
+        category_ids.add(category_id)
+        slug_ids[slug] = category_id
+    existing = {}
+    # the oldest item wins when a title is duplicated
+    for item in models.MenuItem.objects.filter(
+            title__in={data['title'] for _, data in valid}).order_by('-id'):
+        existing[item.title] = item
+    to_create, to_update = {}, {}
+    for number, data in valid:
+        if 'category' in data:
+            category_id = slug_ids.get(data['category'])
+        else:
+            category_id = data['category_id']
+        if category_id not in category_ids:
+            result['errors'].append({
+                'row': number,
+                'errors': {'category': ['Unknown category.']}
+            })
+            continue
+        title = data['title']
+        item = existing.get(title) or to_create.get(title)
+        if item is None:
+            item = to_create[title] = models.MenuItem(title=title,
+                                                      featured=False)
+        elif title in existing:
+            to_update[title] = item
+        item.price = data['price']
+        if 'featured' in data:
+            item.featured = data['featured']
+        item.category_id = category_id
+    models.MenuItem.objects.bulk_create(to_create.values())
+    models.MenuItem.objects.bulk_update(to_update.values(),
+                                        ['price', 'featured', 'category'])
+    result['created'] += len(to_create)
+    result['updated'] += len(to_update)
@@ -0,0 +1,123 @@
+import threading
+import time
+from types import MappingProxyType
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from . import caching, models
+
+
+class Entry:
+    '''
+    A read-only row. Entries are shared by every thread reading the same
+    snapshot, so they can't be changed once built.
+    '''
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values, strict=True):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is read-only.')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} is read-only.')
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {self.id}>'
+
+
+class CategoryEntry(Entry):
+    __slots__ = ('id', 'slug', 'title')
+
+
+class MenuItemEntry(Entry):
+    '''
+    Has the attributes MenuItemSerializer reads, so it can serialize one
+    in place of a MenuItem.
+    '''
+    __slots__ = ('id', 'title', 'price', 'featured', 'category_id',
+                 'category')
+
+
+class MenuSnapshot:
+    '''
+    Every category and menu item, keyed by id, as of one menu generation
+    (see caching.py). Never changed once loaded: a newer generation gets a
+    new snapshot, so a reader holding one sees a consistent menu.
+    '''
+    __slots__ = ('generation', 'loaded_at', 'categories', 'menuitems')
+
+    def __init__(self, generation, categories, menuitems):
+        self.generation = generation
+        self.loaded_at = time.monotonic()
+        self.categories = MappingProxyType(categories)
+        self.menuitems = MappingProxyType(menuitems)
+
+    @classmethod
+    def load(cls, generation):
+        # from the primary: a lagging replica's menu would be kept until
+        # the next change
+        categories = {
+            row[0]: CategoryEntry(*row)
+            for row in models.Category.objects.using(
+                DEFAULT_DB_ALIAS).values_list('id', 'slug', 'title')
+        }
+        menuitems = {
+            row[0]: MenuItemEntry(*row, categories.get(row[4]))
+            for row in models.MenuItem.objects.using(
+                DEFAULT_DB_ALIAS).values_list('id', 'title', 'price',
+                                              'featured', 'category_id')
+        }
+        return cls(generation, categories, menuitems)
+
+    def is_current(self, generation, max_age):
+        return (self.generation == generation
+                and time.monotonic() - self.loaded_at < max_age)
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def max_age():
+    '''
+    LITTLELEMON_MENU_SNAPSHOT_MAX_AGE, or when that is None: 60 seconds if
+    the default cache is shared between processes, otherwise 0, as the
+    generation then can't tell this process about another one's changes.
+    '''
+    seconds = getattr(settings, 'LITTLELEMON_MENU_SNAPSHOT_MAX_AGE', None)
+    if seconds is None:
+        seconds = 0 if caching.is_process_local() else 60
+    return seconds
+
+
+def get_snapshot():
+    '''
+    The menu snapshot of this process, loaded on first use (two queries)
+    and replaced when the menu generation changes or it is older than
+    max_age() seconds. Returns None when max_age() is 0: the callers then
+    read the database.
+    '''
+    global _snapshot
+    seconds = max_age()
+    if not seconds:
+        return None
+    # with the last-modified time, so a counter that restarted after a
+    # cache eviction isn't taken for the one the snapshot was loaded at
+    generation = caching.get_menu_generation()
+    snapshot = _snapshot
+    if snapshot is None or not snapshot.is_current(generation, seconds):
+        with _lock:
+            snapshot = _snapshot
+            if snapshot is None or not snapshot.is_current(
+                    generation, seconds):
+                snapshot = _snapshot = MenuSnapshot.load(generation)
+    return snapshot
+
+
+def clear():
+    global _snapshot
+    _snapshot = None
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("LittleLemonAPI", "0005_rename__price_cart_price"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="order",
+            name="date",
+            field=models.DateField(auto_now=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name="menuitem",
+            index=models.Index(fields=["price", "id"], name="menuitem_price_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["date", "id"], name="order_date_id_idx"),
+        ),
+    ]
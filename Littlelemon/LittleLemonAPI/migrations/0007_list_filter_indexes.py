@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("LittleLemonAPI", "0006_keyset_pagination_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="menuitem",
+            index=models.Index(fields=["category", "price"], name="menuitem_category_price_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["status", "delivery_crew", "date"], name="order_status_crew_date_idx"),
+        ),
+    ]
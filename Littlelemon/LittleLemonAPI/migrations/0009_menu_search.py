@@ -0,0 +1,177 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The search index and the triggers that keep it in sync with menu items
+# and category titles; see LittleLemonAPI/search.py for how it is queried.
+# On SQLite, a later migration that makes Django rebuild the menuitem or
+# category table drops these triggers with it and has to re-create them.
+INDEX_SQL = {
+    "sqlite": [
+        """
+        CREATE VIRTUAL TABLE littlelemonapi_menuitem_search USING fts5(
+            title, category,
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')
+        """,
+        # distinct indexed terms, the vocabulary for typo correction
+        """
+        CREATE VIRTUAL TABLE littlelemonapi_menuitem_search_vocab
+        USING fts5vocab(littlelemonapi_menuitem_search, row)
+        """,
+        # title matches weigh ten times as much as category matches
+        """
+        INSERT INTO littlelemonapi_menuitem_search(littlelemonapi_menuitem_search, rank)
+        VALUES ('rank', 'bm25(10.0, 1.0)')
+        """,
+        """
+        INSERT INTO littlelemonapi_menuitem_search(rowid, title, category)
+        SELECT m.id, m.title, c.title
+        FROM "LittleLemonAPI_menuitem" m
+        JOIN "LittleLemonAPI_category" c ON c.id = m.category_id
+        """,
+        """
+        CREATE TRIGGER littlelemonapi_menuitem_search_insert
+        AFTER INSERT ON "LittleLemonAPI_menuitem" BEGIN
+            INSERT INTO littlelemonapi_menuitem_search(rowid, title, category)
+            VALUES (new.id, new.title, (SELECT title FROM "LittleLemonAPI_category"
+                                        WHERE id = new.category_id));
+        END
+        """,
+        """
+        CREATE TRIGGER littlelemonapi_menuitem_search_update
+        AFTER UPDATE OF id, title, category_id ON "LittleLemonAPI_menuitem" BEGIN
+            DELETE FROM littlelemonapi_menuitem_search WHERE rowid = old.id;
+            INSERT INTO littlelemonapi_menuitem_search(rowid, title, category)
+            VALUES (new.id, new.title, (SELECT title FROM "LittleLemonAPI_category"
+                                        WHERE id = new.category_id));
+        END
+        """,
+        """
+        CREATE TRIGGER littlelemonapi_menuitem_search_delete
+        AFTER DELETE ON "LittleLemonAPI_menuitem" BEGIN
+            DELETE FROM littlelemonapi_menuitem_search WHERE rowid = old.id;
+        END
+        """,
+        """
+        CREATE TRIGGER littlelemonapi_category_search_update
+        AFTER UPDATE OF title ON "LittleLemonAPI_category" BEGIN
+            UPDATE littlelemonapi_menuitem_search SET category = new.title
+            WHERE rowid IN (SELECT id FROM "LittleLemonAPI_menuitem"
+                            WHERE category_id = new.id);
+        END
+        """,
+    ],
+    "postgresql": [
+        # no foreign key, so TRUNCATE of the menu still works; stale rows
+        # never match as search joins the index to existing menu items
+        """
+        CREATE TABLE littlelemonapi_menuitem_search (
+            rowid bigint PRIMARY KEY,
+            title text NOT NULL,
+            category text NOT NULL,
+            document tsvector GENERATED ALWAYS AS (
+                setweight(to_tsvector('simple', title), 'A') ||
+                setweight(to_tsvector('simple', category), 'B')) STORED
+        )
+        """,
+        """
+        CREATE INDEX littlelemonapi_menuitem_search_document
+        ON littlelemonapi_menuitem_search USING gin (document)
+        """,
+        """
+        INSERT INTO littlelemonapi_menuitem_search(rowid, title, category)
+        SELECT m.id, m.title, c.title
+        FROM "LittleLemonAPI_menuitem" m
+        JOIN "LittleLemonAPI_category" c ON c.id = m.category_id
+        """,
+        """
+        CREATE FUNCTION littlelemonapi_menuitem_search_sync() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                DELETE FROM littlelemonapi_menuitem_search WHERE rowid = OLD.id;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                INSERT INTO littlelemonapi_menuitem_search(rowid, title, category)
+                SELECT NEW.id, NEW.title, c.title
+                FROM "LittleLemonAPI_category" c WHERE c.id = NEW.category_id
+                ON CONFLICT (rowid) DO UPDATE
+                SET title = EXCLUDED.title, category = EXCLUDED.category;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE TRIGGER littlelemonapi_menuitem_search_sync
+        AFTER INSERT OR DELETE OR UPDATE OF id, title, category_id
+        ON "LittleLemonAPI_menuitem"
+        FOR EACH ROW EXECUTE FUNCTION littlelemonapi_menuitem_search_sync()
+        """,
+        """
+        CREATE FUNCTION littlelemonapi_category_search_sync() RETURNS trigger AS $$
+        BEGIN
+            UPDATE littlelemonapi_menuitem_search s SET category = NEW.title
+            FROM "LittleLemonAPI_menuitem" m
+            WHERE m.category_id = NEW.id AND s.rowid = m.id;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE TRIGGER littlelemonapi_category_search_sync
+        AFTER UPDATE OF title ON "LittleLemonAPI_category"
+        FOR EACH ROW EXECUTE FUNCTION littlelemonapi_category_search_sync()
+        """,
+    ],
+}
+
+DROP_SQL = {
+    "sqlite": [
+        "DROP TRIGGER littlelemonapi_category_search_update",
+        "DROP TRIGGER littlelemonapi_menuitem_search_delete",
+        "DROP TRIGGER littlelemonapi_menuitem_search_update",
+        "DROP TRIGGER littlelemonapi_menuitem_search_insert",
+        "DROP TABLE littlelemonapi_menuitem_search_vocab",
+        "DROP TABLE littlelemonapi_menuitem_search",
+    ],
+    "postgresql": [
+        'DROP TRIGGER littlelemonapi_category_search_sync ON "LittleLemonAPI_category"',
+        "DROP FUNCTION littlelemonapi_category_search_sync()",
+        'DROP TRIGGER littlelemonapi_menuitem_search_sync ON "LittleLemonAPI_menuitem"',
+        "DROP FUNCTION littlelemonapi_menuitem_search_sync()",
+        "DROP TABLE littlelemonapi_menuitem_search",
+    ],
+}
+
+
+def run_sql(statements):
+    def run(apps, schema_editor):
+        # other backends get no index and search returns an error there
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("LittleLemonAPI", "0008_daily_sales_rollups"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MenuItemSearch",
+            fields=[
+                ("menuitem", models.OneToOneField(db_column="rowid", db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name="search", serialize=False, to="LittleLemonAPI.menuitem")),
+                ("title", models.TextField()),
+                ("category", models.TextField()),
+            ],
+            options={
+                "db_table": "littlelemonapi_menuitem_search",
+                "managed": False,
+            },
+        ),
+        migrations.RunPython(run_sql(INDEX_SQL), run_sql(DROP_SQL)),
+    ]
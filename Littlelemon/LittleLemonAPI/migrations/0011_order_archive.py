@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("LittleLemonAPI", "0010_jobs"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedOrder",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("status", models.BooleanField(default=True)),
+                ("total", models.DecimalField(decimal_places=2, max_digits=6)),
+                ("date", models.DateField()),
+                ("delivery_crew", models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="+", to=settings.AUTH_USER_MODEL)),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="+", to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ArchivedOrderItem",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("quantity", models.SmallIntegerField()),
+                ("unit_price", models.DecimalField(decimal_places=2, max_digits=6)),
+                ("price", models.DecimalField(decimal_places=2, max_digits=6)),
+                ("menuitem", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="+", to="LittleLemonAPI.menuitem")),
+                ("order", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="LittleLemonAPI.archivedorder")),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="archivedorder",
+            index=models.Index(fields=["date", "id"], name="archivedorder_date_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="archivedorder",
+            index=models.Index(fields=["user", "date"], name="archivedorder_user_date_idx"),
+        ),
+    ]
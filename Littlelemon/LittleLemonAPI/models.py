@@ -1,5 +1,6 @@
 from typing import Iterable, Optional
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 
@@ -15,6 +16,36 @@ class MenuItem(models.Model):
     featured = models.BooleanField(db_index=True)
     category = models.ForeignKey(Category, on_delete=models.PROTECT)
 
+    class Meta:
+        indexes = [
+            # backs keyset pagination on the default (price, id) ordering
+            models.Index(fields=['price', 'id'], name='menuitem_price_id_idx'),
+            # category filter ordered by price, see filters.MenuItemFilter
+            models.Index(fields=['category', 'price'],
+                         name='menuitem_category_price_idx'),
+        ]
+
+
+class MenuItemSearch(models.Model):
+    '''
+    The menu search index, see search.py. An FTS5 table on SQLite and a
+    table with a tsvector column on PostgreSQL, created by migration 0009
+    and kept in sync with MenuItem and Category by database triggers, so
+    bulk writes are indexed too. Only used to join the index to menu items.
+    '''
+    menuitem = models.OneToOneField(MenuItem,
+                                    primary_key=True,
+                                    db_column='rowid',
+                                    db_constraint=False,
+                                    on_delete=models.DO_NOTHING,
+                                    related_name='search')
+    title = models.TextField()
+    category = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = 'littlelemonapi_menuitem_search'
+
 
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -41,6 +72,15 @@ class Order(models.Model):
     total = models.DecimalField(max_digits=6, decimal_places=2)
     date = models.DateField(db_index=True, auto_now=True)
 
+    class Meta:
+        indexes = [
+            # backs keyset pagination on the default (-date, -id) ordering
+            models.Index(fields=['date', 'id'], name='order_date_id_idx'),
+            # status/delivery_crew filters ordered by date
+            models.Index(fields=['status', 'delivery_crew', 'date'],
+                         name='order_status_crew_date_idx'),
+        ]
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
@@ -51,3 +91,95 @@ class OrderItem(models.Model):
 
     class Meta:
         unique_together = ('menuitem', 'order')
+
+
+class ArchivedOrder(models.Model):
+    '''
+    A delivered order moved out of Order by `manage.py archive_orders`
+    (see archive.py), under its original id. Same columns as Order, so
+    rows can be copied with INSERT ... SELECT and the order list can read
+    both tables as one with ?include_archived=1.
+    '''
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='+')
+    delivery_crew = models.ForeignKey(User,
+                                      on_delete=models.SET_NULL,
+                                      related_name='+',
+                                      null=True)
+    status = models.BooleanField(default=True)
+    total = models.DecimalField(max_digits=6, decimal_places=2)
+    date = models.DateField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'id'],
+                         name='archivedorder_date_id_idx'),
+            models.Index(fields=['user', 'date'],
+                         name='archivedorder_user_date_idx'),
+        ]
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE)
+    menuitem = models.ForeignKey(MenuItem,
+                                 on_delete=models.CASCADE,
+                                 related_name='+')
+    quantity = models.SmallIntegerField()
+    unit_price = models.DecimalField(max_digits=6, decimal_places=2)
+    price = models.DecimalField(max_digits=6, decimal_places=2)
+
+
+class DailySales(models.Model):
+    '''
+    Per-day rollup of placed orders, maintained by analytics.record_order()
+    after checkout and rebuilt by `manage.py rebuild_daily_sales`.
+    '''
+    date = models.DateField(unique=True)
+    order_count = models.PositiveIntegerField(default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+
+class DailyMenuItemSales(models.Model):
+    date = models.DateField()
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('date', 'menuitem')
+
+
+class Job(models.Model):
+    '''
+    A background task queued by jobs.enqueue() and run by `manage.py
+    run_worker`. Rows are deleted once the task succeeds; the ones left are
+    waiting, running, or failed for good after max_attempts.
+    '''
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'),
+                      (FAILED, 'Failed')]
+
+    task = models.CharField(max_length=100)
+    args = models.JSONField(default=dict)
+    status = models.CharField(max_length=10,
+                              choices=STATUS_CHOICES,
+                              default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # the workers' poll: due jobs of a status, oldest first
+            models.Index(fields=['status', 'run_at'],
+                         name='job_status_run_at_idx'),
+        ]
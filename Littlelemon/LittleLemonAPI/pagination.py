@@ -0,0 +1,154 @@
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    '''
+    Cursor pagination that seeks straight to the next page with a WHERE
+    clause on the ordering columns instead of an OFFSET, and never runs a
+    COUNT(*). The ordering comes from the view's `list_filter_class`, which
+    always ends it with the primary key, so rows sharing a value in the
+    ordering columns are never skipped or repeated.
+    '''
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    page_size_query_param = 'limit'
+    max_page_size = 1000
+
+    @classmethod
+    def is_requested(cls, request):
+        return (cls.cursor_query_param in request.query_params
+                or request.query_params.get(cls.mode_query_param) == 'cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, view)
+        self.base_url = request.build_absolute_uri()
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor['reverse']
+        ordering = self.ordering
+        if reverse:
+            ordering = [self.flip(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if cursor is not None:
+            queryset = queryset.filter(self.seek(ordering, cursor['values']))
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next = cursor is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        })
+
+    def get_page_size(self, request):
+        page_size = request.query_params.get(self.page_size_query_param)
+        if page_size is None:
+            return api_settings.PAGE_SIZE
+        try:
+            page_size = int(page_size)
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: 'Not a number.'})
+        if page_size <= 0:
+            raise ValidationError(
+                {self.page_size_query_param: 'Must be positive.'})
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request, view):
+        # the view's ListFilter has already validated the ordering and made
+        # it total by appending the primary key
+        return view.list_filter_class(request).get_ordering()
+
+    @staticmethod
+    def flip(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    @staticmethod
+    def seek(ordering, values):
+        '''
+        Builds the row-value comparison "(a, b, id) > (x, y, z)" for mixed
+        directions as (a > x) OR (a = x AND b > y) OR (a = x AND b = y AND
+        id > z), which the composite indexes on the ordering columns serve.
+        '''
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            values = cursor['v']
+            reverse = bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound('Invalid cursor')
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound('Invalid cursor')
+        return {'values': values, 'reverse': reverse}
+
+    def encode_cursor(self, row, reverse):
+        values = []
+        for field in self.ordering:
+            value = row
+            for attr in field.lstrip('-').split('__'):
+                value = getattr(value, attr)
+            values.append(value if isinstance(value, (bool, int)) else
+                          str(value))
+        cursor = json.dumps({'v': values, 'r': int(reverse)},
+                            separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(cursor.encode()).decode()
+        url = replace_query_param(self.base_url, self.cursor_query_param,
+                                  encoded)
+        return remove_query_param(url, self.mode_query_param)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+
+class KeysetPaginationMixin:
+    '''
+    Lets a list view switch from the default LimitOffsetPagination to
+    KeysetPagination when the client asks for ?pagination=cursor or follows
+    a cursor link.
+    '''
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and KeysetPagination.is_requested(
+                self.request):
+            self._paginator = KeysetPagination()
+        return super().paginator
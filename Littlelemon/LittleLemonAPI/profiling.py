@@ -0,0 +1,240 @@
+import functools
+import random
+import re
+import statistics
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextvars import ContextVar
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.db import connections
+
+current_profile = ContextVar('littlelemon_profile', default=None)
+
+# collapses the placeholder lists of IN (...) and multi-row VALUES so
+# queries that only differ in the number of parameters share a fingerprint
+_PLACEHOLDER_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_ROW_LIST = re.compile(r'(?:\(\.\.\.\)\s*,\s*)+\(\.\.\.\)')
+
+
+def _config(name, default):
+    return getattr(settings, 'LITTLELEMON_PROFILING', {}).get(name, default)
+
+
+def fingerprint(sql):
+    return _ROW_LIST.sub('(...)', _PLACEHOLDER_LIST.sub('(...)', sql))
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.queries = Counter()
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        # an execute wrapper, see _profile_query()
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        return {sql: count for sql, count in self.queries.items() if count > 1}
+
+
+def _profile_query(execute, sql, params, many, context):
+    # counts towards the sampled request running in this context, if any
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile(execute, sql, params, many, context)
+
+
+def install_query_timing():
+    '''
+    Adds _profile_query to this thread's connections. It stays installed:
+    it only reads current_profile, which sync_to_async() carries over to
+    the thread an async view's queries run in, so concurrent sampled
+    requests never see each other's queries.
+    '''
+    for connection in connections.all():
+        if _profile_query not in connection.execute_wrappers:
+            # first, so execute_wrapper() blocks still pop their own
+            connection.execute_wrappers.insert(0, _profile_query)
+
+
+def timed_serialization(func):
+    '''
+    Counts the time spent in func towards the sampled request's serializer
+    time; nested serializers count towards the outer one.
+    '''
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = current_profile.get()
+        if profile is None or profile.serializing:
+            return func(*args, **kwargs)
+        profile.serializing = True
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.serializer_time += time.perf_counter() - started
+            profile.serializing = False
+
+    return wrapper
+
+
+class TimedSerializerMixin:
+    '''
+    For this app's serializers: counts to_representation() towards the
+    sampled request's serializer time. A list serializer calls it once per
+    item, so many=True is timed too.
+    '''
+
+    @timed_serialization
+    def to_representation(self, instance):
+        return super().to_representation(instance)
+
+
+class ProfileStore:
+    '''
+    The last `window` sampled requests of this process.
+    '''
+
+    def __init__(self, window):
+        self.records = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def add(self, record):
+        with self.lock:
+            self.records.append(record)
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+    def stats(self):
+        '''
+        Per view: request count, p50/p95 and mean timings in milliseconds,
+        query counts and the queries most often repeated within a request.
+        '''
+        with self.lock:
+            records = list(self.records)
+        views = defaultdict(list)
+        for record in records:
+            views[record['view']].append(record)
+        stats = []
+        for view, view_records in views.items():
+            totals = sorted(record['total_ms'] for record in view_records)
+            duplicates = Counter()
+            for record in view_records:
+                duplicates.update(record['duplicates'])
+            stats.append({
+                'view': view,
+                'requests': len(view_records),
+                'p50_ms': round(statistics.median(totals), 3),
+                'p95_ms': round(totals[int(0.95 * (len(totals) - 1))], 3),
+                'db_ms': round(
+                    statistics.fmean(record['db_ms']
+                                     for record in view_records), 3),
+                'serializer_ms': round(
+                    statistics.fmean(record['serializer_ms']
+                                     for record in view_records), 3),
+                'queries': round(
+                    statistics.fmean(record['queries']
+                                     for record in view_records), 2),
+                'max_queries': max(record['queries']
+                                   for record in view_records),
+                'duplicate_queries': [{
+                    'sql': sql,
+                    'count': count
+                } for sql, count in duplicates.most_common(5)],
+            })
+        return sorted(stats, key=lambda entry: -entry['p95_ms'])
+
+
+store = ProfileStore(_config('WINDOW', 1000))
+
+
+class ProfilingMiddleware:
+    '''
+    Opt-in request profiling. LITTLELEMON_PROFILING['SAMPLE_RATE'] of the
+    requests (0 disables it) are timed: total time, time and count of SQL
+    queries on every database connection, queries repeated within the
+    request (N+1 candidates, by fingerprint) and time spent serializing
+    (TimedSerializerMixin and the fastpath.py serializers). Sampled
+    responses get a Server-Timing header and are kept in an in-memory
+    rolling window served by /api/profiling.
+
+    Runs natively under ASGI as well as WSGI, so async views don't lose a
+    thread to it. Streaming responses are timed until the response object
+    is returned, not until the body has been sent.
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        install_query_timing()
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.record(request, response, profile, started)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        # on the thread the views' sync_to_async() calls run in
+        await sync_to_async(install_query_timing)()
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.record(request, response, profile, started)
+
+    def sampled(self):
+        sample_rate = _config('SAMPLE_RATE', 0)
+        return sample_rate and random.random() < sample_rate
+
+    def record(self, request, response, profile, started):
+        total = time.perf_counter() - started
+        match = request.resolver_match
+        record = {
+            'view': match.view_name if match else request.path,
+            'status': response.status_code,
+            'total_ms': total * 1000,
+            'db_ms': profile.db_time * 1000,
+            'serializer_ms': profile.serializer_time * 1000,
+            'queries': sum(profile.queries.values()),
+            'duplicates': profile.duplicates(),
+        }
+        store.add(record)
+        response['Server-Timing'] = (
+            f'total;dur={record["total_ms"]:.2f}, '
+            f'db;dur={record["db_ms"]:.2f};desc="{record["queries"]} queries", '
+            f'serializer;dur={record["serializer_ms"]:.2f}')
+        return response
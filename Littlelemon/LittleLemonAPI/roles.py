@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.core.cache import cache
+
+MANAGER = 'Manager'
+DELIVERY_CREW = 'Delivery crew'
+
+# name of the attribute the group names are memoized under on a user object
+_MEMO_ATTR = '_littlelemon_group_names'
+
+
+def _cache_key(user_id):
+    return f'littlelemon:roles:{user_id}'
+
+
+def get_group_names(user):
+    '''
+    Returns the names of the groups the user belongs to as a frozenset.
+    The result is loaded once and memoized on the user object, so every
+    permission check made while serving a request shares a single query.
+    When LITTLELEMON_ROLE_CACHE_TIMEOUT is set, the names are also kept in
+    the default cache for that many seconds across requests.
+    '''
+    if user is None or not user.is_authenticated:
+        return frozenset()
+    group_names = getattr(user, _MEMO_ATTR, None)
+    if group_names is not None:
+        return group_names
+    timeout = getattr(settings, 'LITTLELEMON_ROLE_CACHE_TIMEOUT', 0)
+    if timeout:
+        group_names = cache.get(_cache_key(user.pk))
+    if group_names is None:
+        group_names = frozenset(user.groups.values_list('name', flat=True))
+        if timeout:
+            cache.set(_cache_key(user.pk), group_names, timeout)
+    setattr(user, _MEMO_ATTR, group_names)
+    return group_names
+
+
+async def aget_group_names(user):
+    '''
+    Async counterpart of get_group_names() for the async views; shares the
+    same memo and cache entries.
+    '''
+    if user is None or not user.is_authenticated:
+        return frozenset()
+    group_names = getattr(user, _MEMO_ATTR, None)
+    if group_names is not None:
+        return group_names
+    timeout = getattr(settings, 'LITTLELEMON_ROLE_CACHE_TIMEOUT', 0)
+    if timeout:
+        group_names = await cache.aget(_cache_key(user.pk))
+    if group_names is None:
+        group_names = frozenset([
+            name async for name in user.groups.values_list('name', flat=True)
+        ])
+        if timeout:
+            await cache.aset(_cache_key(user.pk), group_names, timeout)
+    setattr(user, _MEMO_ATTR, group_names)
+    return group_names
+
+
+def remember(user, group_names):
+    '''
+    Memoizes group names that were loaded elsewhere (e.g. by the token
+    cache) on the user object.
+    '''
+    setattr(user, _MEMO_ATTR, frozenset(group_names))
+
+
+def is_manager(user):
+    return MANAGER in get_group_names(user)
+
+
+def is_delivery_crew(user):
+    return DELIVERY_CREW in get_group_names(user)
+
+
+def invalidate(user):
+    '''
+    Drops the cached group names of a user whose membership just changed.
+    Accepts a user object or a user id.
+    '''
+    user_id = getattr(user, 'pk', user)
+    cache.delete(_cache_key(user_id))
+    if hasattr(user, _MEMO_ATTR):
+        delattr(user, _MEMO_ATTR)
+
+
+async def ais_manager(user):
+    return MANAGER in await aget_group_names(user)
+
+
+async def ais_delivery_crew(user):
+    return DELIVERY_CREW in await aget_group_names(user)
@@ -0,0 +1,124 @@
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+# database alias reads are sent to while a view runs under ReplicaReadMixin
+read_alias = ContextVar('littlelemon_read_alias', default=None)
+
+
+def replica_alias():
+    return getattr(settings, 'LITTLELEMON_READ_REPLICA', None)
+
+
+def pin_seconds():
+    return getattr(settings, 'LITTLELEMON_REPLICA_PIN_SECONDS', 5)
+
+
+def _pin_key(user_id):
+    return f'littlelemon:replica-pin:{user_id}'
+
+
+def pin(user):
+    '''
+    Sends the user's reads to the primary for LITTLELEMON_REPLICA_PIN_SECONDS,
+    long enough for the replica to catch up with what they just wrote.
+    '''
+    cache.set(_pin_key(user.pk), True, pin_seconds())
+
+
+async def apin(user):
+    await cache.aset(_pin_key(user.pk), True, pin_seconds())
+
+
+def is_pinned(user):
+    return user.is_authenticated and cache.get(_pin_key(user.pk), False)
+
+
+class ReplicaRouter:
+    '''
+    Reads go to the alias set by ReplicaReadMixin, everything else to the
+    primary. Writes always go to the primary, even for objects that were
+    read from the replica.
+    '''
+
+    def db_for_read(self, model, **hints):
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary
+        return True
+
+
+class ReplicaReadMixin:
+    '''
+    Serves safe-method requests from LITTLELEMON_READ_REPLICA, unless the
+    user wrote something in the last few seconds (see pin()). Authentication
+    still reads from the primary, as it runs before the routing is known.
+    '''
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        alias = replica_alias()
+        if (alias and request.method in SAFE_METHODS
+                and not is_pinned(request.user)):
+            self.read_alias_token = read_alias.set(alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        try:
+            return super().finalize_response(request, response, *args,
+                                             **kwargs)
+        finally:
+            token = getattr(self, 'read_alias_token', None)
+            if token is not None:
+                read_alias.reset(token)
+                self.read_alias_token = None
+
+
+class ReplicaPinningMiddleware:
+    '''
+    Pins users to the primary after a successful unsafe request, so they
+    read their own writes (e.g. the order they just placed) on the next
+    request. DRF sets request.user on the underlying HttpRequest when it
+    authenticates, so token-authenticated users are seen here too. Runs
+    natively under ASGI, so the async views (and the SSE stream in
+    particular) don't hold a worker thread for it.
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        user = self.user_to_pin(request, response)
+        if user is not None:
+            pin(user)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        user = self.user_to_pin(request, response)
+        if user is not None:
+            await apin(user)
+        return response
+
+    def user_to_pin(self, request, response):
+        if (replica_alias() and request.method not in SAFE_METHODS
+                and response.status_code < 400):
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                return user
+        return None
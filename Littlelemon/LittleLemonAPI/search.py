@@ -0,0 +1,199 @@
+import bisect
+import re
+from collections import defaultdict
+
+from django.db import NotSupportedError, connections
+from django.db.models import Expression, F, FloatField, Lookup, Value
+from rest_framework.exceptions import ValidationError
+
+from . import caching, models
+
+# letters and digits; FTS5's unicode61 tokenizer splits on everything else,
+# underscores included
+TERM = re.compile(r'[^\W_]+')
+MIN_TERM_LENGTH = 2
+MAX_TERMS = 8
+# a term this long that no indexed word starts with also matches the words
+# one typo away from it, the most common ones first
+MIN_FUZZY_LENGTH = 4
+MAX_CORRECTIONS = 5
+
+
+def parse(text):
+    terms = TERM.findall(text.lower())
+    return [term for term in terms if len(term) >= MIN_TERM_LENGTH][:MAX_TERMS]
+
+
+def _deletes(word):
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+class Vocabulary:
+    '''
+    The indexed words and the number of menu items each appears in. Typos
+    are found with symmetric deletes: two words at most one insertion,
+    deletion, substitution or swap of neighbouring letters apart share a
+    variant with at most one letter deleted, so a lookup is a few dict
+    probes instead of an edit distance per word.
+    '''
+
+    def __init__(self, counts):
+        self.counts = counts
+        self.words = sorted(counts)
+        self.variants = defaultdict(set)
+        for word in counts:
+            if len(word) >= MIN_FUZZY_LENGTH - 1:
+                for variant in _deletes(word) | {word}:
+                    self.variants[variant].add(word)
+
+    def has_prefix(self, term):
+        i = bisect.bisect_left(self.words, term)
+        return i < len(self.words) and self.words[i].startswith(term)
+
+    def corrections(self, term):
+        words = set()
+        for variant in _deletes(term) | {term}:
+            words |= self.variants.get(variant, set())
+        words = sorted(words, key=lambda word: (-self.counts[word], word))
+        return words[:MAX_CORRECTIONS]
+
+
+class SQLiteSearch:
+    '''
+    FTS5 query syntax; `rank` is bm25() with title matches weighing ten
+    times as much as category matches, see migration 0009.
+    '''
+    vocabulary_sql = ('SELECT term, doc '
+                      'FROM littlelemonapi_menuitem_search_vocab')
+
+    def query(self, groups):
+        return ' AND '.join('(' + ' OR '.join(f'"{word}"*'
+                                              for word in group) + ')'
+                            for group in groups)
+
+    def match_sql(self, table, rhs):
+        return (f'{table}.{models.MenuItemSearch._meta.db_table} '
+                f'MATCH {rhs}')
+
+    def rank_sql(self, table):
+        return f'{table}.rank', []
+
+
+class PostgreSQLSearch:
+    '''
+    tsquery syntax on the 'simple' configuration, which lowercases but
+    doesn't stem, so prefixes and typo corrections work on whole words.
+    '''
+    vocabulary_sql = ('SELECT word, ndoc FROM '
+                      "ts_stat('SELECT document "
+                      "FROM littlelemonapi_menuitem_search')")
+
+    def query(self, groups):
+        return ' & '.join('(' + ' | '.join(f'{word}:*'
+                                           for word in group) + ')'
+                          for group in groups)
+
+    def match_sql(self, table, rhs):
+        return f"{table}.document @@ to_tsquery('simple', {rhs})"
+
+    def rank_sql(self, table):
+        # negated so that, like FTS5's rank, lower is better
+        return f"-ts_rank({table}.document, to_tsquery('simple', %s))", None
+
+
+BACKENDS = {'sqlite': SQLiteSearch(), 'postgresql': PostgreSQLSearch()}
+
+
+def get_backend(connection):
+    try:
+        return BACKENDS[connection.vendor]
+    except KeyError:
+        raise NotSupportedError(
+            f'Menu search is not available on {connection.vendor}.')
+
+
+class Match(Lookup):
+    '''
+    search__title__match=query: the menu item's index row matches a
+    full-text query in the backend's syntax. The field only makes the ORM
+    join the index; the query runs against all indexed columns.
+    '''
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        table = compiler.quote_name_unless_alias(self.lhs.alias)
+        rhs, params = self.process_rhs(compiler, connection)
+        return get_backend(connection).match_sql(table, rhs), params
+
+
+models.MenuItemSearch._meta.get_field('title').register_lookup(Match)
+
+
+class Rank(Expression):
+    '''
+    The relevance of a menu item to the query matched on the same index
+    column; lower is better.
+    '''
+    output_field = FloatField()
+
+    def __init__(self, column, query):
+        super().__init__()
+        self.column = column
+        self.query = query
+
+    def get_source_expressions(self):
+        return [self.column]
+
+    def set_source_expressions(self, exprs):
+        (self.column, ) = exprs
+
+    def as_sql(self, compiler, connection):
+        table = compiler.quote_name_unless_alias(self.column.alias)
+        sql, params = get_backend(connection).rank_sql(table)
+        return sql, [self.query] if params is None else params
+
+
+# (menu generation, Vocabulary) per database alias
+_vocabularies = {}
+
+
+def get_vocabulary(alias):
+    '''
+    The vocabulary of the index on `alias`, read again whenever the menu
+    generation changes (see caching.py).
+    '''
+    generation, _ = caching.get_menu_generation()
+    cached = _vocabularies.get(alias)
+    if cached is None or cached[0] != generation:
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            cursor.execute(get_backend(connection).vocabulary_sql)
+            cached = (generation, Vocabulary(dict(cursor.fetchall())))
+        _vocabularies[alias] = cached
+    return cached[1]
+
+
+def search(queryset, text):
+    '''
+    Narrows a MenuItem queryset to the items matching `text` in their own
+    or their category's title and annotates `search_rank`. Every term must
+    match, as a word prefix; terms shorter than MIN_TERM_LENGTH are
+    ignored.
+    '''
+    terms = parse(text)
+    if not terms:
+        return queryset.annotate(search_rank=Value(0.0))
+    try:
+        backend = get_backend(connections[queryset.db])
+    except NotSupportedError as error:
+        raise ValidationError({'search': str(error)})
+    vocabulary = get_vocabulary(queryset.db)
+    groups = []
+    for term in terms:
+        group = [term]
+        if len(term) >= MIN_FUZZY_LENGTH and not vocabulary.has_prefix(term):
+            group += vocabulary.corrections(term)
+        groups.append(group)
+    query = backend.query(groups)
+    return queryset.filter(search__title__match=query).annotate(
+        search_rank=Rank(F('search__title'), query))
@@ -1,18 +1,21 @@
 from rest_framework import serializers
-from . import models
+from . import dispatch, menu_snapshot, models
+from .profiling import TimedSerializerMixin
 from django.contrib.auth.models import User, Group
 from django.contrib.auth.hashers import make_password
-from django.shortcuts import get_object_or_404
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import Http404
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = models.Category
         fields = ['slug', 'title']
 
 
-class MenuItemSerializer(serializers.ModelSerializer):
+class MenuItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     category_id = serializers.IntegerField(write_only=True)
 
@@ -20,8 +23,36 @@ class MenuItemSerializer(serializers.ModelSerializer):
         model = models.MenuItem
         fields = ['title', 'price', 'featured', 'category', 'category_id']
 
-
-class UserSerializers(serializers.ModelSerializer):
+    def validate_category_id(self, value):
+        # the database only for categories added since the snapshot loaded,
+        # or when there is no snapshot
+        snapshot = menu_snapshot.get_snapshot()
+        if ((snapshot is None or value not in snapshot.categories)
+                and not models.Category.objects.filter(pk=value).exists()):
+            raise serializers.ValidationError('No such category.')
+        return value
+
+
+class MenuImportRowSerializer(TimedSerializerMixin, serializers.Serializer):
+    '''
+    One row of a bulk menu import. The category is given either by slug
+    (`category`) or by id (`category_id`) and is resolved per batch. A row
+    without `featured` leaves an existing item's flag as it is.
+    '''
+    title = serializers.CharField(max_length=255)
+    price = serializers.DecimalField(max_digits=6, decimal_places=2)
+    featured = serializers.BooleanField(required=False)
+    category = serializers.SlugField(required=False)
+    category_id = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        if ('category' in attrs) == ('category_id' in attrs):
+            raise serializers.ValidationError(
+                'Give exactly one of category or category_id.')
+        return attrs
+
+
+class UserSerializers(TimedSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True,
                                      required=True,
                                      style={
@@ -44,7 +75,7 @@ class UserSerializers(serializers.ModelSerializer):
         fields = ['pk', 'email', 'username', 'password', 'groups']
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     price = serializers.DecimalField(max_digits=6,
                                      decimal_places=2,
                                      read_only=True)
@@ -54,25 +85,54 @@ class CartSerializer(serializers.ModelSerializer):
     menuitem_id = serializers.IntegerField(write_only=True)
 
     def create(self, validated_data):
+        user_id = self.context['request'].user.id
         menuitem_id = validated_data['menuitem_id']
-        menuitem = get_object_or_404(models.MenuItem, id=menuitem_id)
-        validated_data['unit_price'] = menuitem.price
-        validated_data['user_id'] = self.context['request'].user.id
-        cart = models.Cart.objects.filter(menuitem_id=menuitem.id,
-                                          user_id=validated_data['user_id'])
-        if cart:  # if the item is already in the user's cart, add up the quantity
-            cart[0].quantity += validated_data['quantity']
-            cart[0].save()
-            return cart[0]
-        return super().create(
-            validated_data)  # if the item is not in, create new record
+        quantity = validated_data['quantity']
+        cart = models.Cart.objects.filter(menuitem_id=menuitem_id,
+                                          user_id=user_id)
+        # if the item is already in the user's cart, add up the quantity in
+        # the database so concurrent adds can't overwrite each other
+        with transaction.atomic():
+            if not cart.update(quantity=F('quantity') + quantity,
+                               price=(F('quantity') + quantity) *
+                               F('unit_price')):
+                snapshot = menu_snapshot.get_snapshot()
+                menuitem = (snapshot.menuitems.get(menuitem_id)
+                            if snapshot is not None else None)
+                if menuitem is not None:
+                    unit_price = menuitem.price
+                else:
+                    # no snapshot, added since it loaded, or missing
+                    unit_price = models.MenuItem.objects.filter(
+                        id=menuitem_id).values_list('price',
+                                                    flat=True).first()
+                if unit_price is None:
+                    raise Http404
+                try:
+                    with transaction.atomic():
+                        return models.Cart.objects.create(
+                            user_id=user_id,
+                            menuitem_id=menuitem_id,
+                            quantity=quantity,
+                            unit_price=unit_price)
+                except IntegrityError:
+                    # another request added the item first
+                    cart.update(quantity=F('quantity') + quantity,
+                                price=(F('quantity') + quantity) *
+                                F('unit_price'))
+        return cart.get()
 
     class Meta:
         model = models.Cart
         fields = ['quantity', 'unit_price', 'price', 'menuitem_id', 'user_id']
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class CartSummarySerializer(TimedSerializerMixin, serializers.Serializer):
+    item_count = serializers.IntegerField()
+    total = serializers.DecimalField(max_digits=8, decimal_places=2)
+
+
+class OrderItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     # order = OrderSerializer(read_only=True)
 
     class Meta:
@@ -80,7 +140,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ['quantity', 'unit_price', 'price', 'menuitem_id']
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     orderitems = serializers.SerializerMethodField(read_only=True,method_name='get_orderitem')
     delivery_crew_id = serializers.IntegerField(required=False,allow_null=True,write_only=True)
     class Meta:
@@ -94,5 +154,66 @@ class OrderSerializer(serializers.ModelSerializer):
             'id':{'read_only':True}
         }
     def get_orderitem(self, obj):
-        orderitems = models.OrderItem.objects.filter(order=obj)
+        # reads the prefetched rows when the queryset used prefetch_related
+        orderitems = obj.orderitem_set.all()
         return OrderItemSerializer(orderitems, many=True).data
+
+
+class OrderDispatchSerializer(TimedSerializerMixin, serializers.Serializer):
+    '''
+    Input of the dispatch endpoint: either a list of order ids (`orders`) or
+    `all_unassigned`, optionally limited to some `delivery_crew` ids.
+    '''
+    orders = serializers.ListField(child=serializers.IntegerField(),
+                                   required=False,
+                                   allow_empty=False)
+    all_unassigned = serializers.BooleanField(default=False)
+    delivery_crew = serializers.ListField(child=serializers.IntegerField(),
+                                          required=False,
+                                          allow_empty=False)
+    strategy = serializers.ChoiceField(choices=list(dispatch.STRATEGIES),
+                                       default='least_loaded')
+
+    def validate(self, attrs):
+        if ('orders' in attrs) == attrs['all_unassigned']:
+            raise serializers.ValidationError(
+                'Give exactly one of orders or all_unassigned.')
+        return attrs
+
+
+class OrderAssignmentSerializer(TimedSerializerMixin, serializers.Serializer):
+    id = serializers.IntegerField()
+    delivery_crew = serializers.IntegerField()
+
+
+class DailySalesSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+
+    class Meta:
+        model = models.DailySales
+        fields = ['date', 'order_count', 'item_count', 'revenue']
+
+
+class AverageBasketSerializer(TimedSerializerMixin, serializers.Serializer):
+    items = serializers.DecimalField(max_digits=12, decimal_places=2)
+    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class TopMenuItemSerializer(TimedSerializerMixin, serializers.Serializer):
+    menuitem_id = serializers.IntegerField()
+    title = serializers.CharField()
+    quantity = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class CrewWorkloadSerializer(TimedSerializerMixin, serializers.Serializer):
+    delivery_crew_id = serializers.IntegerField()
+    username = serializers.CharField()
+    open_orders = serializers.IntegerField()
+    delivered_orders = serializers.IntegerField()
+
+
+class SalesSummarySerializer(TimedSerializerMixin, serializers.Serializer):
+    revenue_per_day = DailySalesSerializer(many=True)
+    average_basket = AverageBasketSerializer()
+    top_menu_items = TopMenuItemSerializer(many=True)
+    delivery_crew_workload = CrewWorkloadSerializer(many=True)
@@ -0,0 +1,47 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import authentication, caching, models, roles
+
+
+@receiver(post_save, sender=models.MenuItem)
+@receiver(post_delete, sender=models.MenuItem)
+@receiver(post_save, sender=models.Category)
+@receiver(post_delete, sender=models.Category)
+def invalidate_menu_cache(sender, **kwargs):
+    caching.bump_menu_generation()
+    if not transaction.get_autocommit():
+        # again once the change commits, so that a menu snapshot loaded from
+        # the old rows in the meantime is replaced (see menu_snapshot.py)
+        transaction.on_commit(caching.bump_menu_generation)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    # djoser's logout deletes the token
+    authentication.invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_saved_user(sender, instance, created, **kwargs):
+    if not created:
+        authentication.invalidate_user(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_group_members(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        user_ids = [instance.pk]
+    elif action == 'pre_clear':
+        user_ids = list(instance.user_set.values_list('pk', flat=True))
+    else:
+        user_ids = pk_set
+    for user_id in user_ids:
+        roles.invalidate(user_id)
+        authentication.invalidate_user(user_id)
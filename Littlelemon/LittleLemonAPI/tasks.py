@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.core.mail import send_mail
+
+from . import analytics, events, jobs, models
+
+# queued in the checkout transaction by order_placed()
+ORDER_PLACED_TASKS = ('record_order_sales', 'send_receipt',
+                      'print_kitchen_ticket', 'notify_delivery_crew')
+
+
+def order_placed(order):
+    '''
+    Queues the checkout side effects with one INSERT, so they add a
+    single query to checkout however many there are.
+    '''
+    jobs.enqueue_many([(name, {
+        'order_id': order.id
+    }) for name in ORDER_PLACED_TASKS])
+
+
+def _order(order_id):
+    # None once the order is deleted, in which case there is nothing to do
+    return models.Order.objects.select_related('user').filter(
+        pk=order_id).first()
+
+
+def _orderitems(order):
+    return list(
+        models.OrderItem.objects.filter(order=order).select_related(
+            'menuitem').order_by('id'))
+
+
+@jobs.task
+def record_order_sales(order_id):
+    order = _order(order_id)
+    if order is not None:
+        analytics.record_order(order, _orderitems(order))
+
+
+@jobs.task
+def send_receipt(order_id):
+    order = _order(order_id)
+    if order is None or not order.user.email:
+        return
+    lines = [
+        f'{item.quantity} x {item.menuitem.title}  {item.price}'
+        for item in _orderitems(order)
+    ]
+    send_mail(f'Little Lemon order #{order.id}',
+              '\n'.join([*lines, f'Total  {order.total}']),
+              settings.DEFAULT_FROM_EMAIL, [order.user.email])
+
+
+@jobs.task
+def print_kitchen_ticket(order_id):
+    order = _order(order_id)
+    if order is not None:
+        events.publish(
+            events.KITCHEN_CHANNEL, {
+                'id': order.id,
+                'items': [{
+                    'menuitem_id': item.menuitem_id,
+                    'title': item.menuitem.title,
+                    'quantity': item.quantity,
+                } for item in _orderitems(order)],
+            })
+
+
+@jobs.task
+def notify_delivery_crew(order_id):
+    order = _order(order_id)
+    if order is not None:
+        events.publish(events.DELIVERY_CREW_CHANNEL, events.order_event(order))
@@ -1,3 +1,1817 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import (AsyncRequestFactory, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework import serializers as drf_serializers
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from . import (authentication, benchmark, caching, db, dispatch, events,
+               fastpath, idempotency, jobs, menu_snapshot, models, profiling,
+               roles, routers, search, serializers, tasks, throttling, urls,
+               views)
+from .filters import MenuItemFilter
+
+
+class LittleLemonTestCase(APITestCase):
+
+    def setUp(self):
+        # throttle history lives in the default cache
+        cache.clear()
+        authentication.local_tokens.clear()
+        search._vocabularies.clear()
+        menu_snapshot.clear()
+        idempotency.get_store.cache_clear()
+        self.manager_group = Group.objects.create(name='Manager')
+        self.crew_group = Group.objects.create(name='Delivery crew')
+        self.customer = User.objects.create_user('customer')
+        self.manager = User.objects.create_user('manager')
+        self.manager.groups.add(self.manager_group)
+        self.crew = User.objects.create_user('crew')
+        self.crew.groups.add(self.crew_group)
+        self.category = models.Category.objects.create(slug='main',
+                                                       title='Main')
+
+    def make_menuitems(self, count, price='2.50'):
+        return models.MenuItem.objects.bulk_create([
+            models.MenuItem(title=f'Dish {i}',
+                            price=Decimal(price),
+                            featured=False,
+                            category=self.category) for i in range(count)
+        ])
+
+    def fill_cart(self, user, menuitems, quantity=2):
+        for menuitem in menuitems:
+            models.Cart.objects.create(user=user,
+                                       menuitem=menuitem,
+                                       quantity=quantity,
+                                       unit_price=menuitem.price)
+
+
+class CheckoutTests(LittleLemonTestCase):
+
+    def checkout_queries(self, cart_size):
+        user = User.objects.create_user(f'buyer{cart_size}')
+        self.fill_cart(user, self.make_menuitems(cart_size))
+        self.client.force_authenticate(user)
+        with self.assertNumQueries(8):
+            response = self.client.post('/api/orders')
+        self.assertEqual(response.status_code, 201)
+        return response
+
+    def test_checkout_moves_cart_into_order(self):
+        self.fill_cart(self.customer, self.make_menuitems(3), quantity=2)
+        self.client.force_authenticate(self.customer)
+        response = self.client.post('/api/orders')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Decimal(response.data['total']), Decimal('15.00'))
+        self.assertEqual(len(response.data['orderitems']), 3)
+        self.assertEqual(response.data['user'], self.customer.id)
+        self.assertFalse(models.Cart.objects.filter(user=self.customer))
+
+    def test_checkout_query_count_is_independent_of_cart_size(self):
+        self.checkout_queries(1)
+        self.checkout_queries(20)
+
+    def test_empty_cart_does_not_create_order(self):
+        self.client.force_authenticate(self.customer)
+        response = self.client.post('/api/orders')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(models.Order.objects.exists())
+
+    def test_manager_deletes_order_with_its_items(self):
+        counts = []
+        for size in (1, 4):
+            cache.clear()
+            self.fill_cart(self.customer, self.make_menuitems(size))
+            self.client.force_authenticate(self.customer)
+            order_id = self.client.post('/api/orders').data['id']
+            self.assertEqual(
+                self.client.delete(f'/api/orders/{order_id}').status_code,
+                403)
+            self.client.force_authenticate(self.manager)
+            # loads the manager's cached roles
+            self.client.get(f'/api/orders/{order_id}')
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.delete(f'/api/orders/{order_id}')
+            self.assertEqual(response.status_code, 204)
+            counts.append(len(captured))
+        self.assertFalse(models.Order.objects.exists())
+        self.assertFalse(models.OrderItem.objects.exists())
+        self.assertEqual(counts[0], counts[1])
+
+
+class OrderListQueryTests(LittleLemonTestCase):
+
+    def make_orders(self, count):
+        menuitems = self.make_menuitems(2)
+        orders = models.Order.objects.bulk_create([
+            models.Order(user=self.customer,
+                         delivery_crew=self.crew,
+                         total=Decimal('5.00')) for _ in range(count)
+        ])
+        models.OrderItem.objects.bulk_create([
+            models.OrderItem(order=order,
+                             menuitem=menuitem,
+                             quantity=1,
+                             unit_price=menuitem.price,
+                             price=menuitem.price) for order in orders
+            for menuitem in menuitems
+        ])
+
+    def list_queries(self, limit):
+        cache.clear()
+        self.client.force_authenticate(User.objects.get(pk=self.manager.pk))
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/orders?limit={limit}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+        return response
+
+    def test_order_list_query_count_is_independent_of_page_size(self):
+        self.make_orders(500)
+        small = self.list_queries(5)
+        large = self.list_queries(500)
+        self.assertEqual(len(small.data['results'][0]['orderitems']), 2)
+        self.assertEqual(len(large.data['results'][-1]['orderitems']), 2)
+
+    def test_order_detail_uses_prefetched_items(self):
+        self.make_orders(1)
+        order = models.Order.objects.get()
+        self.client.force_authenticate(self.customer)
+        response = self.client.get(f'/api/orders/{order.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['orderitems']), 2)
+
+
+class DispatchTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.crew2 = User.objects.create_user('crew2')
+        self.crew2.groups.add(self.crew_group)
+
+    def make_orders(self, count, **kwargs):
+        return models.Order.objects.bulk_create([
+            models.Order(user=self.customer, total=Decimal('5.00'), **kwargs)
+            for _ in range(count)
+        ])
+
+    def dispatch(self, data):
+        self.client.force_authenticate(User.objects.get(pk=self.manager.pk))
+        return self.client.post('/api/orders/dispatch', data, format='json')
+
+    def test_least_loaded_balances_open_orders(self):
+        self.make_orders(2, delivery_crew=self.crew)
+        self.make_orders(3, delivery_crew=self.crew2, status=True)
+        self.make_orders(4)
+        response = self.dispatch({'all_unassigned': True})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['assigned']), 4)
+        self.assertEqual(dispatch.crew_loads(), {
+            self.crew.pk: 3,
+            self.crew2.pk: 3
+        })
+
+    def test_query_count_is_independent_of_order_count(self):
+        counts = []
+        for count in (5, 200):
+            cache.clear()
+            self.make_orders(count)
+            with CaptureQueriesContext(connection) as captured:
+                response = self.dispatch({
+                    'all_unassigned': True,
+                    'strategy': 'round_robin'
+                })
+            self.assertEqual(len(response.data['assigned']), count)
+            counts.append(len(captured))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_query_count_is_independent_of_crew_size(self):
+        counts = []
+        for added in (0, 8):
+            for i in range(added):
+                User.objects.create_user(f'extra{i}').groups.add(
+                    self.crew_group)
+            crew_size = 2 + added
+            cache.clear()
+            self.make_orders(crew_size)
+            with CaptureQueriesContext(connection) as captured:
+                response = self.dispatch({
+                    'all_unassigned': True,
+                    'strategy': 'round_robin'
+                })
+            crew_ids = {
+                assignment['delivery_crew']
+                for assignment in response.data['assigned']
+            }
+            self.assertEqual(len(crew_ids), crew_size)
+            counts.append(len(captured))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_only_open_unassigned_orders_are_assigned(self):
+        assigned, delivered, open_ = (
+            self.make_orders(1, delivery_crew=self.crew)[0],
+            self.make_orders(1, status=True)[0],
+            self.make_orders(1)[0])
+        response = self.dispatch({
+            'orders': [assigned.id, delivered.id, open_.id],
+            'delivery_crew': [self.crew2.pk]
+        })
+        self.assertEqual(response.data['assigned'], [{
+            'id': open_.id,
+            'delivery_crew': self.crew2.pk
+        }])
+        self.assertEqual(
+            self.dispatch({
+                'orders': [1],
+                'all_unassigned': True
+            }).status_code, 400)
+        self.make_orders(1)
+        self.assertEqual(
+            self.dispatch({
+                'all_unassigned': True,
+                'delivery_crew': [self.customer.pk]
+            }).status_code, 400)
+
+    def test_queue_lists_own_open_orders(self):
+        mine = self.make_orders(2, delivery_crew=self.crew)
+        self.make_orders(1, delivery_crew=self.crew, status=True)
+        self.make_orders(1, delivery_crew=self.crew2)
+        self.client.force_authenticate(self.crew)
+        response = self.client.get('/api/orders/queue')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([order['id'] for order in response.data['results']],
+                         [order.id for order in mine])
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(
+            self.client.get('/api/orders/queue').status_code, 403)
+
+    def test_patch_rejects_non_crew(self):
+        order = self.make_orders(1)[0]
+        self.client.force_authenticate(self.manager)
+        response = self.client.patch(f'/api/orders/{order.id}',
+                                     {'delivery_crew_id': self.customer.pk})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(f'/api/orders/{order.id}',
+                                     {'delivery_crew_id': self.crew.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['delivery_crew'], self.crew.pk)
+
+
+class RoleCacheTests(LittleLemonTestCase):
+
+    def test_group_names_are_loaded_once_per_request(self):
+        order = models.Order.objects.create(user=self.customer,
+                                            total=Decimal('1.00'))
+        # canPatchOrderDetail and get_object both check the crew's groups
+        self.client.force_authenticate(User.objects.get(pk=self.crew.pk))
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.patch(f'/api/orders/{order.id}',
+                                         {'status': 1})
+        self.assertEqual(response.status_code, 403)
+        group_queries = [
+            query for query in captured.captured_queries
+            if 'auth_group' in query['sql']
+        ]
+        self.assertEqual(len(group_queries), 1)
+
+    def test_cached_group_names_are_reused_across_requests(self):
+        roles.get_group_names(self.manager)
+        manager = User.objects.get(pk=self.manager.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(roles.is_manager(manager))
+
+    def test_group_membership_change_invalidates_cache(self):
+        self.client.force_authenticate(self.manager)
+        response = self.client.post('/api/groups/manager/users', {
+            'username': 'newmanager',
+            'password': 'pw',
+            'email': 'new@example.com'
+        })
+        self.assertEqual(response.status_code, 201)
+        newmanager = User.objects.get(username='newmanager')
+        self.assertTrue(roles.is_manager(newmanager))
+        response = self.client.delete(
+            f'/api/groups/manager/users/{newmanager.pk}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(cache.get(f'littlelemon:roles:{newmanager.pk}'))
+
+    def test_group_member_list_queries_dont_grow_with_members(self):
+        crew = Group.objects.get(name=roles.DELIVERY_CREW)
+        self.client.force_authenticate(self.manager)
+        # loads the manager's cached roles
+        self.client.get('/api/groups/delivery-crew/users')
+        counts = []
+        for i in range(4):
+            User.objects.create_user(f'crew{i}').groups.add(crew)
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get('/api/groups/delivery-crew/users')
+            counts.append(len(captured))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertTrue(
+            all(user['groups'] == [roles.DELIVERY_CREW]
+                for user in response.data['results']))
+        self.assertEqual(len(set(counts)), 1, counts)
+
+
+class TokenCacheTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.manager)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def auth_queries(self, path='/api/analytics'):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(path)
+        return response, [
+            query['sql'] for query in captured.captured_queries
+            if 'authtoken_token' in query['sql']
+            or 'auth_group' in query['sql']
+        ]
+
+    def test_cached_token_skips_user_and_group_queries(self):
+        response, queries = self.auth_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 2)
+        response, queries = self.auth_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+    def test_logout_invalidates_token(self):
+        self.auth_queries()
+        response = self.client.post('/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        response, _ = self.auth_queries()
+        self.assertEqual(response.status_code, 401)
+
+    def test_group_change_invalidates_token(self):
+        self.auth_queries()
+        self.manager.groups.remove(self.manager_group)
+        response, queries = self.auth_queries()
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(len(queries), 2)
+
+    def test_shared_cache_is_used_across_processes(self):
+        with override_settings(LITTLELEMON_TOKEN_CACHE={
+                'SHARED_ALIAS': 'default'
+        }):
+            self.auth_queries()
+            # another worker starts with an empty LRU
+            authentication.local_tokens.clear()
+            response, queries = self.auth_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+
+@override_settings(LITTLELEMON_MENU_CACHE_TIMEOUT=60 * 60)
+class MenuCacheTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.menuitem = self.make_menuitems(3)[0]
+        self.client.force_authenticate(self.customer)
+
+    def test_repeated_menu_list_is_served_from_cache(self):
+        first = self.client.get('/api/menu-items?ordering=price&limit=2')
+        with self.assertNumQueries(0):
+            second = self.client.get(
+                '/api/menu-items?limit=2&ordering=price,')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_menu_changes_invalidate_cache(self):
+        first = self.client.get(f'/api/menu-items/{self.menuitem.id}')
+        self.menuitem.title = 'Renamed'
+        self.menuitem.save()
+        second = self.client.get(f'/api/menu-items/{self.menuitem.id}')
+        self.assertEqual(second.data['title'], 'Renamed')
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    def test_conditional_get_returns_not_modified(self):
+        response = self.client.get('/api/menu-items')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/menu-items',
+                                       HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            '/api/menu-items',
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_per_process_cache_turns_the_response_cache_off(self):
+        with override_settings(LITTLELEMON_MENU_CACHE_TIMEOUT=None):
+            self.assertEqual(caching.menu_cache_timeout(), 0)
+            first = self.client.get(f'/api/menu-items/{self.menuitem.id}')
+            # a title changed by another worker, whose LocMemCache
+            # generation this process never sees
+            models.MenuItem.objects.filter(pk=self.menuitem.id).update(
+                title='Renamed')
+            second = self.client.get(f'/api/menu-items/{self.menuitem.id}')
+        self.assertEqual(second.data['title'], 'Renamed')
+        self.assertNotIn('ETag', first)
+        shared = {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                'LOCATION': 'redis://localhost:6379',
+            }
+        }
+        with override_settings(LITTLELEMON_MENU_CACHE_TIMEOUT=None,
+                               CACHES=shared):
+            self.assertEqual(caching.menu_cache_timeout(), 60 * 60)
+
+
+class KeysetPaginationTests(LittleLemonTestCase):
+
+    def walk(self, url):
+        ids, pages = [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            pages.append(response.data)
+            ids += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        return ids, pages
+
+    def test_orders_walk_every_row_once_despite_equal_dates(self):
+        orders = models.Order.objects.bulk_create([
+            models.Order(user=self.customer, total=Decimal(i % 3))
+            for i in range(12)
+        ])
+        self.client.force_authenticate(self.manager)
+        ids, pages = self.walk('/api/orders?pagination=cursor&limit=5')
+        self.assertEqual(ids, sorted((order.id for order in orders),
+                                     reverse=True))
+        self.assertEqual(len(pages), 3)
+        previous = self.client.get(pages[-1]['previous'])
+        self.assertEqual([row['id'] for row in previous.data['results']],
+                         ids[5:10])
+
+    def test_cursor_page_skips_count_query(self):
+        models.Order.objects.create(user=self.customer, total=1)
+        self.client.force_authenticate(User.objects.get(pk=self.manager.pk))
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get('/api/orders?pagination=cursor')
+        self.assertFalse(
+            [q for q in captured.captured_queries if 'COUNT' in q['sql']])
+
+    def test_menu_items_follow_requested_ordering(self):
+        menuitems = self.make_menuitems(4, price='1.00')
+        menuitems += self.make_menuitems(3, price='3.00')
+        self.client.force_authenticate(self.customer)
+        response = self.client.get(
+            '/api/menu-items?pagination=cursor&ordering=-price&limit=4')
+        prices = [row['price'] for row in response.data['results']]
+        self.assertEqual(prices, ['3.00'] * 3 + ['1.00'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNone(response.data['next'])
+
+    def test_unsupported_cursor_ordering_is_rejected(self):
+        self.client.force_authenticate(self.manager)
+        response = self.client.get(
+            '/api/orders?pagination=cursor&ordering=delivery_crew')
+        self.assertEqual(response.status_code, 400)
+
+
+class ListFilterTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.manager)
+
+    def test_unlisted_or_related_ordering_is_rejected(self):
+        for ordering in ('category__slug,-user__email', 'total', 'price,-title',
+                         'title,price', 'featured'):
+            response = self.client.get(f'/api/menu-items?ordering={ordering}')
+            self.assertEqual(response.status_code, 400, ordering)
+
+    def test_blank_ordering_falls_back_to_default(self):
+        self.make_menuitems(2)
+        for path in ('/api/menu-items', '/api/orders'):
+            default = self.client.get(path).data
+            for ordering in (',', ' , ,'):
+                response = self.client.get(path, {'ordering': ordering})
+                self.assertEqual(response.status_code, 200, (path, ordering))
+                self.assertEqual(response.data, default)
+
+    def test_index_backed_ordering_gets_tie_breaker(self):
+        request = self.client.get('/api/menu-items').wsgi_request
+        self.assertEqual(
+            MenuItemFilter(Request(request)).get_ordering(), ['id'])
+        request = self.client.get(
+            '/api/menu-items?ordering=-category,-price').wsgi_request
+        self.assertEqual(
+            MenuItemFilter(Request(request)).get_ordering(),
+            ['-category_id', '-price', '-id'])
+
+    def test_filters_are_parsed(self):
+        self.make_menuitems(2, price='1.00')
+        self.make_menuitems(2, price='4.00')
+        response = self.client.get('/api/menu-items?from_price=2&category=Main')
+        self.assertEqual(response.data['count'], 2)
+        response = self.client.get('/api/menu-items?from_price=cheap')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/orders?status=maybe')
+        self.assertEqual(response.status_code, 400)
+
+
+class MenuSearchTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor not in search.BACKENDS:
+            self.skipTest('no search index on this database')
+        desserts = models.Category.objects.create(slug='desserts',
+                                                  title='Desserts')
+        for title, category in (('Grilled chicken', self.category),
+                                ('Chicken soup', self.category),
+                                ('Lemon tart', desserts),
+                                ('Lemonade', self.category),
+                                ('Greek salad', self.category)):
+            models.MenuItem.objects.create(title=title,
+                                           price=Decimal('5.00'),
+                                           featured=False,
+                                           category=category)
+
+    def titles(self, query, **params):
+        response = self.client.get('/api/menu-items',
+                                   {'search': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['title'] for item in response.data['results']]
+
+    def test_terms_match_word_prefixes(self):
+        self.assertEqual(self.titles('chick'),
+                         ['Grilled chicken', 'Chicken soup'])
+        self.assertEqual(self.titles('CHICKEN so'), ['Chicken soup'])
+        self.assertEqual(self.titles('icken'), [])
+
+    def test_category_titles_are_searched(self):
+        self.assertEqual(self.titles('dessert'), ['Lemon tart'])
+        self.assertEqual(self.titles('main lemonade'), ['Lemonade'])
+
+    def test_title_matches_rank_first(self):
+        desserts = models.Category.objects.get(slug='desserts')
+        desserts.title = 'Desserts with lemon'
+        desserts.save()
+        models.MenuItem.objects.filter(title='Lemon tart').update(
+            category=self.category)
+        models.MenuItem.objects.create(title='Apple pie',
+                                       price=Decimal('3.00'),
+                                       featured=False,
+                                       category=desserts)
+        titles = self.titles('lemon')
+        self.assertEqual(titles[-1], 'Apple pie')
+        self.assertCountEqual(titles[:-1], ['Lemon tart', 'Lemonade'])
+
+    def test_typos_are_corrected(self):
+        self.assertEqual(self.titles('chiken'),
+                         ['Grilled chicken', 'Chicken soup'])
+        self.assertEqual(self.titles('grek slad'), ['Greek salad'])
+        self.assertEqual(self.titles('chicken sopu'), ['Chicken soup'])
+        # only terms no indexed word starts with are corrected
+        self.assertEqual(self.titles('tart'), ['Lemon tart'])
+
+    def test_index_follows_writes(self):
+        soup = models.MenuItem.objects.get(title='Chicken soup')
+        soup.title = 'Tomato soup'
+        soup.save()
+        models.MenuItem.objects.get(title='Grilled chicken').delete()
+        models.MenuItem.objects.bulk_create([
+            models.MenuItem(title='Chicken wrap',
+                            price=Decimal('6.00'),
+                            featured=False,
+                            category=self.category)
+        ])
+        self.category.title = 'Street food'
+        self.category.save()
+        self.assertEqual(self.titles('chicken'), ['Chicken wrap'])
+        self.assertEqual(self.titles('tomato street'), ['Tomato soup'])
+        # the vocabulary is reloaded once the menu changed
+        self.assertEqual(self.titles('wrapp'), ['Chicken wrap'])
+
+    def test_search_combines_with_filters_and_pagination(self):
+        self.assertEqual(self.titles('lemon', category='Main'), ['Lemonade'])
+        self.assertEqual(self.titles('lemon', ordering='title'),
+                         ['Lemon tart', 'Lemonade'])
+        response = self.client.get('/api/menu-items', {
+            'search': 'chicken',
+            'pagination': 'cursor',
+            'limit': 1
+        })
+        self.assertEqual(len(response.data['results']), 1)
+        next_page = self.client.get(response.data['next'])
+        self.assertEqual(
+            [response.data['results'][0]['title'],
+             next_page.data['results'][0]['title']],
+            ['Grilled chicken', 'Chicken soup'])
+        self.assertIsNone(next_page.data['next'])
+
+    def test_short_terms_are_ignored(self):
+        self.assertEqual(len(self.titles('a')), 5)
+
+    def test_search_queries(self):
+        self.titles('chick')
+        # the page and its count, the vocabulary is already loaded
+        with self.assertNumQueries(2):
+            self.titles('chiken', limit=2)
+
+    async def test_async_view_searches(self):
+        response = await self.async_client.get('/api/async/menu-items',
+                                               {'search': 'chiken sou'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item['title'] for item in response.json()['results']],
+            ['Chicken soup'])
+
+
+@override_settings(LITTLELEMON_MENU_SNAPSHOT_MAX_AGE=60)
+class MenuSnapshotTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.menuitems = self.make_menuitems(2)
+        self.client.force_authenticate(self.customer)
+
+    def add_to_cart(self, menuitem_id):
+        return self.client.post('/api/cart/menu-items', {
+            'menuitem_id': menuitem_id,
+            'quantity': 1
+        })
+
+    def test_cart_add_reads_the_price_from_the_snapshot(self):
+        menu_snapshot.get_snapshot()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.add_to_cart(self.menuitems[0].id)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['unit_price'], '2.50')
+        self.assertFalse([
+            query for query in queries
+            if 'LittleLemonAPI_menuitem' in query['sql']
+        ])
+
+    def test_menu_item_detail_is_served_from_the_snapshot(self):
+        menuitem = self.menuitems[0]
+        expected = serializers.MenuItemSerializer(menuitem).data
+        menu_snapshot.get_snapshot()
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/menu-items/{menuitem.id}')
+        self.assertEqual(response.data, expected)
+
+    async def test_async_menu_item_detail_is_served_from_the_snapshot(self):
+        menuitem = self.menuitems[0]
+        await sync_to_async(menu_snapshot.get_snapshot)()
+        response = await self.async_client.get(
+            f'/api/async/menu-items/{menuitem.id}')
+        self.assertEqual(response.json()['price'], '2.50')
+
+    def test_snapshot_is_replaced_when_the_menu_changes(self):
+        old = menu_snapshot.get_snapshot()
+        self.assertIs(menu_snapshot.get_snapshot(), old)
+        menuitem = self.menuitems[0]
+        menuitem.price = Decimal('4.00')
+        menuitem.save()
+        new = menu_snapshot.get_snapshot()
+        self.assertEqual(new.menuitems[menuitem.id].price, Decimal('4.00'))
+        # readers of the old snapshot are unaffected
+        self.assertEqual(old.menuitems[menuitem.id].price, Decimal('2.50'))
+        self.assertEqual(self.add_to_cart(menuitem.id).data['unit_price'],
+                         '4.00')
+
+    def test_snapshot_is_reloaded_after_max_age(self):
+        old = menu_snapshot.get_snapshot()
+        with mock.patch.object(menu_snapshot.time, 'monotonic',
+                               return_value=old.loaded_at + 60):
+            self.assertIsNot(menu_snapshot.get_snapshot(), old)
+
+    def test_per_process_cache_turns_the_snapshot_off(self):
+        shared = {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                'LOCATION': 'redis://localhost:6379',
+            }
+        }
+        with override_settings(LITTLELEMON_MENU_SNAPSHOT_MAX_AGE=None):
+            self.assertEqual(menu_snapshot.max_age(), 0)
+            self.assertIsNone(menu_snapshot.get_snapshot())
+            # a price changed by another worker, whose LocMemCache
+            # generation this process never sees
+            models.MenuItem.objects.filter(pk=self.menuitems[0].id).update(
+                price=Decimal('3.00'))
+            response = self.add_to_cart(self.menuitems[0].id)
+            self.assertEqual(response.data['unit_price'], '3.00')
+            response = self.client.get(
+                f'/api/menu-items/{self.menuitems[1].id}')
+            self.assertEqual(response.data['price'], '2.50')
+            with override_settings(CACHES=shared):
+                self.assertEqual(menu_snapshot.max_age(), 60)
+
+    def test_entries_are_read_only(self):
+        entry = menu_snapshot.get_snapshot().menuitems[self.menuitems[0].id]
+        with self.assertRaises(AttributeError):
+            entry.price = Decimal('0.01')
+        with self.assertRaises(AttributeError):
+            entry.extra = True
+        with self.assertRaises(TypeError):
+            menu_snapshot.get_snapshot().menuitems[0] = entry
+
+    def test_items_missing_from_the_snapshot_are_read_from_the_database(self):
+        menu_snapshot.get_snapshot()
+        # bulk_create sends no signals, as with a write from another process
+        # whose cache doesn't share the menu generation
+        (menuitem, ) = self.make_menuitems(1, price='3.00')
+        self.assertEqual(self.add_to_cart(menuitem.id).data['unit_price'],
+                         '3.00')
+        response = self.client.get(f'/api/menu-items/{menuitem.id}')
+        self.assertEqual(response.data['price'], '3.00')
+        self.assertEqual(self.add_to_cart(999).status_code, 404)
+
+    def test_menu_item_with_unknown_category_is_rejected(self):
+        self.client.force_authenticate(self.manager)
+        response = self.client.post(
+            '/api/menu-items', {
+                'title': 'Soup',
+                'price': '4.00',
+                'featured': False,
+                'category_id': self.category.id + 1
+            })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('category_id', response.data)
+
+
+class CartTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.menuitems = self.make_menuitems(2)
+        self.client.force_authenticate(self.customer)
+
+    def test_adding_existing_item_increments_in_database(self):
+        menuitem = self.menuitems[0]
+        self.client.post('/api/cart/menu-items', {
+            'menuitem_id': menuitem.id,
+            'quantity': 1
+        })
+        with self.assertNumQueries(4):
+            response = self.client.post('/api/cart/menu-items', {
+                'menuitem_id': menuitem.id,
+                'quantity': 2
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['quantity'], 3)
+        self.assertEqual(response.data['price'], '7.50')
+        cart = models.Cart.objects.get(user=self.customer)
+        self.assertEqual((cart.quantity, cart.price), (3, Decimal('7.50')))
+
+    def test_adding_unknown_item_returns_not_found(self):
+        response = self.client.post('/api/cart/menu-items', {
+            'menuitem_id': 999,
+            'quantity': 1
+        })
+        self.assertEqual(response.status_code, 404)
+
+    def test_clearing_cart_is_one_delete(self):
+        self.fill_cart(self.customer, self.menuitems)
+        with self.assertNumQueries(1):
+            response = self.client.delete('/api/cart/menu-items')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(models.Cart.objects.exists())
+
+    def test_summary_is_one_aggregate(self):
+        response = self.client.get('/api/cart/summary')
+        self.assertEqual(response.data, {'item_count': 0, 'total': '0.00'})
+        self.fill_cart(self.customer, self.menuitems, quantity=3)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/cart/summary')
+        self.assertEqual(response.data, {'item_count': 6, 'total': '15.00'})
+
+
+class AsyncReadViewTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.make_menuitems(7)
+        self.order = models.Order.objects.create(user=self.customer,
+                                                 total=Decimal('5.00'))
+        self.token = Token.objects.create(user=self.customer)
+        self.headers = {'Authorization': f'Token {self.token.key}'}
+
+    def test_loadtest_rejects_too_few_requests(self):
+        for args in (['--requests', '1'], ['--concurrency', '0']):
+            with self.assertRaises(CommandError):
+                call_command('loadtest', *args, stdout=io.StringIO())
+
+    async def test_menu_list_matches_sync_view(self):
+        expected = await sync_to_async(self.client.get)(
+            '/api/menu-items?ordering=price&limit=3&offset=3')
+        response = await self.async_client.get(
+            '/api/async/menu-items?ordering=price&limit=3&offset=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'],
+                         expected.json()['results'])
+        self.assertEqual(response.json()['count'], 7)
+        self.assertIn('offset=6', response.json()['next'])
+
+    async def test_order_endpoints_apply_role_visibility(self):
+        response = await self.async_client.get('/api/async/orders',
+                                               headers=self.headers)
+        self.assertEqual(response.json()['count'], 1)
+        response = await self.async_client.get(
+            f'/api/async/orders/{self.order.id}', headers=self.headers)
+        self.assertEqual(response.json()['id'], self.order.id)
+        other = await Token.objects.acreate(user=self.crew)
+        response = await self.async_client.get(
+            f'/api/async/orders/{self.order.id}',
+            headers={'Authorization': f'Token {other.key}'})
+        self.assertEqual(response.status_code, 403)
+
+    async def test_authentication_is_required_for_cart(self):
+        response = await self.async_client.get('/api/async/cart/menu-items')
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(
+            '/api/async/cart/menu-items',
+            headers={'Authorization': 'Token invalid'})
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get('/api/async/cart/menu-items',
+                                               headers=self.headers)
+        self.assertEqual(response.json()['count'], 0)
+
+
+class OrderEventsTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.order = models.Order.objects.create(user=self.customer,
+                                                 total=Decimal('5.00'))
+        self.token = Token.objects.create(user=self.customer)
+        self.headers = {'Authorization': f'Token {self.token.key}'}
+
+    def assign_crew(self):
+        self.client.force_authenticate(self.manager)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/orders/{self.order.id}',
+                                         {'delivery_crew_id': self.crew.pk})
+        self.assertEqual(response.status_code, 200)
+
+    async def next_event(self, stream):
+        chunk = await asyncio.wait_for(anext(stream), 1)
+        event, data = chunk.decode().strip().split('\n')
+        self.assertEqual(event, 'event: order')
+        return json.loads(data.removeprefix('data: '))
+
+    async def test_order_changes_are_pushed(self):
+        response = await self.async_client.get(
+            f'/api/async/orders/{self.order.id}/events', headers=self.headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await self.next_event(stream), {
+            'id': self.order.id,
+            'status': False,
+            'delivery_crew': None
+        })
+        await sync_to_async(self.assign_crew)()
+        self.assertEqual(await self.next_event(stream), {
+            'id': self.order.id,
+            'status': False,
+            'delivery_crew': self.crew.pk
+        })
+        await stream.aclose()
+        await sync_to_async(response.close)()
+
+    async def test_changes_before_the_stream_starts_are_not_lost(self):
+        response = await self.async_client.get(
+            f'/api/async/orders/{self.order.id}/events', headers=self.headers)
+        channel = events.order_channel(self.order.id)
+        # nothing is subscribed until the body is read
+        self.assertNotIn(channel, events.get_broker().subscriptions)
+        await sync_to_async(self.assign_crew)()
+        stream = aiter(response.streaming_content)
+        self.assertEqual((await self.next_event(stream))['delivery_crew'],
+                         self.crew.pk)
+        self.assertIn(channel, events.get_broker().subscriptions)
+        await stream.aclose()
+        # as the ASGI handler does once the client is gone
+        await sync_to_async(response.close)()
+        self.assertNotIn(channel, events.get_broker().subscriptions)
+
+    async def test_other_customers_cannot_listen(self):
+        other = await Token.objects.acreate(user=self.crew)
+        response = await self.async_client.get(
+            f'/api/async/orders/{self.order.id}/events',
+            headers={'Authorization': f'Token {other.key}'})
+        self.assertEqual(response.status_code, 403)
+
+
+class OrderExportTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        menuitems = self.make_menuitems(2)
+        for status in (False, False, True, False, True):
+            order = models.Order.objects.create(user=self.customer,
+                                                status=status,
+                                                total=Decimal('5.00'))
+            models.OrderItem.objects.bulk_create([
+                models.OrderItem(order=order,
+                                 menuitem=menuitem,
+                                 quantity=1,
+                                 unit_price=menuitem.price,
+                                 price=menuitem.price)
+                for menuitem in menuitems
+            ])
+
+    def test_ndjson_export_streams_filtered_orders(self):
+        self.client.force_authenticate(User.objects.get(pk=self.manager.pk))
+        with mock.patch.object(views.OrderExportView, 'export_chunk_size', 2):
+            response = self.client.get('/api/orders/export?status=0')
+            # one cursor over the orders plus one prefetch per chunk
+            with self.assertNumQueries(3):
+                lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(response['Content-Type'],
+                         'application/x-ndjson; charset=utf-8')
+        orders = [json.loads(line) for line in lines]
+        self.assertEqual(len(orders), 3)
+        self.assertTrue(all(len(order['orderitems']) == 2 for order in orders))
+
+    def test_csv_export_has_a_row_per_order_item(self):
+        self.client.force_authenticate(self.manager)
+        response = self.client.get('/api/orders/export?format=csv')
+        rows = list(csv.reader(
+            b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:2], ['order_id', 'user_id'])
+        self.assertEqual(len(rows), 11)
+
+    def test_export_is_manager_only(self):
+        self.client.force_authenticate(self.customer)
+        response = self.client.get('/api/orders/export')
+        self.assertEqual(response.status_code, 403)
+
+
+class SalesAnalyticsTests(LittleLemonTestCase):
+
+    def checkout(self, user, menuitems, quantity):
+        self.fill_cart(user, menuitems, quantity=quantity)
+        self.client.force_authenticate(user)
+        self.client.post('/api/orders')
+        jobs.run_pending()
+
+    def test_checkout_updates_rollups_read_by_dashboard(self):
+        menuitems = self.make_menuitems(3)
+        self.checkout(self.customer, menuitems[:2], quantity=1)
+        self.checkout(self.customer, menuitems[1:], quantity=3)
+        models.Order.objects.update(delivery_crew=self.crew)
+        self.client.force_authenticate(self.manager)
+        response = self.client.get('/api/analytics')
+        self.assertEqual(response.status_code, 200)
+        day = response.data['revenue_per_day'][0]
+        self.assertEqual((day['order_count'], day['item_count'],
+                          day['revenue']), (2, 8, '20.00'))
+        self.assertEqual(response.data['average_basket'], {
+            'items': '4.00',
+            'revenue': '10.00'
+        })
+        top = response.data['top_menu_items'][0]
+        self.assertEqual((top['menuitem_id'], top['quantity']),
+                         (menuitems[1].id, 4))
+        self.assertEqual(response.data['delivery_crew_workload'][0], {
+            'delivery_crew_id': self.crew.id,
+            'username': 'crew',
+            'open_orders': 2,
+            'delivered_orders': 0
+        })
+
+    def test_rebuild_matches_incremental_rollups(self):
+        menuitems = self.make_menuitems(3)
+        self.checkout(self.customer, menuitems, quantity=2)
+        self.checkout(self.manager, menuitems[:1], quantity=1)
+        fields = ('date', 'order_count', 'item_count', 'revenue')
+        incremental = list(models.DailySales.objects.values_list(*fields))
+        per_item = list(
+            models.DailyMenuItemSales.objects.order_by('menuitem').values_list(
+                'menuitem', 'quantity', 'revenue'))
+        call_command('rebuild_daily_sales', stdout=io.StringIO())
+        self.assertEqual(list(models.DailySales.objects.values_list(*fields)),
+                         incremental)
+        self.assertEqual(
+            list(
+                models.DailyMenuItemSales.objects.order_by(
+                    'menuitem').values_list('menuitem', 'quantity',
+                                            'revenue')), per_item)
+
+    def test_upsert_and_fallback_rollups_agree(self):
+        menuitems = self.make_menuitems(3)
+        fields = ('date', 'order_count', 'item_count', 'revenue')
+        results = []
+        for supports_upsert, queries in ((True, 2), (False, 4)):
+            # the checkout throttle
+            cache.clear()
+            models.DailySales.objects.all().delete()
+            models.DailyMenuItemSales.objects.all().delete()
+            with mock.patch.object(connection.features,
+                                   'supports_update_conflicts_with_target',
+                                   supports_upsert):
+                self.checkout(self.customer, menuitems, quantity=2)
+                # the second order increments the existing rows
+                with CaptureQueriesContext(connection) as captured:
+                    self.checkout(self.customer, menuitems[:1], quantity=1)
+            rollup_queries = [
+                query for query in captured.captured_queries
+                if '"LittleLemonAPI_daily' in query['sql']
+            ]
+            self.assertEqual(len(rollup_queries), queries)
+            results.append((
+                list(models.DailySales.objects.values_list(*fields)),
+                list(
+                    models.DailyMenuItemSales.objects.order_by(
+                        'menuitem').values_list('menuitem', 'quantity',
+                                                'revenue')),
+            ))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0][0][0][1:], (2, 7, Decimal('17.50')))
+
+    def test_analytics_is_manager_only(self):
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get('/api/analytics').status_code, 403)
+
+
+class OrderArchiveTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.menuitems = self.make_menuitems(2)
+        self.today = timezone.localdate()
+        self.cutoff = self.today - timedelta(days=30)
+
+    def make_order(self, user, delivered, days_ago):
+        order = models.Order.objects.create(user=user,
+                                            delivery_crew=self.crew,
+                                            status=delivered,
+                                            total=Decimal('5.00'))
+        models.OrderItem.objects.bulk_create([
+            models.OrderItem(order=order,
+                             menuitem=menuitem,
+                             quantity=1,
+                             unit_price=menuitem.price,
+                             price=menuitem.price)
+            for menuitem in self.menuitems
+        ])
+        # date is auto_now, so backdate it with an update
+        models.Order.objects.filter(pk=order.pk).update(
+            date=self.today - timedelta(days=days_ago))
+        return order.pk
+
+    def archive(self, before, *args):
+        out = io.StringIO()
+        call_command('archive_orders', '--before', before.isoformat(), *args,
+                     stdout=out)
+        return out.getvalue().strip()
+
+    def orders(self, user, query=''):
+        self.client.force_authenticate(user)
+        response = self.client.get(f'/api/orders?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_delivered_orders_before_the_date_are_moved_in_batches(self):
+        old = [self.make_order(self.customer, True, 60) for _ in range(3)]
+        open_old = self.make_order(self.customer, False, 60)
+        recent = self.make_order(self.customer, True, 1)
+        self.assertEqual(self.archive(self.cutoff, '--batch-size', '2'),
+                         'Archived 3 order(s).')
+        self.assertCountEqual(models.Order.objects.values_list('id',
+                                                               flat=True),
+                              [open_old, recent])
+        self.assertCountEqual(
+            models.ArchivedOrder.objects.values_list('id', flat=True), old)
+        self.assertEqual(
+            models.ArchivedOrderItem.objects.filter(order__in=old).count(), 6)
+        self.assertFalse(models.OrderItem.objects.filter(order__in=old))
+        self.assertEqual(self.archive(self.cutoff), 'Archived 0 order(s).')
+
+    def test_order_list_reads_the_archive_only_when_asked(self):
+        archived = self.make_order(self.customer, True, 60)
+        self.make_order(self.manager, True, 60)
+        live = self.make_order(self.customer, False, 60)
+        before = self.orders(self.customer)
+        self.archive(self.cutoff)
+        self.assertEqual([order['id'] for order in self.orders(self.customer)],
+                         [live])
+        # newest first, then by id, as without the archive
+        with_archive = self.orders(self.customer, 'include_archived=1')
+        self.assertEqual(with_archive, before)
+        self.assertEqual([order['id'] for order in with_archive],
+                         [live, archived])
+        self.assertEqual(len(with_archive[1]['orderitems']), 2)
+        self.assertEqual(
+            [
+                order['id'] for order in self.orders(
+                    self.customer, 'include_archived=1&status=1')
+            ], [archived])
+        self.assertEqual(
+            len(self.orders(self.manager, 'include_archived=1&limit=1')), 1)
+        self.assertEqual(len(self.orders(self.manager, 'include_archived=1')),
+                         3)
+
+    def test_include_archived_is_validated(self):
+        self.client.force_authenticate(self.customer)
+        for query in ('include_archived=yes',
+                      'include_archived=1&pagination=cursor'):
+            response = self.client.get(f'/api/orders?{query}')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('include_archived', response.data)
+
+    def test_invalid_date_is_rejected(self):
+        with self.assertRaises(CommandError):
+            call_command('archive_orders', '--before', 'yesterday')
+
+    def test_rebuild_counts_archived_orders(self):
+        self.make_order(self.customer, True, 0)
+        self.make_order(self.customer, False, 0)
+        call_command('rebuild_daily_sales', stdout=io.StringIO())
+        fields = ('date', 'order_count', 'item_count', 'revenue')
+        daily = list(models.DailySales.objects.values_list(*fields))
+        per_item = list(
+            models.DailyMenuItemSales.objects.order_by('menuitem').values_list(
+                'menuitem', 'quantity', 'revenue'))
+        self.assertEqual(daily, [(self.today, 2, 4, Decimal('10.00'))])
+        self.assertEqual(self.archive(self.today + timedelta(days=1)),
+                         'Archived 1 order(s).')
+        call_command('rebuild_daily_sales', stdout=io.StringIO())
+        self.assertEqual(list(models.DailySales.objects.values_list(*fields)),
+                         daily)
+        self.assertEqual(
+            list(
+                models.DailyMenuItemSales.objects.order_by(
+                    'menuitem').values_list('menuitem', 'quantity',
+                                            'revenue')), per_item)
+
+
+class JobQueueTests(LittleLemonTestCase):
+
+    def checkout(self):
+        self.fill_cart(self.customer, self.make_menuitems(2), quantity=1)
+        self.client.force_authenticate(self.customer)
+        response = self.client.post('/api/orders')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def flaky_task(self, calls, failures):
+
+        def flaky(n):
+            calls.append(n)
+            if len(calls) <= failures:
+                raise ValueError('mail server offline')
+
+        return {'flaky': (flaky, 3)}
+
+    def test_checkout_queues_side_effects_for_the_worker(self):
+        self.customer.email = 'customer@example.com'
+        self.customer.save()
+        order_id = self.checkout()
+        self.assertCountEqual(
+            models.Job.objects.values_list('task', flat=True),
+            tasks.ORDER_PLACED_TASKS)
+        self.assertFalse(models.DailySales.objects.exists())
+        self.assertEqual(mail.outbox, [])
+        with mock.patch.object(events.InMemoryBroker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(jobs.run_pending(), (4, 0))
+        self.assertFalse(models.Job.objects.exists())
+        self.assertEqual(models.DailySales.objects.get().order_count, 1)
+        self.assertEqual(mail.outbox[0].to, ['customer@example.com'])
+        self.assertEqual(mail.outbox[0].subject,
+                         f'Little Lemon order #{order_id}')
+        self.assertIn('Total  5.00', mail.outbox[0].body)
+        channels = {call.args[0]: call.args[1] for call in publish.mock_calls}
+        self.assertEqual(len(channels[events.KITCHEN_CHANNEL]['items']), 2)
+        self.assertEqual(channels[events.DELIVERY_CREW_CHANNEL]['id'],
+                         order_id)
+
+    def test_jobs_roll_back_with_the_transaction(self):
+        order = models.Order.objects.create(user=self.customer, total=0)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            tasks.order_placed(order)
+            raise RuntimeError
+        self.assertFalse(models.Job.objects.exists())
+
+    def test_unknown_task_is_rejected(self):
+        with self.assertRaises(LookupError):
+            jobs.enqueue('missing', order_id=1)
+
+    def test_failed_job_is_retried_with_backoff_until_out_of_attempts(self):
+        calls = []
+        with mock.patch.dict(jobs.TASKS, self.flaky_task(calls, 3)):
+            jobs.enqueue('flaky', n=1)
+            self.assertEqual(jobs.run_pending(), (1, 1))
+            job = models.Job.objects.get()
+            self.assertEqual((job.status, job.attempts),
+                             (models.Job.QUEUED, 1))
+            self.assertIn('mail server offline', job.last_error)
+            self.assertGreater(job.run_at, timezone.now())
+            # not due yet
+            self.assertEqual(jobs.run_pending(), (0, 0))
+            for _ in range(2):
+                models.Job.objects.update(run_at=timezone.now())
+                self.assertEqual(jobs.run_pending(), (1, 1))
+            job = models.Job.objects.get()
+            self.assertEqual((job.status, job.attempts),
+                             (models.Job.FAILED, 3))
+        self.assertEqual(calls, [1, 1, 1])
+
+    def test_retry_delay_doubles_up_to_the_cap(self):
+        for attempts, low, high in ((1, 5, 10), (4, 40, 80),
+                                    (20, 1800, 3600)):
+            delay = jobs.retry_delay(attempts).total_seconds()
+            self.assertTrue(low <= delay <= high, (attempts, delay))
+
+    def test_jobs_of_a_dead_worker_are_requeued(self):
+        calls = []
+        with mock.patch.dict(jobs.TASKS, self.flaky_task(calls, 0)):
+            jobs.enqueue('flaky', n=1)
+            jobs.claim(10)
+            self.assertEqual(jobs.requeue_stale(600), 0)
+            models.Job.objects.update(locked_at=timezone.now() -
+                                      timedelta(seconds=601))
+            self.assertEqual(jobs.requeue_stale(600), 1)
+            self.assertEqual(jobs.run_pending(), (1, 0))
+        self.assertEqual(calls, [1])
+
+
+class RunWorkerTests(TransactionTestCase):
+
+    def test_worker_drains_the_queue_on_a_thread_pool(self):
+        calls = []
+        claimed = []
+        limits = []
+        threads = set()
+        # the test database is a shared in-memory SQLite database, whose
+        # table locks don't wait for the busy timeout, so the pool threads
+        # take turns at the database; the claiming and bookkeeping across
+        # threads is what's under test
+        db_lock = threading.Lock()
+        claim, run = jobs.claim, jobs.run
+
+        def locked_claim(limit):
+            with db_lock:
+                limits.append(limit)
+                batch = claim(limit)
+                claimed.extend(job.pk for job in batch)
+                return batch
+
+        def locked_run(job):
+            with db_lock:
+                return run(job)
+
+        def record(n):
+            threads.add(threading.current_thread().name)
+            calls.append(n)
+            time.sleep(0.01)
+
+        with mock.patch.dict(jobs.TASKS, {'record': (record, 1)}), \
+                mock.patch.object(jobs, 'claim', locked_claim), \
+                mock.patch.object(jobs, 'run', locked_run):
+            jobs.enqueue_many([('record', {'n': n}) for n in range(30)])
+            out = io.StringIO()
+            call_command('run_worker', '--once', '--threads', '3', stdout=out)
+        # no job claimed twice or lost
+        self.assertEqual(len(claimed), len(set(claimed)))
+        self.assertEqual(sorted(calls), list(range(30)))
+        self.assertTrue(all(1 <= limit <= 3 for limit in limits), limits)
+        self.assertGreater(len(threads), 1)
+        self.assertEqual(out.getvalue().strip(), 'Ran 30 job(s), 0 failed.')
+        self.assertFalse(models.Job.objects.exists())
+
+
+class MenuImportTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        models.Category.objects.create(slug='drinks', title='Drinks')
+        self.existing = self.make_menuitems(1)[0]
+        self.client.force_authenticate(self.manager)
+
+    def test_json_import_upserts_by_title_with_row_errors(self):
+        response = self.client.post('/api/menu-items/bulk', [
+            {'title': 'Dish 0', 'price': '9.00', 'category': 'drinks'},
+            {'title': 'Lemonade', 'price': '3.50', 'category': 'drinks',
+             'featured': True},
+            {'title': 'Soup', 'price': 'free', 'category': 'main'},
+            {'title': 'Stew', 'price': '7.00', 'category': 'desserts'},
+            {'title': 'Pie', 'price': '4.00', 'category_id':
+             self.category.id},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated']),
+                         (2, 1))
+        self.assertEqual([error['row'] for error in response.data['errors']],
+                         [3, 4])
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.price, Decimal('9.00'))
+        self.assertEqual(self.existing.category.slug, 'drinks')
+        self.assertTrue(
+            models.MenuItem.objects.get(title='Lemonade').featured)
+
+    def test_rows_without_featured_keep_the_existing_flag(self):
+        models.MenuItem.objects.filter(pk=self.existing.id).update(
+            featured=True)
+        upload = io.BytesIO('title,price,category\n'
+                            f'{self.existing.title},6.00,main\n'
+                            'Salad,4.00,main\n'.encode())
+        upload.name = 'menu.csv'
+        response = self.client.post('/api/menu-items/bulk', {'file': upload})
+        self.assertEqual((response.data['created'], response.data['updated']),
+                         (1, 1))
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.price, Decimal('6.00'))
+        self.assertTrue(self.existing.featured)
+        self.assertFalse(models.MenuItem.objects.get(title='Salad').featured)
+
+    def test_csv_upload_resolves_categories_once_per_batch(self):
+        upload = io.BytesIO(b'title,price,featured,category\n' + b''.join(
+            f'Item {i},1.00,,main\n'.encode() for i in range(50)))
+        upload.name = 'menu.csv'
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post('/api/menu-items/bulk',
+                                        {'file': upload})
+        self.assertEqual(response.data['created'], 50)
+        category_queries = [
+            query for query in captured.captured_queries
+            if 'FROM "LittleLemonAPI_category"' in query['sql']
+        ]
+        self.assertEqual(len(category_queries), 1)
+
+    def test_import_command_streams_ndjson_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as stream:
+            for i in range(5):
+                stream.write(json.dumps({
+                    'title': f'Special {i}',
+                    'price': '2.00',
+                    'category': 'main'
+                }) + '\n')
+            stream.flush()
+            out = io.StringIO()
+            call_command('import_menu', stream.name, batch_size=2, stdout=out)
+        self.assertIn('Created 5, updated 0', out.getvalue())
+        self.assertEqual(
+            models.MenuItem.objects.filter(title__startswith='Special').count(),
+            5)
+
+
+class IdempotencyTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.menuitems = self.make_menuitems(2)
+        self.client.force_authenticate(self.customer)
+
+    def post(self, path, data=None, key='retry-1'):
+        return self.client.post(path, data, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_checkout_retries_replay_the_first_response(self):
+        self.fill_cart(self.customer, self.menuitems)
+        first = self.post('/api/orders')
+        self.assertEqual(first.status_code, 201)
+        # more retries than the checkout throttle allows, without queries
+        for _ in range(4):
+            with self.assertNumQueries(0):
+                retry = self.post('/api/orders')
+            self.assertEqual(retry.status_code, 201)
+            self.assertEqual(retry['Idempotent-Replayed'], 'true')
+            self.assertEqual(retry.content, first.content)
+        self.assertEqual(models.Order.objects.count(), 1)
+        # a new key is a new checkout, and the cart is empty by now
+        self.assertEqual(self.post('/api/orders', key='retry-2').status_code,
+                         404)
+
+    def test_cart_add_is_applied_once(self):
+        data = {'menuitem_id': self.menuitems[0].id, 'quantity': 2}
+        for _ in range(3):
+            self.assertEqual(
+                self.post('/api/cart/menu-items', data).status_code, 201)
+        self.assertEqual(models.Cart.objects.get().quantity, 2)
+        data['quantity'] = 3
+        response = self.post('/api/cart/menu-items', data)
+        self.assertEqual(response.status_code, 422)
+
+    def test_menu_create_is_applied_once(self):
+        self.client.force_authenticate(self.manager)
+        data = {'title': 'Soup', 'price': '4.00', 'featured': False,
+                'category_id': self.category.id}
+        responses = [self.post('/api/menu-items', data) for _ in range(2)]
+        self.assertEqual([response.status_code for response in responses],
+                         [201, 201])
+        self.assertEqual(models.MenuItem.objects.filter(title='Soup').count(),
+                         1)
+
+    def test_keys_are_per_user(self):
+        self.fill_cart(self.customer, self.menuitems)
+        self.fill_cart(self.manager, self.menuitems)
+        self.assertEqual(self.post('/api/orders').status_code, 201)
+        self.client.force_authenticate(self.manager)
+        response = self.post('/api/orders')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(models.Order.objects.count(), 2)
+
+    def test_errors_are_not_stored(self):
+        response = self.post('/api/cart/menu-items', {'quantity': 1})
+        self.assertEqual(response.status_code, 400)
+        response = self.post('/api/cart/menu-items', {
+            'menuitem_id': self.menuitems[0].id,
+            'quantity': 1
+        })
+        self.assertEqual(response.status_code, 201)
+
+    def test_concurrent_retry_gets_conflict(self):
+        key = f'littlelemon:idempotency:{self.customer.pk}:/api/orders:retry-1'
+        idempotency.get_store().add(key, {
+            'fingerprint': idempotency.fingerprint({}),
+            'status': None
+        })
+        self.assertEqual(self.post('/api/orders').status_code, 409)
+
+    def test_long_keys_are_rejected(self):
+        response = self.post('/api/orders', key='x' * 256)
+        self.assertEqual(response.status_code, 400)
+
+    def test_local_store_is_bounded(self):
+        store = idempotency.LocalIdempotencyStore(max_entries=2, timeout=60)
+        for key in ('a', 'b', 'c'):
+            self.assertTrue(store.add(key, key))
+        self.assertFalse(store.add('c', 'again'))
+        self.assertEqual([store.get(key) for key in ('a', 'b', 'c')],
+                         [None, 'b', 'c'])
+
+    def test_cache_store(self):
+        with override_settings(LITTLELEMON_IDEMPOTENCY_STORE={
+                'BACKEND': 'LittleLemonAPI.idempotency.CacheIdempotencyStore'
+        }):
+            self.fill_cart(self.customer, self.menuitems)
+            first = self.post('/api/orders')
+            retry = self.post('/api/orders')
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.content, first.content)
+
+
+class ThrottlingTests(LittleLemonTestCase):
+
+    def make_throttle(self, now):
+        throttle = throttling.UserRateThrottle()
+        throttle.rate = '3/minute'
+        throttle.num_requests, throttle.duration = 3, 60
+        throttle.timer = lambda: now
+        return throttle
+
+    def allowed(self, now):
+        request = APIRequestFactory().get('/')
+        request.user = self.customer
+        return self.make_throttle(now).allow_request(request, None)
+
+    def test_sliding_window_weights_previous_window(self):
+        self.assertEqual([self.allowed(600 + i) for i in range(4)],
+                         [True, True, True, False])
+        # half-way through the next window: 4 * 0.5 + 1 = 3
+        self.assertTrue(self.allowed(690))
+        self.assertFalse(self.allowed(691))
+        self.assertTrue(self.allowed(800))
+
+    def test_sqlite_store_is_shared_between_instances(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/throttle.sqlite3'
+            first = throttling.SQLiteThrottleStore(path)
+            second = throttling.SQLiteThrottleStore(path)
+            self.assertEqual(first.incr('key', 60), 1)
+            self.assertEqual(second.incr('key', 60), 2)
+            self.assertEqual(first.get('key'), 2)
+            self.assertEqual(second.incr('short', -1), 1)
+            self.assertEqual(second.incr('short', 60), 1)
+            with override_settings(LITTLELEMON_THROTTLE_STORE={
+                    'BACKEND': 'LittleLemonAPI.throttling.SQLiteThrottleStore',
+                    'OPTIONS': {'path': path}
+            }):
+                self.assertEqual([self.allowed(600) for _ in range(4)],
+                                 [True, True, True, False])
+                self.assertEqual(first.get(f'littlelemon:throttle:user:'
+                                           f'{self.customer.pk}:10'), 4)
+
+    def test_checkout_has_its_own_stricter_scope(self):
+        self.client.force_authenticate(self.customer)
+        codes = [self.client.post('/api/orders').status_code for _ in range(4)]
+        self.assertEqual(codes, [404, 404, 404, 429])
+        self.assertEqual(self.client.get('/api/orders').status_code, 200)
+
+
+class ProfilingTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        profiling.store.clear()
+        models.Order.objects.create(user=self.customer, total=Decimal('1.00'))
+        self.client.force_authenticate(self.manager)
+
+    def test_sampled_requests_get_server_timing(self):
+        response = self.client.get('/api/orders')
+        self.assertNotIn('Server-Timing', response)
+        with override_settings(LITTLELEMON_PROFILING={'SAMPLE_RATE': 1}):
+            response = self.client.get('/api/orders')
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", '
+            r'serializer;dur=[\d.]+$')
+        admin = User.objects.create_user('admin', is_staff=True)
+        self.client.force_authenticate(admin)
+        stats = self.client.get('/api/profiling').data
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]['requests'], 1)
+        self.assertGreater(stats[0]['serializer_ms'], 0)
+        self.client.force_authenticate(self.manager)
+        self.assertEqual(self.client.get('/api/profiling').status_code, 403)
+
+    def test_app_serializers_are_timed_without_patching_drf(self):
+        self.assertFalse(hasattr(drf_serializers.Serializer.data.fget,
+                                 'profiled'))
+        self.fill_cart(self.customer, self.make_menuitems(3))
+        self.client.force_authenticate(self.customer)
+        profile = profiling.RequestProfile()
+        token = profiling.current_profile.set(profile)
+        try:
+            response = self.client.get('/api/cart/menu-items')
+        finally:
+            profiling.current_profile.reset(token)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertGreater(profile.serializer_time, 0)
+        self.assertFalse(profile.serializing)
+
+    async def test_async_requests_are_sampled_without_a_thread(self):
+
+        async def get_response(request):
+            count = await models.Order.objects.acount()
+            return HttpResponse(str(count))
+
+        middleware = profiling.ProfilingMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        self.assertFalse(
+            iscoroutinefunction(profiling.ProfilingMiddleware(lambda r: r)))
+        with override_settings(LITTLELEMON_PROFILING={'SAMPLE_RATE': 1}):
+            response = await middleware(
+                AsyncRequestFactory().get('/api/async/orders'))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+        self.assertEqual(profiling.store.stats()[0]['view'],
+                         '/api/async/orders')
+
+    def test_repeated_queries_are_reported(self):
+        models.Order.objects.create(user=self.customer, total=Decimal('1.00'))
+        profile = profiling.RequestProfile()
+        with connection.execute_wrapper(profile):
+            # get_orderitem without the prefetch: one query per order
+            for order in models.Order.objects.filter(pk__in=[1, 2, 3]):
+                list(order.orderitem_set.all())
+        self.assertEqual(list(profile.duplicates().values()), [2])
+        self.assertEqual(
+            profiling.fingerprint('SELECT 1 WHERE id IN (%s, %s, %s)'),
+            'SELECT 1 WHERE id IN (...)')
+
+
+class DatabaseProfileTests(LittleLemonTestCase):
+
+    def test_sqlite_pragmas_are_applied_on_connect(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        pragmas = settings.LITTLELEMON_SQLITE_PRAGMAS
+        with connection.cursor() as cursor:
+            self.assertEqual(
+                cursor.execute('PRAGMA busy_timeout').fetchone(),
+                (pragmas['busy_timeout'], ))
+            # synchronous/journal_mode can't change inside the test's
+            # transaction, busy_timeout can
+            for timeout in (1234, pragmas['busy_timeout']):
+                with override_settings(
+                        LITTLELEMON_SQLITE_PRAGMAS={'busy_timeout': timeout}):
+                    db.configure_sqlite(sender=None, connection=connection)
+                self.assertEqual(
+                    cursor.execute('PRAGMA busy_timeout').fetchone(),
+                    (timeout, ))
+
+
+class FastSerializerTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        drinks = models.Category.objects.create(slug='drinks',
+                                                title='Drinks')
+        self.menuitems = models.MenuItem.objects.bulk_create([
+            models.MenuItem(title='Soup',
+                            price=Decimal('4'),
+                            featured=True,
+                            category=self.category),
+            models.MenuItem(title='Lemonade "fresh"',
+                            price=Decimal('0.5'),
+                            featured=False,
+                            category=drinks),
+            models.MenuItem(title='Platter',
+                            price=Decimal('9999.99'),
+                            featured=False,
+                            category=self.category),
+        ])
+        orders = models.Order.objects.bulk_create([
+            models.Order(user=self.customer,
+                         delivery_crew=self.crew,
+                         status=True,
+                         total=Decimal('12.10')),
+            models.Order(user=self.customer, total=Decimal('0')),
+            models.Order(user=self.manager, total=Decimal('3.33')),
+        ])
+        models.OrderItem.objects.bulk_create([
+            models.OrderItem(order=order,
+                             menuitem=menuitem,
+                             quantity=quantity,
+                             unit_price=menuitem.price,
+                             price=menuitem.price * quantity)
+            for order, menuitem, quantity in ((orders[0], self.menuitems[0], 3),
+                                              (orders[0], self.menuitems[1], 1),
+                                              (orders[2], self.menuitems[2], 1))
+        ])
+
+    def assertSameJSON(self, queryset, serializer_class, fast_serializer_class):
+        renderer = JSONRenderer()
+        fast = fast_serializer_class()
+        self.assertEqual(
+            renderer.render(fast.data(fast.rows(queryset))),
+            renderer.render(serializer_class(queryset, many=True).data))
+
+    def test_menu_items_match_menu_item_serializer(self):
+        self.assertSameJSON(
+            models.MenuItem.objects.select_related('category').order_by('id'),
+            serializers.MenuItemSerializer, fastpath.MenuItemListSerializer)
+
+    def test_orders_match_order_serializer(self):
+        self.assertSameJSON(views.order_queryset().order_by('id'),
+                            serializers.OrderSerializer,
+                            fastpath.OrderListSerializer)
+
+    def test_list_endpoints_use_the_fast_path(self):
+        self.client.force_authenticate(self.manager)
+        for path, queryset, serializer_class in (
+            ('/api/menu-items?ordering=title',
+             models.MenuItem.objects.order_by('title', 'id')[:5],
+             serializers.MenuItemSerializer),
+            ('/api/orders?pagination=cursor',
+             views.order_queryset().order_by('-date', '-id')[:5],
+             serializers.OrderSerializer),
+        ):
+            with mock.patch.object(serializer_class,
+                                   'to_representation') as drf_path:
+                response = self.client.get(path)
+            drf_path.assert_not_called()
+            self.assertEqual(response.data['results'],
+                             serializer_class(queryset, many=True).data)
+
+    def test_writes_use_the_model_serializer(self):
+        self.fill_cart(self.customer, self.menuitems[:1])
+        self.client.force_authenticate(self.customer)
+        response = self.client.post('/api/orders')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            response.data,
+            serializers.OrderSerializer(
+                views.order_queryset().get(pk=response.data['id'])).data)
+
+    def test_fast_path_matches_drf_on_generated_rows(self):
+        # the rows manage.py benchmark times; rows/s are reported there
+        menuitems = self.make_menuitems(200)
+        orders = models.Order.objects.bulk_create([
+            models.Order(user=self.customer, total=Decimal('5.00'))
+            for _ in range(200)
+        ])
+        models.OrderItem.objects.bulk_create([
+            models.OrderItem(order=order,
+                             menuitem=menuitem,
+                             quantity=1,
+                             unit_price=menuitem.price,
+                             price=menuitem.price) for order in orders
+            for menuitem in menuitems[:2]
+        ])
+        self.assertSameJSON(
+            models.MenuItem.objects.select_related('category').order_by('id'),
+            serializers.MenuItemSerializer, fastpath.MenuItemListSerializer)
+        self.assertSameJSON(views.order_queryset().order_by('id'),
+                            serializers.OrderSerializer,
+                            fastpath.OrderListSerializer)
+
+@override_settings(LITTLELEMON_READ_REPLICA='replica')
+class ReplicaRoutingTests(LittleLemonTestCase):
+    # the replica test database is a separate, empty database, so rows
+    # written to the primary are "not replicated yet"
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        super().setUp()
+        menuitem = self.make_menuitems(1)[0]
+        self.order = models.Order.objects.create(user=self.customer,
+                                                 total=Decimal('2.50'))
+        models.OrderItem.objects.create(order=self.order,
+                                        menuitem=menuitem,
+                                        quantity=1,
+                                        unit_price=menuitem.price,
+                                        price=menuitem.price)
+        self.client.force_authenticate(self.customer)
+
+    def test_list_reads_go_to_the_replica(self):
+        response = self.client.get('/api/orders')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+        self.assertIsNone(routers.read_alias.get())
+
+    def test_writes_pin_the_user_to_the_primary(self):
+        response = self.client.post('/api/cart/menu-items', {
+            'menuitem_id': self.order.orderitem_set.get().menuitem_id,
+            'quantity': 1
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(routers.is_pinned(self.customer))
+        response = self.client.get('/api/orders')
+        self.assertEqual([order['id'] for order in response.data['results']],
+                         [self.order.id])
+        # other users still read from the replica
+        self.client.force_authenticate(self.manager)
+        self.assertEqual(self.client.get('/api/orders').data['results'], [])
+
+    def test_failed_writes_do_not_pin(self):
+        response = self.client.post('/api/cart/menu-items', {
+            'menuitem_id': 0,
+            'quantity': 1
+        })
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(routers.is_pinned(self.customer))
+
+    def test_detail_views_read_from_the_primary(self):
+        response = self.client.get(f'/api/orders/{self.order.id}')
+        self.assertEqual(response.status_code, 200)
+
+    async def test_pinning_runs_natively_under_asgi(self):
+
+        async def get_response(request):
+            return HttpResponse(status=201)
+
+        middleware = routers.ReplicaPinningMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = AsyncRequestFactory().post('/api/cart/menu-items')
+        request.user = self.customer
+        await middleware(request)
+        self.assertTrue(await sync_to_async(routers.is_pinned)(self.customer))
+
+    def test_middleware_does_not_force_async_views_onto_a_thread(self):
+        for path in settings.MIDDLEWARE:
+            self.assertTrue(import_string(path).async_capable, path)
+
+
+class QueryBudgetTests(LittleLemonTestCase):
+
+    def test_endpoints_stay_within_query_budget(self):
+        data = benchmark.seed(menu_items=20,
+                              orders=60,
+                              order_items=180,
+                              customers=3,
+                              crew=2,
+                              batch_size=50)
+        report = benchmark.run(data, repeat=2)
+        self.assertEqual(
+            [(entry['name'], entry['queries'], entry['budget'])
+             for entry in report if entry['over_budget']], [])
+        self.assertEqual([
+            entry['name'] for entry in report
+            if any(status >= 400 for status in entry['status'])
+        ], [])
+        covered = {
+            resolve(entry['path'].split('?')[0]).route.removeprefix('api/')
+            for entry in report
+        }
+        routes = {str(pattern.pattern) for pattern in urls.urlpatterns}
+        # an event stream never ends, so it can't be timed per request
+        self.assertEqual(routes - covered, {'async/orders/<int:pk>/events'})
@@ -0,0 +1,151 @@
+import random
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework import throttling
+
+
+class CacheThrottleStore:
+    '''
+    Keeps throttle counters in a Django cache. Point `alias` at a shared
+    backend (Redis, Memcached) so every worker sees the same counters; the
+    default local-memory cache is only shared within one process.
+    '''
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def incr(self, key, ttl):
+        if self.cache.add(key, 1, ttl):
+            return 1
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # expired between add() and incr()
+            self.cache.add(key, 1, ttl)
+            return 1
+
+    def get(self, key):
+        return self.cache.get(key, 0)
+
+
+class SQLiteThrottleStore:
+    '''
+    Keeps throttle counters in a SQLite file outside the main database, so
+    all workers on one host share them without Redis. Each counter update
+    is a single upsert statement.
+    '''
+    purge_probability = 0.01
+
+    def __init__(self, path, timeout=5):
+        self.path = str(path)
+        self.timeout = timeout
+        self.local = threading.local()
+
+    @property
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path,
+                                         timeout=self.timeout,
+                                         isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS throttle ('
+                               'key TEXT PRIMARY KEY, '
+                               'count INTEGER NOT NULL, '
+                               'expires REAL NOT NULL)')
+            self.local.connection = connection
+        return connection
+
+    def incr(self, key, ttl):
+        now = time.time()
+        if random.random() < self.purge_probability:
+            self.connection.execute('DELETE FROM throttle WHERE expires < ?',
+                                    (now, ))
+        return self.connection.execute(
+            'INSERT INTO throttle (key, count, expires) VALUES (?, 1, ?) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            'count = CASE WHEN expires < ? THEN 1 ELSE count + 1 END, '
+            'expires = CASE WHEN expires < ? THEN excluded.expires '
+            'ELSE expires END '
+            'RETURNING count', (key, now + ttl, now, now)).fetchone()[0]
+
+    def get(self, key):
+        row = self.connection.execute(
+            'SELECT count FROM throttle WHERE key = ? AND expires >= ?',
+            (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+
+@lru_cache(maxsize=None)
+def get_store():
+    config = getattr(settings, 'LITTLELEMON_THROTTLE_STORE', {})
+    backend = import_string(
+        config.get('BACKEND', 'LittleLemonAPI.throttling.CacheThrottleStore'))
+    return backend(**config.get('OPTIONS', {}))
+
+
+@receiver(setting_changed)
+def reset_store(setting, **kwargs):
+    if setting == 'LITTLELEMON_THROTTLE_STORE':
+        get_store.cache_clear()
+
+
+class SlidingWindowRateThrottle(throttling.SimpleRateThrottle):
+    '''
+    Sliding-window counter throttle. Instead of rewriting a list of request
+    timestamps, each request increments the counter of the current fixed
+    window and the previous window's counter is weighted by how much of it
+    still overlaps the sliding window: two O(1) store operations per
+    request. Rejected requests are counted too, so a client has to back off
+    to get through again.
+    '''
+    cache_format = 'littlelemon:throttle:%(scope)s:%(ident)s'
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        now = self.timer()
+        window = now // self.duration
+        self.elapsed = now / self.duration - window
+        store = get_store()
+        current = store.incr(f'{self.key}:{int(window)}', 2 * self.duration)
+        previous = store.get(f'{self.key}:{int(window) - 1}')
+        self.estimate = previous * (1 - self.elapsed) + current
+        self.previous = previous
+        return self.estimate <= self.num_requests
+
+    def wait(self):
+        remaining = (1 - self.elapsed) * self.duration
+        if self.previous:
+            # time until the previous window's weight has dropped enough
+            excess = self.estimate - self.num_requests
+            return min(remaining, excess / self.previous * self.duration)
+        return remaining
+
+
+class AnonRateThrottle(throttling.AnonRateThrottle, SlidingWindowRateThrottle):
+    pass
+
+
+class UserRateThrottle(throttling.UserRateThrottle, SlidingWindowRateThrottle):
+    pass
+
+
+class ScopedRateThrottle(throttling.ScopedRateThrottle,
+                         SlidingWindowRateThrottle):
+    '''
+    Rate taken from DEFAULT_THROTTLE_RATES[view.throttle_scope], keyed per
+    user (or per IP for anonymous requests).
+    '''
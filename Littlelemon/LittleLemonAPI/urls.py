@@ -1,4 +1,4 @@
-from . import views
+from . import async_views, views
 from django.urls import path
 
 app_name = 'LittleLemonAPI'
@@ -7,13 +7,30 @@ urlpatterns = [
     # Menu-items endpoints
     path('menu-items', views.MenuItemsListView.as_view()),
     path('menu-items/<int:pk>', views.MenuItemsDetailView.as_view()),
+    path('menu-items/bulk', views.MenuItemsBulkView.as_view()),
     # User group management endpoints
     path('groups/<str:group_name>/users', views.GroupMemberListView.as_view()),
     path('groups/<str:group_name>/users/<int:pk>',
          views.GroupMemberDeleteView.as_view()),
     # Cart management endpoints
     path('cart/menu-items', views.CartManageView.as_view()),
+    path('cart/summary', views.CartSummaryView.as_view()),
     # Order management endpoints
     path('orders', views.OrderListCreateView.as_view()),
-    path('orders/<int:pk>', views.OrderDetailView.as_view())
+    path('orders/export', views.OrderExportView.as_view()),
+    path('orders/dispatch', views.OrderDispatchView.as_view()),
+    path('orders/queue', views.DeliveryQueueView.as_view()),
+    # Sales analytics endpoint
+    path('analytics', views.SalesAnalyticsView.as_view()),
+    # Request profiling stats (admin)
+    path('profiling', views.ProfilingStatsView.as_view()),
+    path('orders/<int:pk>', views.OrderDetailView.as_view()),
+    # Async (ASGI) read-only endpoints
+    path('async/menu-items', async_views.MenuItemsListView.as_view()),
+    path('async/menu-items/<int:pk>', async_views.MenuItemsDetailView.as_view()),
+    path('async/cart/menu-items', async_views.CartListView.as_view()),
+    path('async/orders', async_views.OrderListView.as_view()),
+    path('async/orders/<int:pk>', async_views.OrderDetailView.as_view()),
+    path('async/orders/<int:pk>/events',
+         async_views.OrderEventsView.as_view())
 ]
\ No newline at end of file
@@ -0,0 +1,68 @@
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+
+
+def batched(iterable, size):
+    '''
+    Yields lists of up to `size` items from any iterable without reading
+    more of it than the current batch.
+    '''
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class LRUCache:
+    '''
+    Small thread-safe in-process LRU mapping with a per-entry TTL.
+    '''
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self._set(key, value)
+
+    def add(self, key, value):
+        '''
+        Sets the key unless it holds an unexpired value; returns whether it
+        was set.
+        '''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                return False
+            self._set(key, value)
+            return True
+
+    def _set(self, key, value):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
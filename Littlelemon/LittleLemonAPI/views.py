@@ -1,36 +1,69 @@
+import csv
+import io
+import json
+from decimal import Decimal
+
 from django.contrib.auth.models import Group, User
-from django.http import HttpResponseForbidden, HttpResponseBadRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Sum, Value
+from django.db.models.functions import Coalesce
+from django.http import (HttpResponseBadRequest, HttpResponseForbidden,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404, render
 from rest_framework import generics, status
-from rest_framework.exceptions import NotFound, PermissionDenied
+from rest_framework.exceptions import (NotFound, PermissionDenied,
+                                       ValidationError)
 from rest_framework.permissions import (BasePermission, IsAdminUser,
                                         IsAuthenticated)
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
 
-from . import models, serializers
+from . import (analytics, dispatch, events, menu_import, menu_snapshot,
+               models, profiling, roles, serializers, tasks)
+from .caching import MenuResponseCacheMixin
+from .fastpath import (ArchivedOrderListSerializer, FastListMixin,
+                       MenuItemListSerializer, OrderListSerializer)
+from .filters import MenuItemFilter, OrderFilter, parse_bool, parse_date
+from .idempotency import IdempotencyMixin
+from .pagination import KeysetPagination, KeysetPaginationMixin
+from .renderers import CSVRenderer, NDJSONRenderer
+from .routers import ReplicaReadMixin
+from .throttling import ScopedRateThrottle, UserRateThrottle
 from rest_framework.response import Response
 # Create your views here.
-group_mapping = {'manager': 'Manager', 'delivery-crew': 'Delivery crew'}
+group_mapping = {'manager': roles.MANAGER, 'delivery-crew': roles.DELIVERY_CREW}
+
+
+def order_queryset():
+    '''
+    Orders with everything OrderSerializer reads loaded up front, so
+    serializing a page costs the same number of queries for 5 or 500 orders.
+    '''
+    return models.Order.objects.select_related(
+        'user', 'delivery_crew').prefetch_related('orderitem_set')
 
 
 class isManagerOrAdmin(BasePermission):
 
     def has_permission(self, request, view):
         if request.user:
-            return request.user.groups.filter(
-                name='Manager') or request.user.is_staff
+            return roles.is_manager(request.user) or request.user.is_staff
         return False
 
+class isDeliveryCrew(BasePermission):
+
+    def has_permission(self, request, view):
+        return roles.is_delivery_crew(request.user)
+
+
 class canPatchOrderDetail(BasePermission):
     def has_permission(self, request, view):
         if request.user:
-            return request.user.groups.filter(
-                name='Delivery crew') or request.user.groups.filter(
-                name='Manager') or request.user.is_staff
+            return roles.is_delivery_crew(request.user) or roles.is_manager(
+                request.user) or request.user.is_staff
         return False
 
 
-class CategoryView(generics.ListCreateAPIView):
+class CategoryView(ReplicaReadMixin, generics.ListCreateAPIView):
     '''
     endpoint: /api/category
     GET, POST for manager/admin. List/Create categories.
@@ -40,34 +73,27 @@ class CategoryView(generics.ListCreateAPIView):
     permission_classes = [isManagerOrAdmin]
 
 
-class MenuItemsListView(generics.ListCreateAPIView):
+class MenuItemsListView(ReplicaReadMixin, IdempotencyMixin,
+                        MenuResponseCacheMixin, FastListMixin,
+                        KeysetPaginationMixin, generics.ListCreateAPIView):
     '''
     endpoint: /api/menu-items/{menuItem}
     GET for all users. List allsingle menu items.
     POST for manager/admin. Create new menu item.
+    ?pagination=cursor switches to keyset pagination, see pagination.py.
     '''
+    list_filter_class = MenuItemFilter
+    fast_serializer_class = MenuItemListSerializer
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'menu'
 
     def get_serializer_class(self):
         return serializers.MenuItemSerializer
 
     def get_queryset(self):
         items=models.MenuItem.objects.all()
-        # filters
-        category_name=self.request.query_params.get('category')
-        to_price=self.request.query_params.get('to_price')
-        from_price=self.request.query_params.get('from_price')
-        if category_name:
-            items=items.filter(category__title=category_name)
-        if to_price:
-            items=items.filter(price__lte=to_price)
-        if from_price:
-            items=items.filter(price__gte=from_price)
-        # ordering
-        ordering=self.request.query_params.get('ordering')
-        if ordering:
-            ordering_fields=ordering.split(",")
-            items = items.order_by(*ordering_fields)
-        return items
+        # whitelisted filters and ordering, see filters.py
+        return self.list_filter_class(self.request).apply(items)
 
     def get_permissions(self):
         if self.request.method == 'GET':
@@ -75,12 +101,15 @@ class MenuItemsListView(generics.ListCreateAPIView):
         return [isManagerOrAdmin()]
 
 
-class MenuItemsDetailView(generics.RetrieveUpdateDestroyAPIView):
+class MenuItemsDetailView(MenuResponseCacheMixin,
+                          generics.RetrieveUpdateDestroyAPIView):
     '''
     endpoint: /api/menu-items/{menuItem}
     GET for all users. Lists single menu item
     PUT, PATCH, DELETE for manager/admin. Updates/Deletes single menu item.
     '''
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'menu'
 
     def get_serializer_class(self):
         return serializers.MenuItemSerializer
@@ -88,13 +117,49 @@ class MenuItemsDetailView(generics.RetrieveUpdateDestroyAPIView):
     def get_queryset(self):
         return models.MenuItem.objects.all()
 
+    def get_object(self):
+        if self.request.method != 'GET':
+            return super().get_object()
+        # served from the menu snapshot, see menu_snapshot.py
+        snapshot = menu_snapshot.get_snapshot()
+        menuitem = (snapshot.menuitems.get(self.kwargs['pk'])
+                    if snapshot is not None else None)
+        if menuitem is None:
+            return super().get_object()
+        return menuitem
+
     def get_permissions(self):
         if self.request.method == 'GET':
             return []
         return [isManagerOrAdmin()]
 
 
-class GroupMemberListView(generics.ListCreateAPIView):
+class MenuItemsBulkView(generics.GenericAPIView):
+    '''
+    endpoint: /api/menu-items/bulk
+    POST for manager/admin. Upserts menu items matched by title from a JSON
+    list or an uploaded CSV file (multipart field "file") with the columns
+    title, price, featured and category (slug) or category_id. Returns the
+    number of created/updated items and the errors per row.
+    '''
+
+    def post(self, request, *args, **kwargs):
+        if isinstance(request.data, list):
+            rows = request.data
+        elif 'file' in request.FILES:
+            rows = menu_import.csv_rows(
+                io.TextIOWrapper(request.FILES['file'], encoding='utf-8'))
+        else:
+            raise ValidationError(
+                'Expected a JSON list or a CSV upload in "file".')
+        result = menu_import.import_menu(rows)
+        return Response(result)
+
+    def get_permissions(self):
+        return [isManagerOrAdmin()]
+
+
+class GroupMemberListView(ReplicaReadMixin, generics.ListCreateAPIView):
 
     def get_serializer_class(self):
         return serializers.UserSerializers
@@ -104,7 +169,7 @@ class GroupMemberListView(generics.ListCreateAPIView):
         if group_name not in group_mapping:
             raise NotFound
         group = get_object_or_404(Group, name=group_mapping[group_name])
-        return group.user_set.all()
+        return group.user_set.prefetch_related('groups')
 
     def create(self, request, *args, **kwargs):
         group_name = self.kwargs['group_name']
@@ -114,8 +179,9 @@ class GroupMemberListView(generics.ListCreateAPIView):
         res = super().create(request, *args, **kwargs)
         if res.status_code != status.HTTP_201_CREATED:
             return res
-        group.user_set.add(
-            get_object_or_404(User, username=res.data['username']))
+        user = get_object_or_404(User, username=res.data['username'])
+        group.user_set.add(user)
+        roles.invalidate(user)
         return res
 
     def get_permissions(self):
@@ -142,6 +208,7 @@ class GroupMemberDeleteView(generics.DestroyAPIView):
         res = super().delete(request, *args, **kwargs)
         if res.status_code != status.HTTP_204_NO_CONTENT:
             return res
+        roles.invalidate(self.kwargs['pk'])
         res.status_code = status.HTTP_200_OK
         return res
 
@@ -149,7 +216,8 @@ class GroupMemberDeleteView(generics.DestroyAPIView):
         return [isManagerOrAdmin()]
 
 
-class CartManageView(generics.ListCreateAPIView, generics.DestroyAPIView):
+class CartManageView(IdempotencyMixin, generics.ListCreateAPIView,
+                     generics.DestroyAPIView):
     '''
     endpoint: /api/cart/menu-items
     GET, POST, DELETE for authenticated users
@@ -166,74 +234,120 @@ class CartManageView(generics.ListCreateAPIView, generics.DestroyAPIView):
         '''
         Deletes all menu items created by the current user
         '''
-        cart_items = self.get_queryset()
-        for instance in cart_items:
-            self.perform_destroy(instance)
+        self.get_queryset().delete()
         return Response(status=status.HTTP_200_OK)
 
     def get_permissions(self):
         return [IsAuthenticated()]
 
 
-class OrderListCreateView(generics.ListCreateAPIView):
+class CartSummaryView(generics.GenericAPIView):
+    '''
+    endpoint: /api/cart/summary
+    GET for authenticated users. Item count and total of the current cart,
+    computed in a single aggregate query.
+    '''
+
+    def get_serializer_class(self):
+        return serializers.CartSummarySerializer
+
+    def get(self, request, *args, **kwargs):
+        summary = models.Cart.objects.filter(user_id=request.user.id).aggregate(
+            item_count=Coalesce(Sum('quantity'), 0),
+            total=Coalesce(Sum('price'), Value(Decimal(0))))
+        return Response(self.get_serializer(summary).data)
+
+    def get_permissions(self):
+        return [IsAuthenticated()]
+
+
+class OrderListCreateView(ReplicaReadMixin, IdempotencyMixin, FastListMixin,
+                          KeysetPaginationMixin, generics.ListCreateAPIView):
+    list_filter_class = OrderFilter
+    fast_serializer_class = OrderListSerializer
 
     def get_serializer_class(self):
         return serializers.OrderSerializer
     
     def get_throttles(self):
+        if self.request.method == 'POST':
+            self.throttle_scope = 'checkout'
+            return [ScopedRateThrottle()]
         return [UserRateThrottle()]
 
     def get_queryset(self):
+        # whitelisted filters and ordering, see filters.py
+        return self.list_filter_class(self.request).apply(
+            self.visible_orders(order_queryset()))
+
+    def visible_orders(self, items):
         user=self.request.user
-        user_groups = user.groups
-        items=models.Order.objects.all()
         # filter by user
-        if user_groups.filter(name='Manager').exists():
-            pass
-        elif user_groups.filter(name='Delivery crew').exists():
-            items=models.Order.objects.filter(delivery_crew=user.id)
-        else:
-            items=models.Order.objects.filter(user=user)
-        # filters
-        status=self.request.query_params.get('status')
-        order_user=self.request.query_params.get('user')
-        if status:
-            items=items.filter(status=status)
-        if order_user:
-            items=items.filter(user=order_user)
-        # ordering
-        ordering=self.request.query_params.get('ordering')
-        if ordering:
-            ordering_fields=ordering.split(",")
-            items = items.order_by(*ordering_fields)
-        return items
+        if roles.is_manager(user):
+            return items
+        elif roles.is_delivery_crew(user):
+            return items.filter(delivery_crew=user.id)
+        return items.filter(user=user)
+
+    def list(self, request, *args, **kwargs):
+        try:
+            include_archived = parse_bool(
+                request.query_params.get('include_archived', '0'))
+        except ValueError:
+            raise ValidationError({'include_archived': 'Expected 0 or 1.'})
+        if not include_archived:
+            return super().list(request, *args, **kwargs)
+        if KeysetPagination.is_requested(request):
+            raise ValidationError({
+                'include_archived':
+                'Not available with cursor pagination.'
+            })
+        # both tables filtered alike, then one UNION ALL sorted and sliced
+        # by the database
+        list_filter = self.list_filter_class(request)
+        serializer = ArchivedOrderListSerializer()
+        live, archived = [
+            serializer.rows(
+                list_filter.filter(self.visible_orders(model.objects.all())))
+            for model in (models.Order, models.ArchivedOrder)
+        ]
+        queryset = live.union(archived, all=True).order_by(
+            *list_filter.get_ordering())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.data(page))
+        return Response(serializer.data(queryset))
 
     def create(self, request, *args, **kwargs):
         user = request.user
-        request.data['user'] = user.id
-        request.data['total'] = 0
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        order = serializer.save()
-        cart_items = models.Cart.objects.filter(user_id=user.id)
-        if not cart_items:
-            return Response(status=status.HTTP_404_NOT_FOUND)
-        total_price = 0
-        for cart_item in cart_items:
-            total_price += cart_item.price
-            order_item = models.OrderItem(order=order,
-                                          menuitem=cart_item.menuitem,
-                                          quantity=cart_item.quantity,
-                                          unit_price=cart_item.unit_price,
-                                          price=cart_item.price)
-            order_item.save()
-            cart_item.delete()
-        serializer = self.get_serializer(order,
-                                         data={'total': total_price},
-                                         partial=True)
-
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            # lock the cart rows so a concurrent add can't slip in mid-checkout
+            cart_rows = list(
+                models.Cart.objects.select_for_update().filter(
+                    user_id=user.id).values_list('id', 'menuitem_id',
+                                                 'quantity', 'unit_price',
+                                                 'price'))
+            if not cart_rows:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            cart_items = models.Cart.objects.filter(
+                pk__in=[row[0] for row in cart_rows])
+            total_price = cart_items.aggregate(total=Sum('price'))['total']
+            order = models.Order.objects.create(user=user, total=total_price)
+            orderitems = models.OrderItem.objects.bulk_create([
+                models.OrderItem(order=order,
+                                 menuitem_id=menuitem_id,
+                                 quantity=quantity,
+                                 unit_price=unit_price,
+                                 price=price)
+                for _, menuitem_id, quantity, unit_price, price in cart_rows
+            ])
+            cart_items.delete()
+            # rollups, receipt, kitchen ticket and crew notification run
+            # in the background once the order commits, see tasks.py
+            tasks.order_placed(order)
+        # serialize the items just created instead of reading them back
+        order._prefetched_objects_cache = {'orderitem_set': orderitems}
+        serializer = self.get_serializer(order)
         return Response(serializer.data,
                         status=status.HTTP_201_CREATED,
                         headers=self.get_success_headers(serializer.data))
@@ -242,17 +356,188 @@ class OrderListCreateView(generics.ListCreateAPIView):
         return [IsAuthenticated()]
 
 
+class OrderExportView(generics.GenericAPIView):
+    '''
+    endpoint: /api/orders/export
+    GET for manager/admin. Streams every order with its order items as
+    NDJSON (default, one order per line) or CSV (?format=csv, one row per
+    order item). Accepts the same status/user/delivery_crew/from_date/
+    to_date filters as /api/orders. Rows are read in chunks of
+    export_chunk_size with the order items prefetched per chunk, so memory
+    use does not grow with the size of the export.
+    '''
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+    list_filter_class = OrderFilter
+    export_chunk_size = 2000
+    csv_header = [
+        'order_id', 'user_id', 'delivery_crew_id', 'status', 'total', 'date',
+        'menuitem_id', 'quantity', 'unit_price', 'price'
+    ]
+
+    def get_queryset(self):
+        items = models.Order.objects.prefetch_related('orderitem_set')
+        return self.list_filter_class(self.request).apply(items)
+
+    def get(self, request, *args, **kwargs):
+        orders = self.get_queryset().iterator(
+            chunk_size=self.export_chunk_size)
+        renderer = request.accepted_renderer
+        if renderer.format == 'csv':
+            rows = self.csv_rows(orders)
+        else:
+            rows = self.ndjson_rows(orders)
+        response = StreamingHttpResponse(
+            rows, content_type=f'{renderer.media_type}; charset=utf-8')
+        response['Content-Disposition'] = (
+            f'attachment; filename="orders.{renderer.format}"')
+        return response
+
+    def ndjson_rows(self, orders):
+        for order in orders:
+            yield json.dumps(serializers.OrderSerializer(order).data,
+                             cls=DjangoJSONEncoder) + '\n'
+
+    def csv_rows(self, orders):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def flush():
+            line = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return line
+
+        writer.writerow(self.csv_header)
+        yield flush()
+        for order in orders:
+            head = [
+                order.id, order.user_id, order.delivery_crew_id,
+                int(order.status), order.total, order.date
+            ]
+            orderitems = order.orderitem_set.all()
+            if not orderitems:
+                writer.writerow(head + [''] * 4)
+            for item in orderitems:
+                writer.writerow(head + [
+                    item.menuitem_id, item.quantity, item.unit_price,
+                    item.price
+                ])
+            yield flush()
+
+    def get_permissions(self):
+        return [isManagerOrAdmin()]
+
+
+class SalesAnalyticsView(generics.GenericAPIView):
+    '''
+    endpoint: /api/analytics
+    GET for manager/admin. Revenue per day, average basket, top-selling menu
+    items and delivery crew workload, optionally limited with from_date/
+    to_date. Reads the DailySales rollups instead of scanning OrderItem.
+    '''
+
+    def get_serializer_class(self):
+        return serializers.SalesSummarySerializer
+
+    def get(self, request, *args, **kwargs):
+        dates = {}
+        for param in ('from_date', 'to_date'):
+            value = request.query_params.get(param)
+            if value:
+                try:
+                    dates[param] = parse_date(value)
+                except ValueError:
+                    raise ValidationError({param: f'Invalid value "{value}".'})
+        summary = analytics.sales_summary(**dates)
+        return Response(self.get_serializer(summary).data)
+
+    def get_permissions(self):
+        return [isManagerOrAdmin()]
+
+
+class OrderDispatchView(generics.GenericAPIView):
+    '''
+    endpoint: /api/orders/dispatch
+    POST for manager/admin. Assigns the given orders, or all unassigned
+    ones, to delivery crew in one transaction, balancing by open orders
+    (strategy `least_loaded`, default) or in turn (`round_robin`).
+    '''
+
+    def get_serializer_class(self):
+        return serializers.OrderDispatchSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            assignments = dispatch.assign_orders(
+                order_ids=data.get('orders'),
+                crew_ids=data.get('delivery_crew'),
+                strategy=data['strategy'])
+        except ValueError as exc:
+            raise ValidationError({'delivery_crew': str(exc)})
+        assigned = serializers.OrderAssignmentSerializer(
+            [{
+                'id': order_id,
+                'delivery_crew': crew_id
+            } for order_id, crew_id in assignments.items()],
+            many=True)
+        return Response({'assigned': assigned.data})
+
+    def get_permissions(self):
+        return [isManagerOrAdmin()]
+
+
+class DeliveryQueueView(FastListMixin, generics.ListAPIView):
+    '''
+    endpoint: /api/orders/queue
+    GET for delivery crew. The crew member's open orders, oldest first;
+    served by order_status_crew_date_idx.
+    '''
+    fast_serializer_class = OrderListSerializer
+
+    def get_serializer_class(self):
+        return serializers.OrderSerializer
+
+    def get_queryset(self):
+        return order_queryset().filter(delivery_crew=self.request.user.id,
+                                       status=False).order_by('date', 'id')
+
+    def get_permissions(self):
+        return [isDeliveryCrew()]
+
+
+class ProfilingStatsView(generics.GenericAPIView):
+    '''
+    endpoint: /api/profiling
+    GET, DELETE for admin. Per-view timings and query counts of the requests
+    sampled by profiling.ProfilingMiddleware in this process; DELETE resets
+    the window.
+    '''
+
+    def get(self, request, *args, **kwargs):
+        return Response(profiling.store.stats())
+
+    def delete(self, request, *args, **kwargs):
+        profiling.store.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def get_permissions(self):
+        return [IsAdminUser()]
+
+
 class OrderDetailView(generics.RetrieveUpdateDestroyAPIView):
 
     def get_serializer_class(self):
         return serializers.OrderSerializer
 
     def get_queryset(self):
-        return models.Order.objects.all()
+        return order_queryset()
 
     def get_object(self):
         # Manager can access to all order
-        if self.request.user.groups.filter(name='Manager').exists():
+        if roles.is_manager(self.request.user):
             return super().get_object()
         order = super().get_object()
         # Customer or Delivery crew can only access to the related order
@@ -262,27 +547,33 @@ class OrderDetailView(generics.RetrieveUpdateDestroyAPIView):
             raise PermissionDenied
 
     def delete(self, request, *args, **kwargs):
-        orderitems = models.OrderItem.objects.filter(
-            order_id=self.get_object().id)
-        for orderitem in orderitems:
-            orderitem.delete()
-        return super().delete(request, *args, **kwargs)
-    
+        order = self.get_object()
+        # one DELETE for the items, however many the order has
+        models.OrderItem.objects.filter(order_id=order.id).delete()
+        self.perform_destroy(order)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     def patch(self, request, *args, **kwargs):
         if 'delivery_crew_id' in request.data.keys():
-            if self.request.user.groups.filter(name='Manager').exists():
+            if roles.is_manager(self.request.user):
                 delivery_crew_id = request.data.get('delivery_crew_id')
-                print(User.objects.get(pk=delivery_crew_id))
-                if not User.objects.get(pk=delivery_crew_id).groups.filter(name='Delivery crew').exists():
+                # one query instead of loading the user and then its groups
+                if not str(delivery_crew_id).isdigit() or not (
+                        dispatch.crew_members().filter(
+                            pk=delivery_crew_id).exists()):
                     return HttpResponseBadRequest()
             else:
                 return HttpResponseForbidden()
         return super().patch(request, *args, **kwargs)
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        # pushed to /api/async/orders/{orderId}/events listeners
+        events.publish_order(serializer.instance)
+
     def get_permissions(self):
         if self.request.method == 'GET':
             return [IsAuthenticated()]
         elif self.request.method=='PATCH':
-            print('patch')
             return [canPatchOrderDetail()]
         return [isManagerOrAdmin()]
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -51,6 +52,8 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "LittleLemonAPI.profiling.ProfilingMiddleware",
+    "LittleLemonAPI.routers.ReplicaPinningMiddleware",
 ]
 
 ROOT_URLCONF = "Littlelemon.urls"
@@ -77,11 +80,69 @@ WSGI_APPLICATION = "Littlelemon.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# SQLite by default. Set LITTLELEMON_DB_ENGINE=postgresql to use PostgreSQL
+# with the POSTGRES_* variables below; LITTLELEMON_DB_POOL=1 switches from
+# persistent connections to psycopg's connection pool (psycopg[pool]).
+# Connections are kept open for LITTLELEMON_DB_CONN_MAX_AGE seconds and
+# checked before reuse.
+if os.environ.get("LITTLELEMON_DB_ENGINE") == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("POSTGRES_DB", "littlelemon"),
+            "USER": os.environ.get("POSTGRES_USER", "littlelemon"),
+            "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+            "HOST": os.environ.get("POSTGRES_HOST", "localhost"),
+            "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+            "CONN_MAX_AGE": int(os.environ.get("LITTLELEMON_DB_CONN_MAX_AGE", 60)),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {},
+        }
+    }
+    if os.environ.get("LITTLELEMON_DB_POOL"):
+        # the pool keeps connections open itself; CONN_MAX_AGE must be 0
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": int(os.environ.get("LITTLELEMON_DB_POOL_MIN", 2)),
+            "max_size": int(os.environ.get("LITTLELEMON_DB_POOL_MAX", 10)),
+        }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+            "CONN_MAX_AGE": int(os.environ.get("LITTLELEMON_DB_CONN_MAX_AGE", 60)),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {
+                # take the write lock at BEGIN so concurrent writers wait on
+                # the busy timeout instead of failing to upgrade a read lock
+                "transaction_mode": "IMMEDIATE",
+                "timeout": 20,
+            },
+        }
     }
+
+# Read replica: a SQLite file or a PostgreSQL host in LITTLELEMON_DB_REPLICA.
+# When it is set, the list endpoints read from it (LittleLemonAPI/routers.py)
+# and users who just wrote something are pinned to the primary for
+# LITTLELEMON_REPLICA_PIN_SECONDS. Without it the alias is the primary itself.
+LITTLELEMON_DB_REPLICA = os.environ.get("LITTLELEMON_DB_REPLICA")
+DATABASES["replica"] = dict(DATABASES["default"],
+                            OPTIONS=dict(DATABASES["default"]["OPTIONS"]))
+if LITTLELEMON_DB_REPLICA and DATABASES["default"]["ENGINE"].endswith("sqlite3"):
+    DATABASES["replica"]["NAME"] = LITTLELEMON_DB_REPLICA
+elif LITTLELEMON_DB_REPLICA:
+    DATABASES["replica"]["HOST"] = LITTLELEMON_DB_REPLICA
+DATABASE_ROUTERS = ["LittleLemonAPI.routers.ReplicaRouter"]
+LITTLELEMON_READ_REPLICA = "replica" if LITTLELEMON_DB_REPLICA else None
+LITTLELEMON_REPLICA_PIN_SECONDS = 5
+
+# Applied to every new SQLite connection by LittleLemonAPI/db.py.
+LITTLELEMON_SQLITE_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "busy_timeout": 20000,
+    "mmap_size": 256 * 1024 * 1024,
 }
 
 
@@ -122,20 +183,107 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'LittleLemonAPI.authentication.CachingTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication'
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 5,
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'],
+        'LittleLemonAPI.throttling.AnonRateThrottle',
+        'LittleLemonAPI.throttling.UserRateThrottle'],
     'DEFAULT_THROTTLE_RATES':{
         'anon':'2/minute',
-        'user':'5/minute'
+        'user':'5/minute',
+        # per-endpoint scopes, see throttle_scope on the views
+        'menu':'60/minute',
+        'checkout':'3/minute'
     }
 }
 
+# Where the throttles keep their counters. CacheThrottleStore uses a Django
+# cache alias (shared once CACHES points at Redis/Memcached); for a single
+# host without Redis use the SQLite file store:
+#   'BACKEND': 'LittleLemonAPI.throttling.SQLiteThrottleStore',
+#   'OPTIONS': {'path': BASE_DIR / 'throttle.sqlite3'},
+LITTLELEMON_THROTTLE_STORE = {
+    'BACKEND': 'LittleLemonAPI.throttling.CacheThrottleStore',
+    'OPTIONS': {'alias': 'default'},
+}
+
+# Where POST responses are kept for replaying retries that carry an
+# Idempotency-Key header. The local store is bounded and per process; with
+# several workers use the cache store on a shared cache:
+#   'BACKEND': 'LittleLemonAPI.idempotency.CacheIdempotencyStore',
+#   'OPTIONS': {'alias': 'default', 'timeout': 600},
+LITTLELEMON_IDEMPOTENCY_STORE = {
+    'BACKEND': 'LittleLemonAPI.idempotency.LocalIdempotencyStore',
+    'OPTIONS': {'max_entries': 10000, 'timeout': 600},
+}
+
+# Pub/sub behind the order event streams (/api/async/orders/{id}/events)
+# and the kitchen/delivery-crew channels the background jobs publish on.
+# The in-memory broker only reaches listeners in the same process, so jobs
+# run by a separate run_worker process need a shared broker to be heard.
+LITTLELEMON_EVENT_BROKER = {
+    'BACKEND': 'LittleLemonAPI.events.InMemoryBroker',
+    'OPTIONS': {'max_queue': 100},
+}
+LITTLELEMON_SSE_HEARTBEAT = 15
+
+# Receipts are mailed by the send_receipt job (LittleLemonAPI/tasks.py, run
+# by `manage.py run_worker`). The console backend prints them; set
+# LITTLELEMON_EMAIL_BACKEND=django.core.mail.backends.smtp.EmailBackend and
+# the EMAIL_* settings to send them.
+EMAIL_BACKEND = os.environ.get(
+    "LITTLELEMON_EMAIL_BACKEND", "django.core.mail.backends.console.EmailBackend"
+)
+DEFAULT_FROM_EMAIL = "Little Lemon <orders@littlelemon.example>"
+
+# Request profiling (Server-Timing headers and /api/profiling). Set
+# SAMPLE_RATE between 0 (off) and 1 (every request); WINDOW is the number of
+# sampled requests kept per process.
+LITTLELEMON_PROFILING = {
+    'SAMPLE_RATE': 0,
+    'WINDOW': 1000,
+}
+
 DJOSER = {
     "USER_ID_FIELD": "username"
 }
+
+# Seconds a user's group names are cached across requests (0 disables it)
+LITTLELEMON_ROLE_CACHE_TIMEOUT = 30
+
+# Menu responses are cached per generation, see LittleLemonAPI/caching.py.
+# Point 'default' at a shared backend (e.g. Redis) when running several
+# workers so they agree on the generation counter.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# Seconds the menu GET responses stay cached (LittleLemonAPI/caching.py).
+# Menu changes bump a generation counter kept in the default cache; with a
+# per-process cache the other workers never see the bump and would serve
+# the old menu until the entry expires. None picks an hour for a shared
+# cache and 0, which turns the response cache off, for a per-process one.
+LITTLELEMON_MENU_CACHE_TIMEOUT = None
+
+# Cart adds and menu item reads use an in-process copy of the menu (see
+# LittleLemonAPI/menu_snapshot.py), reloaded when the menu generation changes
+# and at least this often, in seconds. The generation lives in the default
+# cache: with a per-process cache (LocMemCache) a price changed through one
+# worker goes unseen by the others for up to this long, and carts there get
+# the old price. None picks 60 for a shared cache (Redis/Memcached) and 0,
+# which turns the copy off and reads the database, for a per-process one.
+# Set a number to accept that delay, e.g. with a single worker process.
+LITTLELEMON_MENU_SNAPSHOT_MAX_AGE = None
+
+# Token -> user/groups cache of CachingTokenAuthentication. SHARED_ALIAS
+# names a cache alias to layer under the in-process LRU (None disables it).
+LITTLELEMON_TOKEN_CACHE = {
+    'TIMEOUT': 30,
+    'MAXSIZE': 10000,
+    'SHARED_ALIAS': None,
+}